@@ -0,0 +1,111 @@
+"""
+Hot-path latency vs. merged-history size, before and after archiving.
+
+Seeds a reviewer with N old merged PRs for each history size, measures
+/users/getReview and the open-review scan of bulk deactivation, then runs
+the archiver and measures again. Run against a throwaway database:
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.archive_hot_path
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, func, and_
+from models.models import *
+from models.database import engine, admin_engine, async_session_maker, init_db
+from services import users as user_service
+from services.archive import archiver
+import asyncio
+import statistics
+import time
+
+
+HISTORY_SIZES = (0, 1_000, 5_000, 20_000)
+OPEN_PRS = 20
+SAMPLES = 10
+CHUNK = 5_000
+
+
+async def _seed_team() -> tuple:
+    async with async_session_maker() as session:
+        author = User(user_id="bench-author", name="author", isActive=True)
+        reviewer = User(user_id="bench-reviewer", name="reviewer", isActive=True)
+        team = Team(team_name="bench-archive")
+        session.add_all([author, reviewer, team])
+        await session.flush()
+        session.add_all([
+            TeamMember(team_id=team.id, member_id=author.id),
+            TeamMember(team_id=team.id, member_id=reviewer.id)
+        ])
+        await session.commit()
+        return author.id, reviewer.id
+
+
+async def _seed_prs(prefix: str, count: int, author_id: int, reviewer_id: int, merged: bool):
+    merged_at = datetime.utcnow() - timedelta(days=365) if merged else None
+    for start in range(0, count, CHUNK):
+        rows = [
+            {
+                "pull_request_id": f"{prefix}-{i}",
+                "name": prefix,
+                "author_id": author_id,
+                "isMerged": merged,
+                "createdAt": merged_at or datetime.utcnow(),
+                "mergedAt": merged_at
+            }
+            for i in range(start, min(start + CHUNK, count))
+        ]
+        async with async_session_maker() as session:
+            pr_ids = await session.scalars(insert(PullRequest).returning(PullRequest.id), rows)
+            await session.execute(
+                insert(Reviewers),
+                [{"pr_id": pr_id, "reviewer_id": reviewer_id} for pr_id in pr_ids.all()]
+            )
+            await session.commit()
+
+
+async def _open_review_scan(reviewer_id: int) -> int:
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(func.count())
+            .select_from(Reviewers)
+            .join(PullRequest, Reviewers.pr_id == PullRequest.id)
+            .where(and_(Reviewers.reviewer_id == reviewer_id, PullRequest.isMerged == False))
+        )
+        return result.scalar()
+
+
+async def _p50_ms(fn, *args) -> float:
+    timings = []
+    for _ in range(SAMPLES):
+        started = time.perf_counter()
+        await fn(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    engine.echo = admin_engine.echo = False
+    await init_db()
+    author_id, reviewer_id = await _seed_team()
+    await _seed_prs("bench-open", OPEN_PRS, author_id, reviewer_id, merged=False)
+
+    print(f"{'history':>10} | {'getReview p50, ms':>18} | {'open scan p50, ms':>18} | archived")
+    print(f"{'':>10} | {'before':>8} {'after':>9} | {'before':>8} {'after':>9} |")
+    for size in HISTORY_SIZES:
+        # Each round starts from an empty hot history: the previous one was archived
+        await _seed_prs(f"bench-merged-{size}", size, author_id, reviewer_id, merged=True)
+
+        review_before = await _p50_ms(user_service.get_review.__wrapped__, "bench-reviewer")
+        scan_before = await _p50_ms(_open_review_scan, reviewer_id)
+        archived = await archiver.run_once()
+        review_after = await _p50_ms(user_service.get_review.__wrapped__, "bench-reviewer")
+        scan_after = await _p50_ms(_open_review_scan, reviewer_id)
+
+        print(f"{size:>10} | {review_before:>8.2f} {review_after:>9.2f} | "
+              f"{scan_before:>8.2f} {scan_after:>9.2f} | {archived}")
+
+    await engine.dispose()
+    await admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Reviewer selection latency: SQL query per PR vs. in-memory team roster.
+
+Seeds teams of growing size (each member with a few open reviews), then
+measures picking 2 reviewers with the SQL fallback of /pullRequest/create
+and with the assignment engine on a warm roster. Run against a throwaway
+database:
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.assignment_engine
+"""
+from sqlalchemy import insert
+from models.models import *
+from models.database import engine, admin_engine, async_session_maker, init_db
+from services.assignment import AssignmentEngine
+from services.pull_request import _pick_reviewers_sql
+import asyncio
+import statistics
+import time
+
+
+TEAM_SIZES = (5, 50, 500, 5_000)
+OPEN_REVIEWS_PER_MEMBER = 3
+SAMPLES = 200
+
+
+async def _seed_team(size: int) -> tuple:
+    async with async_session_maker() as session:
+        team = Team(team_name=f"bench-assign-{size}")
+        session.add(team)
+        await session.flush()
+        user_ids = await session.scalars(
+            insert(User).returning(User.id),
+            [{"user_id": f"bench-assign-{size}-{i}", "name": f"u{i}", "isActive": i % 10 != 0}
+             for i in range(size)]
+        )
+        member_ids = user_ids.all()
+        await session.execute(
+            insert(TeamMember),
+            [{"team_id": team.id, "member_id": member_id} for member_id in member_ids]
+        )
+        pr_ids = await session.scalars(
+            insert(PullRequest).returning(PullRequest.id),
+            [{"pull_request_id": f"bench-assign-{size}-pr-{i}", "name": "bench",
+              "author_id": member_ids[0], "isMerged": False}
+             for i in range(size * OPEN_REVIEWS_PER_MEMBER // 2)]
+        )
+        await session.execute(
+            insert(Reviewers),
+            [{"pr_id": pr_id, "reviewer_id": member_ids[(2 * i + k) % size]}
+             for i, pr_id in enumerate(pr_ids.all()) for k in range(2)]
+        )
+        await session.commit()
+        return team.id, member_ids[0]
+
+
+async def _p50_ms(fn) -> float:
+    timings = []
+    async with async_session_maker() as session:
+        for _ in range(SAMPLES):
+            started = time.perf_counter()
+            await fn(session)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    engine.echo = admin_engine.echo = False
+    await init_db()
+    assignment = AssignmentEngine()
+
+    print(f"{'team size':>10} | {'SQL p50, ms':>12} | {'engine p50, ms':>15} | {'roster load, ms':>15}")
+    for size in TEAM_SIZES:
+        team_id, author_id = await _seed_team(size)
+
+        sql_p50 = await _p50_ms(lambda session: _pick_reviewers_sql(session, team_id, {author_id}, 2))
+
+        started = time.perf_counter()
+        async with async_session_maker() as session:
+            await assignment.pick(session, team_id, None, 2, {author_id})
+        load_ms = (time.perf_counter() - started) * 1000
+        engine_p50 = await _p50_ms(lambda session: assignment.pick(session, team_id, None, 2, {author_id}))
+
+        print(f"{size:>10} | {sql_p50:>12.3f} | {engine_p50:>15.4f} | {load_ms:>15.2f}")
+
+    await engine.dispose()
+    await admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
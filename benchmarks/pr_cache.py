@@ -0,0 +1,104 @@
+"""
+Hot-key /pullRequest/get: payload assembled per read vs. served from pr_cache.
+
+Seeds PRS open PRs with two reviewers each, then READERS concurrent readers
+issue READS_PER_READER reads where a HOT_SHARE of the reads goes to the
+HOT_KEYS most popular PRs, with PR_CACHE_ENABLED off and on. Reports
+throughput, p50/p99 latency of a single read and the hit ratio. Run against
+a throwaway database:
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.pr_cache
+"""
+from sqlalchemy import insert
+from models.models import *
+from models.database import engine, admin_engine, async_session_maker, init_db
+from services import pr_cache as pr_cache_module, pull_request as pr_service
+from services.pr_cache import pr_cache
+from datetime import datetime
+import asyncio
+import random
+import statistics
+import time
+
+
+PRS = 5_000
+HOT_KEYS = 50
+HOT_SHARE = 0.9
+READERS = 50
+READS_PER_READER = 200
+TEAM_SIZE = 10
+
+
+async def _seed() -> list:
+    async with async_session_maker() as session:
+        team = Team(team_name="bench-pr-cache")
+        session.add(team)
+        await session.flush()
+        member_ids = (await session.scalars(
+            insert(User).returning(User.id),
+            [{"user_id": f"bench-pr-cache-{i}", "name": "bench", "isActive": True,
+              "primary_team_id": team.id} for i in range(TEAM_SIZE)]
+        )).all()
+        await session.execute(
+            insert(TeamMember), [{"team_id": team.id, "member_id": member_id} for member_id in member_ids]
+        )
+        pull_request_ids = [f"bench-pr-cache-{i}" for i in range(PRS)]
+        pr_ids = (await session.scalars(
+            insert(PullRequest).returning(PullRequest.id),
+            [{"pull_request_id": pull_request_id, "name": "bench", "author_id": member_ids[i % TEAM_SIZE],
+              "isMerged": False, "createdAt": datetime.utcnow()}
+             for i, pull_request_id in enumerate(pull_request_ids)]
+        )).all()
+        await session.execute(
+            insert(Reviewers),
+            [{"pr_id": pr_id, "reviewer_id": member_ids[(i + shift) % TEAM_SIZE]}
+             for i, pr_id in enumerate(pr_ids) for shift in (1, 2)]
+        )
+        await session.commit()
+        return pull_request_ids
+
+
+def _key(pull_request_ids: list) -> str:
+    if random.random() < HOT_SHARE:
+        return pull_request_ids[random.randrange(HOT_KEYS)]
+    return random.choice(pull_request_ids)
+
+
+async def _run(pull_request_ids: list) -> tuple:
+    timings = []
+
+    async def reader():
+        for _ in range(READS_PER_READER):
+            started = time.perf_counter()
+            await pr_service.get_pull_request(_key(pull_request_ids))
+            timings.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(reader() for _ in range(READERS)))
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return len(timings) / elapsed, statistics.median(timings), p99
+
+
+async def main():
+    engine.echo = admin_engine.echo = False
+    await init_db()
+    pull_request_ids = await _seed()
+
+    print(f"{'mode':>8} | {'reads/s':>8} | {'p50, ms':>8} | {'p99, ms':>8} | {'hit ratio':>9}")
+    for label, enabled in (("uncached", False), ("cached", True)):
+        pr_cache_module.PR_CACHE_ENABLED = enabled
+        pr_cache.clear()
+        hits, misses = pr_cache.hits, pr_cache.misses
+        throughput, p50, p99 = await _run(pull_request_ids)
+        hits, misses = pr_cache.hits - hits, pr_cache.misses - misses
+        ratio = hits / (hits + misses) if hits + misses else 0.0
+        print(f"{label:>8} | {throughput:>8.0f} | {p50:>8.2f} | {p99:>8.2f} | {ratio:>9.2f}")
+
+    await engine.dispose()
+    await admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Concurrent /pullRequest/create: one transaction per PR vs. group commit.
+
+Seeds a few teams, then lets CONCURRENCY creators start at once, each
+creating PRS_PER_CREATOR PRs back to back, with PR_CREATE_BATCH_ENABLED off
+and on. Reports throughput and p50/p99 latency of a single create. Run
+against a throwaway database:
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.pr_create_batching
+"""
+from sqlalchemy import insert
+from models.models import *
+from models.database import engine, admin_engine, async_session_maker, init_db
+from services import pull_request as pr_service
+from services.assignment import assignment_engine
+import asyncio
+import statistics
+import time
+
+
+CONCURRENCY = (10, 100, 1_000)
+PRS_PER_CREATOR = 5
+TEAMS = 20
+TEAM_SIZE = 10
+
+
+async def _seed_authors() -> list:
+    async with async_session_maker() as session:
+        team_ids = await session.scalars(
+            insert(Team).returning(Team.id),
+            [{"team_name": f"bench-create-{i}"} for i in range(TEAMS)]
+        )
+        team_ids = team_ids.all()
+        user_ids = [f"bench-create-{i}" for i in range(TEAMS * TEAM_SIZE)]
+        member_ids = await session.scalars(
+            insert(User).returning(User.id),
+            [{"user_id": user_id, "name": user_id, "isActive": True,
+              "primary_team_id": team_ids[i % TEAMS]}
+             for i, user_id in enumerate(user_ids)]
+        )
+        await session.execute(
+            insert(TeamMember),
+            [{"team_id": team_ids[i % TEAMS], "member_id": member_id}
+             for i, member_id in enumerate(member_ids.all())]
+        )
+        await session.commit()
+        return user_ids
+
+
+async def _run(label: str, concurrency: int, authors: list) -> tuple:
+    timings = []
+
+    async def creator(number: int):
+        author_id = authors[number % len(authors)]
+        for i in range(PRS_PER_CREATOR):
+            started = time.perf_counter()
+            await pr_service.create_pull_request(f"bench-{label}-{concurrency}-{number}-{i}", "bench", author_id)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(creator(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return len(timings) / elapsed, statistics.median(timings), p99
+
+
+async def main():
+    engine.echo = admin_engine.echo = False
+    await init_db()
+    authors = await _seed_authors()
+    await assignment_engine.load_all()
+
+    print(f"{'creators':>8} | {'mode':>7} | {'PRs/s':>8} | {'p50, ms':>8} | {'p99, ms':>8} | {'avg batch':>9}")
+    for concurrency in CONCURRENCY:
+        for label, enabled in (("single", False), ("batched", True)):
+            pr_service.PR_CREATE_BATCH_ENABLED = enabled
+            batches, items = pr_service.create_batch.batches, pr_service.create_batch.items
+            throughput, p50, p99 = await _run(label, concurrency, authors)
+            batches = pr_service.create_batch.batches - batches
+            avg_batch = (pr_service.create_batch.items - items) / batches if batches else 1.0
+            print(f"{concurrency:>8} | {label:>7} | {throughput:>8.0f} | {p50:>8.2f} | {p99:>8.2f} | {avg_batch:>9.1f}")
+
+    await engine.dispose()
+    await admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
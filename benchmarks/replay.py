@@ -0,0 +1,176 @@
+"""
+Replay recorded traffic (TRAFFIC_RECORD_ENABLED=1, see middleware.recording)
+against a running instance and compare it with the recording.
+
+Requests are re-issued at their recorded offsets divided by --speed
+(1 = original pace, 10 = ten times faster, 0 = back to back), at most
+--concurrency at a time. Reports latency percentiles per route, recorded vs.
+replayed, and the requests whose status or response body differ; fields
+that change on every run (timestamps, tokens, cursors) are ignored. For
+meaningful diffs, start the instance on a copy of the database taken when
+the recording started:
+
+    python -m benchmarks.replay traffic.jsonl --base-url http://localhost:8080 --speed 4
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+import argparse
+import asyncio
+import json
+import time
+import httpx
+
+
+IGNORED_FIELDS = {"createdAt", "mergedAt", "next_token", "next_cursor"}
+PERCENTILES = (50, 95, 99)
+
+
+def load_recording(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda record: record["ts"])
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+def diff(recorded, replayed, ignored: Set[str] = IGNORED_FIELDS, path: str = "") -> List[str]:
+    """Paths (a.b.0) where the replayed JSON differs from the recorded one"""
+    if isinstance(recorded, dict) and isinstance(replayed, dict):
+        paths = []
+        for key in sorted(recorded.keys() | replayed.keys()):
+            if key in ignored:
+                continue
+            paths += diff(recorded.get(key), replayed.get(key), ignored, f"{path}.{key}" if path else key)
+        return paths
+    if isinstance(recorded, list) and isinstance(replayed, list) and len(recorded) == len(replayed):
+        paths = []
+        for index, (old, new) in enumerate(zip(recorded, replayed)):
+            paths += diff(old, new, ignored, f"{path}.{index}" if path else str(index))
+        return paths
+    return [] if recorded == replayed else [path or "."]
+
+
+async def _issue(client: httpx.AsyncClient, record: Dict) -> Dict:
+    url = record["path"] + (f"?{record['query']}" if record.get("query") else "")
+    body = record.get("body")
+    started = time.perf_counter()
+    try:
+        response = await client.request(
+            record["method"], url, headers=record.get("headers") or {},
+            content=body.encode("utf-8") if body else None
+        )
+    except httpx.HTTPError as e:
+        return {"status": None, "duration_ms": (time.perf_counter() - started) * 1000,
+                "response": None, "error": f"{type(e).__name__}: {e}"}
+    duration_ms = (time.perf_counter() - started) * 1000
+    try:
+        payload = response.json() if response.content else None
+    except ValueError:
+        payload = response.text
+    return {"status": response.status_code, "duration_ms": duration_ms, "response": payload, "error": None}
+
+
+async def replay(records: List[Dict], client: httpx.AsyncClient, speed: float = 1.0,
+                 concurrency: int = 100) -> List[Optional[Dict]]:
+    """
+    Re-issue the records in order on their (scaled) schedule. Returns one
+    result per record, None for the ones that cannot be replayed (body not
+    recorded). A result's lag_ms is how late it was sent, e.g. waiting for
+    a free --concurrency slot
+    """
+    results: List[Optional[Dict]] = [None] * len(records)
+    semaphore = asyncio.Semaphore(concurrency)
+    origin = records[0]["ts"] if records else 0.0
+    started = time.perf_counter()
+
+    async def run(index: int, record: Dict, due: float):
+        try:
+            lag_ms = max(0.0, (time.perf_counter() - started - due) * 1000)
+            results[index] = {**await _issue(client, record), "lag_ms": lag_ms}
+        finally:
+            semaphore.release()
+
+    tasks = []
+    for index, record in enumerate(records):
+        if record.get("truncated"):
+            continue
+        due = (record["ts"] - origin) / speed if speed > 0 else 0.0
+        delay = due - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(run(index, record, due)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def report(records: List[Dict], results: List[Optional[Dict]], ignored: Set[str] = IGNORED_FIELDS,
+           show_diffs: int = 10) -> Dict:
+    """Print latency per route and the differences; returns the totals"""
+    routes = defaultdict(lambda: {"recorded": [], "replayed": [], "status": 0, "body": 0})
+    examples = []
+    totals = {"requests": len(records), "replayed": 0, "skipped": 0, "errors": 0,
+              "status_diffs": 0, "body_diffs": 0, "max_lag_ms": 0.0}
+
+    for index, (record, result) in enumerate(zip(records, results)):
+        if result is None:
+            totals["skipped"] += 1
+            continue
+        totals["replayed"] += 1
+        totals["max_lag_ms"] = max(totals["max_lag_ms"], result["lag_ms"])
+        route = routes[f"{record['method']} {record['path']}"]
+        route["recorded"].append(record["duration_ms"])
+        route["replayed"].append(result["duration_ms"])
+        if result["error"] is not None:
+            totals["errors"] += 1
+            examples.append(f"#{index} {record['method']} {record['path']}: {result['error']}")
+        elif result["status"] != record["status"]:
+            totals["status_diffs"] += 1
+            route["status"] += 1
+            examples.append(f"#{index} {record['method']} {record['path']}: "
+                            f"status {record['status']} -> {result['status']}")
+        else:
+            paths = diff(record.get("response"), result["response"], ignored)
+            if paths:
+                totals["body_diffs"] += 1
+                route["body"] += 1
+                examples.append(f"#{index} {record['method']} {record['path']}: {', '.join(paths[:5])}")
+
+    header = " | ".join(f"p{q} rec/rep, ms".rjust(18) for q in PERCENTILES)
+    print(f"{'route':>28} | {'count':>6} | {header} | {'status diffs':>12} | {'body diffs':>10}")
+    for name in sorted(routes):
+        route = routes[name]
+        latencies = " | ".join(
+            f"{percentile(route['recorded'], q):>8.1f}/{percentile(route['replayed'], q):<9.1f}"
+            for q in PERCENTILES
+        )
+        print(f"{name:>28} | {len(route['replayed']):>6} | {latencies} | {route['status']:>12} | {route['body']:>10}")
+    print(", ".join(f"{key}: {round(value, 1)}" for key, value in totals.items()))
+    for example in examples[:show_diffs]:
+        print(example)
+    return totals
+
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay a traffic recording against a running instance")
+    parser.add_argument("recording", help="JSONL written by the traffic recorder (TRAFFIC_RECORD_PATH)")
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression; 0 = no pauses")
+    parser.add_argument("--concurrency", type=int, default=100, help="max requests in flight")
+    parser.add_argument("--ignore", action="append", default=[], help="one more response field to ignore")
+    parser.add_argument("--show-diffs", type=int, default=10, help="differences to print")
+    args = parser.parse_args(argv)
+
+    records = load_recording(args.recording)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        results = await replay(records, client, args.speed, args.concurrency)
+    report(records, results, IGNORED_FIELDS | set(args.ignore), args.show_diffs)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+getReview on a 10k-row review list: full ORM entities vs. column projection.
+
+"entities" is the previous read shape (PullRequest + Reviewers + author User
+entities in one joined query, so the old per-row author lookups do not skew
+the comparison); "projection" is services.reads.fetch_reviews. Reports the
+median wall and CPU time and the peak Python allocation of building the
+response rows. Run against a throwaway database:
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.review_projection
+"""
+from sqlalchemy import select, insert
+from sqlalchemy.orm import aliased
+from models.models import *
+from models.database import engine, admin_engine, async_session_maker, init_db
+from services.reads import fetch_reviews
+import asyncio
+import statistics
+import time
+import tracemalloc
+
+
+ROWS = 10_000
+SAMPLES = 5
+CHUNK = 5_000
+
+
+async def _seed() -> int:
+    async with async_session_maker() as session:
+        author = User(user_id="bench-review-author", name="author", isActive=True)
+        reviewer = User(user_id="bench-review-reviewer", name="reviewer", isActive=True)
+        session.add_all([author, reviewer])
+        await session.flush()
+        for start in range(0, ROWS, CHUNK):
+            pr_ids = await session.scalars(
+                insert(PullRequest).returning(PullRequest.id),
+                [{"pull_request_id": f"bench-review-{i}", "name": f"PR {i}", "author_id": author.id,
+                  "isMerged": i % 3 == 0}
+                 for i in range(start, min(start + CHUNK, ROWS))]
+            )
+            await session.execute(
+                insert(Reviewers),
+                [{"pr_id": pr_id, "reviewer_id": reviewer.id} for pr_id in pr_ids.all()]
+            )
+        await session.commit()
+        return reviewer.id
+
+
+async def _entities(session, reviewer_id: int) -> list:
+    author = aliased(User)
+    result = await session.execute(
+        select(PullRequest, Reviewers, author)
+        .join(Reviewers, PullRequest.id == Reviewers.pr_id)
+        .join(author, author.id == PullRequest.author_id)
+        .where(Reviewers.reviewer_id == reviewer_id)
+    )
+    return [
+        {
+            "pull_request_id": pr.pull_request_id,
+            "pull_request_name": pr.name,
+            "author_id": pr_author.user_id,
+            "status": "MERGED" if pr.isMerged else "OPEN"
+        }
+        for pr, _, pr_author in result.all()
+    ]
+
+
+async def _projection(session, reviewer_id: int) -> list:
+    return [review._asdict() for review in await fetch_reviews(session, reviewer_id)]
+
+
+async def _measure(fn, reviewer_id: int) -> tuple:
+    walls, cpus, peaks = [], [], []
+    for _ in range(SAMPLES):
+        async with async_session_maker() as session:
+            tracemalloc.start()
+            wall, cpu = time.perf_counter(), time.process_time()
+            rows = await fn(session, reviewer_id)
+            cpus.append((time.process_time() - cpu) * 1000)
+            walls.append((time.perf_counter() - wall) * 1000)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            tracemalloc.stop()
+            assert len(rows) == ROWS
+    return statistics.median(walls), statistics.median(cpus), statistics.median(peaks)
+
+
+async def main():
+    engine.echo = admin_engine.echo = False
+    await init_db()
+    reviewer_id = await _seed()
+    # Warm up statement caches and the connection
+    async with async_session_maker() as session:
+        await _entities(session, reviewer_id)
+        await _projection(session, reviewer_id)
+
+    print(f"getReview, {ROWS} rows, median of {SAMPLES} (tracemalloc adds overhead to both)")
+    print(f"{'':>12} | {'wall, ms':>9} | {'CPU, ms':>9} | {'peak, MiB':>9}")
+    for name, fn in (("entities", _entities), ("projection", _projection)):
+        wall, cpu, peak = await _measure(fn, reviewer_id)
+        print(f"{name:>12} | {wall:>9.1f} | {cpu:>9.1f} | {peak:>9.2f}")
+
+    await engine.dispose()
+    await admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Toggling availability of many users: one /users/setIsActive call per user
+vs. a single /users/setIsActiveBatch call.
+
+Seeds BATCH users across a few teams and flips all of them back and forth
+with both paths. Run against a throwaway database:
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.set_is_active_batch
+"""
+from sqlalchemy import insert
+from models.models import *
+from models.database import engine, admin_engine, async_session_maker, init_db
+from services import users as user_service
+import asyncio
+import statistics
+import time
+
+
+BATCH = 1_000
+TEAMS = 10
+ROUNDS = 5
+
+
+async def _seed_users() -> list:
+    async with async_session_maker() as session:
+        team_ids = await session.scalars(
+            insert(Team).returning(Team.id),
+            [{"team_name": f"bench-toggle-{i}"} for i in range(TEAMS)]
+        )
+        team_ids = team_ids.all()
+        user_ids = [f"bench-toggle-{i}" for i in range(BATCH)]
+        member_ids = await session.scalars(
+            insert(User).returning(User.id),
+            [{"user_id": user_id, "name": user_id, "isActive": True,
+              "primary_team_id": team_ids[i % TEAMS]}
+             for i, user_id in enumerate(user_ids)]
+        )
+        await session.execute(
+            insert(TeamMember),
+            [{"team_id": team_ids[i % TEAMS], "member_id": member_id}
+             for i, member_id in enumerate(member_ids.all())]
+        )
+        await session.commit()
+        return user_ids
+
+
+async def _one_by_one(user_ids: list, is_active: bool):
+    for user_id in user_ids:
+        await user_service.set_is_active(user_id, is_active)
+
+
+async def _batch(user_ids: list, is_active: bool):
+    await user_service.set_is_active_batch([(user_id, is_active) for user_id in user_ids])
+
+
+async def _p50_ms(fn, user_ids: list) -> float:
+    timings = []
+    for round_number in range(ROUNDS):
+        started = time.perf_counter()
+        await fn(user_ids, round_number % 2 == 1)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def main():
+    engine.echo = admin_engine.echo = False
+    await init_db()
+    user_ids = await _seed_users()
+
+    one_by_one = await _p50_ms(_one_by_one, user_ids)
+    batch = await _p50_ms(_batch, user_ids)
+
+    print(f"{BATCH} toggles per round, p50 of {ROUNDS} rounds")
+    print(f"{'setIsActive x' + str(BATCH):>22} | {one_by_one:>10.1f} ms")
+    print(f"{'setIsActiveBatch':>22} | {batch:>10.1f} ms")
+
+    await engine.dispose()
+    await admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""
+Python-side cost of the hot statements: built per call vs. prebuilt.
+
+For each hot lookup, "inline" builds the select per call the way the
+services used to, "prebuilt" executes the module-level statement with bound
+parameters. Reports the cost of building + cache-keying a statement (no DB)
+and the client CPU time (time.process_time, so DB server time is excluded)
+per executed statement. Run against a throwaway database:
+
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.statement_cache
+"""
+from sqlalchemy import select, func, and_, insert
+from sqlalchemy.orm import aliased
+from models.models import *
+from models.database import engine, admin_engine, async_session_maker, init_db
+from services import reads, users as user_service, pull_request as pr_service
+import asyncio
+import time
+
+
+ROUNDS = 2_000
+
+
+def _inline_statements(user_id: str, user_pk: int, team_id: int, exclude_ids: list) -> dict:
+    """Builders of each statement as the services used to write them inline"""
+    author = aliased(User)
+    return {
+        "user by string id": lambda: select(*reads.USER_COLUMNS).where(User.user_id == user_id),
+        "reviews of user": lambda: (
+            select(PullRequest.pull_request_id, PullRequest.name, author.user_id, PullRequest.isMerged)
+            .select_from(Reviewers)
+            .join(PullRequest, PullRequest.id == Reviewers.pr_id)
+            .join(author, author.id == PullRequest.author_id)
+            .where(Reviewers.reviewer_id == user_pk)
+        ),
+        "review token": lambda: select(func.min(ReviewChange.seq), func.max(ReviewChange.seq)),
+        "user + roster version": lambda: (
+            select(User, Team.roster_version)
+            .outerjoin(Team, Team.id == User.primary_team_id)
+            .where(User.user_id == user_id)
+        ),
+        "pick reviewers (notin)": lambda: (
+            select(User.id, User.user_id)
+            .join(TeamMember, User.id == TeamMember.member_id)
+            .where(and_(User.isActive == True, User.id.notin_(exclude_ids), TeamMember.team_id == team_id))
+            .limit(2)
+        ),
+    }
+
+
+def _prebuilt_statements(user_id: str, user_pk: int, team_id: int, exclude_ids: list) -> dict:
+    return {
+        "user by string id": (reads.USER_BY_STRING_ID, {"user_id": user_id}),
+        "reviews of user": (reads.REVIEWS, {"reviewer_id": user_pk}),
+        "review token": (user_service.REVIEW_CHANGE_BOUNDS, {}),
+        "user + roster version": (pr_service.USER_WITH_ROSTER_VERSION, {"user_id": user_id}),
+        "pick reviewers (notin)": (
+            pr_service.PICK_REVIEWERS, {"team_id": team_id, "exclude_ids": exclude_ids, "limit": 2}
+        ),
+    }
+
+
+async def _seed() -> tuple:
+    async with async_session_maker() as session:
+        team = Team(team_name="bench-statements")
+        session.add(team)
+        await session.flush()
+        member_ids = (await session.scalars(
+            insert(User).returning(User.id),
+            [{"user_id": f"bench-statements-{i}", "name": "bench", "isActive": True,
+              "primary_team_id": team.id} for i in range(10)]
+        )).all()
+        await session.execute(
+            insert(TeamMember), [{"team_id": team.id, "member_id": member_id} for member_id in member_ids]
+        )
+        await session.commit()
+        return "bench-statements-0", member_ids[0], team.id, member_ids[:1]
+
+
+def _build_us(name: str, args: tuple) -> tuple:
+    build = _inline_statements(*args)[name]
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        build()._generate_cache_key()
+    inline = (time.perf_counter() - started) / ROUNDS * 1e6
+
+    statement, _ = _prebuilt_statements(*args)[name]
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        statement._generate_cache_key()
+    prebuilt = (time.perf_counter() - started) / ROUNDS * 1e6
+    return inline, prebuilt
+
+
+async def _execute_cpu_us(name: str, args: tuple, prebuilt: bool) -> float:
+    build = _inline_statements(*args)[name]
+    statement, params = _prebuilt_statements(*args)[name]
+    async with async_session_maker() as session:
+        started = time.process_time()
+        for _ in range(ROUNDS):
+            if prebuilt:
+                result = await session.execute(statement, params)
+            else:
+                result = await session.execute(build())
+            result.all()
+        return (time.process_time() - started) / ROUNDS * 1e6
+
+
+async def main():
+    engine.echo = admin_engine.echo = False
+    await init_db()
+    args = await _seed()
+
+    print(f"{'statement':>24} | {'build+key inline, us':>20} | {'prebuilt, us':>12} | "
+          f"{'exec CPU inline, us':>19} | {'prebuilt, us':>12}")
+    for name in _inline_statements(*args):
+        build_inline, build_prebuilt = _build_us(name, args)
+        exec_inline = await _execute_cpu_us(name, args, prebuilt=False)
+        exec_prebuilt = await _execute_cpu_us(name, args, prebuilt=True)
+        print(f"{name:>24} | {build_inline:>20.1f} | {build_prebuilt:>12.1f} | "
+              f"{exec_inline:>19.1f} | {exec_prebuilt:>12.1f}")
+
+    await engine.dispose()
+    await admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
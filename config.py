@@ -11,4 +11,146 @@ if is_local_development():
 
 DATABASE_URL = os.getenv(
     'DATABASE_URL'
-) 
\ No newline at end of file
+) 
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '5000'))
+IMPORT_MAX_LINE_BYTES = int(os.getenv('IMPORT_MAX_LINE_BYTES', '65536'))
+IMPORT_MAX_REPORTED_REJECTS = int(os.getenv('IMPORT_MAX_REPORTED_REJECTS', '1000'))
+
+EVENTS_MAX_WAIT_SECONDS = float(os.getenv('EVENTS_MAX_WAIT_SECONDS', '30'))
+EVENTS_POLL_INTERVAL_SECONDS = float(os.getenv('EVENTS_POLL_INTERVAL_SECONDS', '1'))
+EVENTS_MAX_PAGE_SIZE = int(os.getenv('EVENTS_MAX_PAGE_SIZE', '500'))
+
+USERS_BATCH_MAX_SIZE = int(os.getenv('USERS_BATCH_MAX_SIZE', '5000'))
+
+# GET /users/getReview?since=: changes returned per poll
+REVIEW_DELTA_MAX_CHANGES = int(os.getenv('REVIEW_DELTA_MAX_CHANGES', '1000'))
+# How long the change log behind since= keeps a change; older tokens get INVALID_TOKEN
+REVIEW_CHANGES_RETENTION_SECONDS = float(os.getenv('REVIEW_CHANGES_RETENTION_SECONDS', '604800'))
+REVIEW_CHANGES_PURGE_INTERVAL_SECONDS = float(os.getenv('REVIEW_CHANGES_PURGE_INTERVAL_SECONDS', '600'))
+
+REVIEW_STREAM_HEARTBEAT_SECONDS = float(os.getenv('REVIEW_STREAM_HEARTBEAT_SECONDS', '15'))
+REVIEW_STREAM_QUEUE_SIZE = int(os.getenv('REVIEW_STREAM_QUEUE_SIZE', '100'))
+
+WEBHOOK_BATCH_SIZE = int(os.getenv('WEBHOOK_BATCH_SIZE', '100'))
+WEBHOOK_CLAIM_LIMIT = int(os.getenv('WEBHOOK_CLAIM_LIMIT', '1000'))
+WEBHOOK_CONCURRENCY = int(os.getenv('WEBHOOK_CONCURRENCY', '10'))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv('WEBHOOK_TIMEOUT_SECONDS', '5'))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', '10'))
+WEBHOOK_BACKOFF_BASE_SECONDS = float(os.getenv('WEBHOOK_BACKOFF_BASE_SECONDS', '1'))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv('WEBHOOK_BACKOFF_MAX_SECONDS', '300'))
+WEBHOOK_LEASE_SECONDS = float(os.getenv('WEBHOOK_LEASE_SECONDS', '60'))
+WEBHOOK_POLL_INTERVAL_SECONDS = float(os.getenv('WEBHOOK_POLL_INTERVAL_SECONDS', '1'))
+
+JOB_CHUNK_SIZE = int(os.getenv('JOB_CHUNK_SIZE', '200'))
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv('JOB_POLL_INTERVAL_SECONDS', '10'))
+
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', '1') == '1'
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+# Admission control: concurrent requests allowed into the app (defaults to the
+# pool capacity), queue depth, and how long each priority may wait for a slot
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') == '1'
+ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+ADMISSION_RESERVED_SLOTS = int(os.getenv('ADMISSION_RESERVED_SLOTS', '2'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '200'))
+ADMISSION_MAX_WAIT_SECONDS = [
+    float(seconds) for seconds in os.getenv('ADMISSION_MAX_WAIT_SECONDS', '2,1,0.25').split(',')
+]
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv('ADMISSION_RETRY_AFTER_SECONDS', '1'))
+# "path=priority,..." overrides; 0 is most important
+ADMISSION_ROUTE_PRIORITIES = os.getenv('ADMISSION_ROUTE_PRIORITIES', '')
+
+# Admin lane (bulkhead for heavy operations): own pool and concurrency cap.
+# A bulk operation may hold two connections at once (nested team lookup)
+ADMIN_LANE_CONCURRENCY = int(os.getenv('ADMIN_LANE_CONCURRENCY', '2'))
+ADMIN_DB_POOL_SIZE = int(os.getenv('ADMIN_DB_POOL_SIZE', str(2 * ADMIN_LANE_CONCURRENCY)))
+ADMIN_DB_MAX_OVERFLOW = int(os.getenv('ADMIN_DB_MAX_OVERFLOW', '0'))
+ADMIN_LANE_MAX_WAIT_SECONDS = float(os.getenv('ADMIN_LANE_MAX_WAIT_SECONDS', '5'))
+
+# Request deadlines: default budget, per-route overrides ("path=seconds,...")
+# and the cap for a client-supplied X-Request-Timeout
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', '5'))
+REQUEST_TIMEOUT_MAX_SECONDS = float(os.getenv('REQUEST_TIMEOUT_MAX_SECONDS', '60'))
+REQUEST_ROUTE_TIMEOUTS = os.getenv('REQUEST_ROUTE_TIMEOUTS', '')
+
+# Retention: merged PRs older than this move to the archive tables in batches
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', '1') == '1'
+ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv('ARCHIVE_INTERVAL_SECONDS', '600'))
+
+# GET /pullRequest/list
+PR_LIST_MAX_PAGE_SIZE = int(os.getenv('PR_LIST_MAX_PAGE_SIZE', '500'))
+
+# In-memory reviewer assignment (services.assignment); rosters are reloaded
+# on version drift and at least every ASSIGNMENT_ROSTER_TTL_SECONDS
+ASSIGNMENT_ENGINE_ENABLED = os.getenv('ASSIGNMENT_ENGINE_ENABLED', '1') == '1'
+ASSIGNMENT_ROSTER_TTL_SECONDS = float(os.getenv('ASSIGNMENT_ROSTER_TTL_SECONDS', '60'))
+
+# Idempotency-Key support for POST routes (middleware.idempotency)
+IDEMPOTENCY_ENABLED = os.getenv('IDEMPOTENCY_ENABLED', '1') == '1'
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '10'))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv('IDEMPOTENCY_MAX_BODY_BYTES', '1048576'))
+IDEMPOTENCY_MAX_RESPONSE_BYTES = int(os.getenv('IDEMPOTENCY_MAX_RESPONSE_BYTES', '262144'))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv('IDEMPOTENCY_PURGE_INTERVAL_SECONDS', '600'))
+
+# Tracing (services.tracing): off by default; spans are exported in batches
+# to TRACING_EXPORT_PATH (JSONL) or, if set, an OTLP/HTTP JSON endpoint
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', '0') == '1'
+TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', '0.1'))
+TRACING_EXPORT_PATH = os.getenv('TRACING_EXPORT_PATH', 'traces.jsonl')
+TRACING_OTLP_ENDPOINT = os.getenv('TRACING_OTLP_ENDPOINT', '')
+TRACING_BATCH_SIZE = int(os.getenv('TRACING_BATCH_SIZE', '512'))
+TRACING_QUEUE_SIZE = int(os.getenv('TRACING_QUEUE_SIZE', '10000'))
+TRACING_EXPORT_INTERVAL_SECONDS = float(os.getenv('TRACING_EXPORT_INTERVAL_SECONDS', '2'))
+
+# Sharding by team (models.database, services.shards): DATABASE_URL is shard 0
+# (also home of the directory and global tables), these URLs are shards 1..N
+SHARD_DATABASE_URLS = [url.strip() for url in os.getenv('SHARD_DATABASE_URLS', '').split(',') if url.strip()]
+SHARD_DIRECTORY_CACHE_SECONDS = float(os.getenv('SHARD_DIRECTORY_CACHE_SECONDS', '5'))
+SHARD_DIRECTORY_CACHE_SIZE = int(os.getenv('SHARD_DIRECTORY_CACHE_SIZE', '100000'))
+# Requests for a team that is being moved wait this long for the move to finish
+SHARD_MOVE_WAIT_SECONDS = float(os.getenv('SHARD_MOVE_WAIT_SECONDS', '10'))
+# Pause between marking a team as moving and copying it: in-flight requests
+# routed by a cached directory entry finish on the old shard first
+SHARD_MOVE_GRACE_SECONDS = float(os.getenv(
+    'SHARD_MOVE_GRACE_SECONDS', str(SHARD_DIRECTORY_CACHE_SECONDS + REQUEST_TIMEOUT_MAX_SECONDS)
+))
+
+# Group commit for /pullRequest/create (services.group_commit): concurrent
+# creations are collected for up to the window or MAX_SIZE items and
+# committed in one transaction. Off by default
+PR_CREATE_BATCH_ENABLED = os.getenv('PR_CREATE_BATCH_ENABLED', '0') == '1'
+PR_CREATE_BATCH_WINDOW_SECONDS = float(os.getenv('PR_CREATE_BATCH_WINDOW_SECONDS', '0.002'))
+PR_CREATE_BATCH_MAX_SIZE = int(os.getenv('PR_CREATE_BATCH_MAX_SIZE', '100'))
+
+# Write paths that contend on the same team (reassign, bulk deactivation) are
+# re-run on deadlock / serialization failure with jittered backoff
+CONFLICT_RETRY_ATTEMPTS = int(os.getenv('CONFLICT_RETRY_ATTEMPTS', '5'))
+CONFLICT_RETRY_BASE_SECONDS = float(os.getenv('CONFLICT_RETRY_BASE_SECONDS', '0.01'))
+CONFLICT_RETRY_MAX_SECONDS = float(os.getenv('CONFLICT_RETRY_MAX_SECONDS', '0.5'))
+
+# Read-through cache of assembled PR payloads for /pullRequest/get
+# (services.pr_cache); the TTL bounds staleness from writes of other processes
+PR_CACHE_ENABLED = os.getenv('PR_CACHE_ENABLED', '1') == '1'
+PR_CACHE_SIZE = int(os.getenv('PR_CACHE_SIZE', '10000'))
+PR_CACHE_TTL_SECONDS = float(os.getenv('PR_CACHE_TTL_SECONDS', '60'))
+
+# Traffic recording (middleware.recording): a sample of requests with their
+# bodies, response status and timing is appended to TRAFFIC_RECORD_PATH (JSONL)
+# for benchmarks.replay. Off by default
+TRAFFIC_RECORD_ENABLED = os.getenv('TRAFFIC_RECORD_ENABLED', '0') == '1'
+TRAFFIC_RECORD_SAMPLE_RATE = float(os.getenv('TRAFFIC_RECORD_SAMPLE_RATE', '0.01'))
+TRAFFIC_RECORD_PATH = os.getenv('TRAFFIC_RECORD_PATH', 'traffic.jsonl')
+# Larger request / response bodies are recorded without the body
+TRAFFIC_RECORD_MAX_BODY_BYTES = int(os.getenv('TRAFFIC_RECORD_MAX_BODY_BYTES', '65536'))
+TRAFFIC_RECORD_BATCH_SIZE = int(os.getenv('TRAFFIC_RECORD_BATCH_SIZE', '512'))
+TRAFFIC_RECORD_QUEUE_SIZE = int(os.getenv('TRAFFIC_RECORD_QUEUE_SIZE', '10000'))
+TRAFFIC_RECORD_FLUSH_INTERVAL_SECONDS = float(os.getenv('TRAFFIC_RECORD_FLUSH_INTERVAL_SECONDS', '2'))
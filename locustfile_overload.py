@@ -0,0 +1,81 @@
+"""Сценарий перегрузки для admission control.
+
+Пользователи без пауз шлют смесь из create/merge и "дашбордных" чтений,
+заведомо превышая пропускную способность пула БД. Сравните goodput
+(успешные ответы в секунду) с ADMISSION_ENABLED=1 и ADMISSION_ENABLED=0:
+
+    locust -f locustfile_overload.py --headless --users 300 --spawn-rate 50 \
+        --run-time 120s --host http://localhost:8080
+
+С admission control goodput остаётся на уровне пропускной способности БД,
+а лишние запросы быстро получают 503; без него растут задержки всех запросов
+и goodput падает, когда клиенты начинают упираться в таймауты.
+"""
+
+from locust import HttpUser, task, constant, events
+import random
+import string
+
+
+def _generate_id():
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
+
+
+class OverloadUser(HttpUser):
+    wait_time = constant(0)
+
+    def on_start(self):
+        self.team_name = f"team_{_generate_id()}"
+        self.user_ids = [f"u_{_generate_id()}" for _ in range(5)]
+        self.pr_ids = []
+        self.client.post("/team/add", json={
+            "team_name": self.team_name,
+            "members": [
+                {"user_id": uid, "username": f"User_{uid}", "is_active": True}
+                for uid in self.user_ids
+            ]
+        })
+
+    def _request(self, method, url, name, **kwargs):
+        with self.client.request(method, url, name=name, catch_response=True, timeout=10, **kwargs) as response:
+            if response.status_code == 503:
+                response.failure("shed")
+            return response
+
+    @task(2)
+    def create_pr(self):
+        pr_id = f"pr_{_generate_id()}"
+        response = self._request("POST", "/pullRequest/create", "create", json={
+            "pull_request_id": pr_id,
+            "pull_request_name": "Overload",
+            "author_id": random.choice(self.user_ids)
+        })
+        if response.status_code == 201:
+            self.pr_ids.append(pr_id)
+
+    @task(1)
+    def merge_pr(self):
+        if self.pr_ids:
+            self._request("POST", "/pullRequest/merge", "merge",
+                          json={"pull_request_id": self.pr_ids.pop()})
+
+    @task(4)
+    def dashboard_team(self):
+        self._request("GET", f"/team/get?team_name={self.team_name}", "team/get")
+
+    @task(4)
+    def dashboard_reviews(self):
+        self._request("GET", f"/users/getReview?user_id={random.choice(self.user_ids)}", "getReview")
+
+
+@events.quitting.add_listener
+def report_goodput(environment, **kwargs):
+    stats = environment.stats
+    duration = max(stats.last_request_timestamp - stats.start_time, 1)
+    print("\nGoodput (успешных ответов в секунду):")
+    for name in ("create", "merge", "team/get", "getReview"):
+        entry = stats.get(name, "POST" if name in ("create", "merge") else "GET")
+        ok = entry.num_requests - entry.num_failures
+        print(f"  {name:10s} {ok / duration:8.1f} rps, p99 {entry.get_response_time_percentile(0.99):.0f} ms")
+    shed = sum(entry.occurrences for entry in stats.errors.values() if "shed" in str(entry.error))
+    print(f"  shed (503): {shed}")
@@ -2,23 +2,86 @@ from contextlib import asynccontextmanager
 from models.database import *
 from fastapi import FastAPI
 import uvicorn
-from routes import users, teams, pull_request
+from routes import users, teams, pull_request, admin, events, webhooks, jobs, stats
+from services import events as events_service
+from services.review_hub import review_hub
+from services.webhooks import dispatcher
+from services.jobs import job_runner
+from services.archive import archiver
+from services.assignment import assignment_engine
+from services.idempotency import idempotency_store
+from services.events import review_change_purger
+from services.pull_request import create_batch
+from services import tracing
+from services.recording import traffic_recorder
+from config import ARCHIVE_ENABLED, ASSIGNMENT_ENGINE_ENABLED, TRACING_ENABLED, TRAFFIC_RECORD_ENABLED
+from middleware.admission import AdmissionControlMiddleware
+from middleware.deadline import RequestDeadlineMiddleware
+from middleware.idempotency import IdempotencyMiddleware
+from middleware.tracing import TracingMiddleware
+from middleware.recording import TrafficRecordingMiddleware
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if TRACING_ENABLED:
+        await tracing.tracer.start()
+    if TRAFFIC_RECORD_ENABLED:
+        await traffic_recorder.start()
     await init_db()
+    if ASSIGNMENT_ENGINE_ENABLED:
+        await assignment_engine.load_all()
+    await events_service.start_listener()
+    await dispatcher.start()
+    await job_runner.start()
+    await idempotency_store.start()
+    await review_change_purger.start()
+    if ARCHIVE_ENABLED:
+        await archiver.start()
 
     yield
     
-    pass
+    await archiver.stop()
+    await create_batch.stop()
+    await idempotency_store.stop()
+    await review_change_purger.stop()
+    await job_runner.stop()
+    await dispatcher.stop()
+    await review_hub.stop()
+    await events_service.stop_listener()
+    if TRACING_ENABLED:
+        await tracing.tracer.stop()
+    if TRAFFIC_RECORD_ENABLED:
+        await traffic_recorder.stop()
 
 
 app = FastAPI(lifespan=lifespan)
+# Inside admission control: replays are cheap but still read the DB
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(AdmissionControlMiddleware)
+# Outermost, so time spent queueing for admission counts against the budget
+app.add_middleware(RequestDeadlineMiddleware)
 
 app.include_router(users.router)
 app.include_router(teams.router)
 app.include_router(pull_request.router)
+app.include_router(admin.router)
+app.include_router(events.router)
+app.include_router(webhooks.router)
+app.include_router(jobs.router)
+app.include_router(stats.router)
+
+# Instrumented only when enabled, so the disabled path runs the original code
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+    tracing.instrument_routes(app)
+    tracing.instrument_services()
+    tracing.instrument_engines()
+
+# Outermost: records what clients sent and the latency they saw, admission
+# queueing and rejections included
+if TRAFFIC_RECORD_ENABLED:
+    app.add_middleware(TrafficRecordingMiddleware)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+from collections import deque
+from typing import Deque, Dict, List
+from config import (
+    ADMISSION_ENABLED, ADMISSION_MAX_CONCURRENCY, ADMISSION_RESERVED_SLOTS,
+    ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_SECONDS, ADMISSION_RETRY_AFTER_SECONDS,
+    ADMISSION_ROUTE_PRIORITIES
+)
+import asyncio
+import json
+
+
+CRITICAL, NORMAL, LOW = 0, 1, 2
+
+DEFAULT_ROUTE_PRIORITIES = {
+    "/pullRequest/create": CRITICAL,
+    "/pullRequest/merge": CRITICAL,
+    "/pullRequest/reassign": NORMAL,
+    "/users/setIsActive": NORMAL,
+    "/users/setIsActiveBatch": NORMAL,
+    "/team/add": NORMAL,
+    "/team/update": NORMAL,
+    "/team/get": LOW,
+    "/users/getReview": LOW,
+    "/pullRequest/get": LOW,
+    "/pullRequest/list": LOW,
+}
+
+# Long-lived requests that hold no DB connection while they wait, and bulk
+# routes that are bounded by the admin lane's own pool (models.database.admin_lane)
+EXEMPT_PATHS = {
+    "/events", "/users/reviewStream", "/stats", "/docs", "/openapi.json",
+    "/team/bulkDeactivate", "/admin/import", "/admin/checkPrimaryTeams", "/admin/rebalanceShards"
+}
+
+
+def parse_route_priorities(raw: str) -> Dict[str, int]:
+    priorities = dict(DEFAULT_ROUTE_PRIORITIES)
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        path, priority = item.rsplit("=", 1)
+        priorities[path.strip()] = int(priority)
+    return priorities
+
+
+class AdmissionController:
+    """
+    Bounds requests in flight to what the DB pool can serve. Excess requests
+    wait in per-priority FIFO queues; freed slots go to the most important
+    waiter first, and the last `reserved` slots only to CRITICAL requests.
+    A request that cannot get a slot within its priority's wait budget is shed
+    """
+
+    def __init__(self, limit: int, reserved: int, max_queue: int, max_wait: List[float]):
+        self.limit = limit
+        self.reserved = min(reserved, limit - 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: List[Deque[asyncio.Future]] = [deque() for _ in max_wait]
+        self.admitted = [0] * len(max_wait)
+        self.shed = {"queue_full": [0] * len(max_wait), "timeout": [0] * len(max_wait)}
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters)
+
+    def _has_slot(self, priority: int) -> bool:
+        limit = self.limit if priority == CRITICAL else self.limit - self.reserved
+        return self.in_flight < limit
+
+    def _has_waiters_ahead(self, priority: int) -> bool:
+        return any(self._waiters[p] for p in range(priority + 1))
+
+    async def acquire(self, priority: int) -> bool:
+        priority = min(max(priority, 0), len(self._waiters) - 1)
+        if self._has_slot(priority) and not self._has_waiters_ahead(priority):
+            self.in_flight += 1
+            self.admitted[priority] += 1
+            return True
+
+        if self.queued >= self.max_queue:
+            self.shed["queue_full"][priority] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait[priority])
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client went away; hand back a slot granted in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._remove(priority, waiter)
+            raise
+
+        # The slot may have been granted right as the wait timed out
+        if waiter.done() and not waiter.cancelled():
+            self.admitted[priority] += 1
+            return True
+        self._remove(priority, waiter)
+        self.shed["timeout"][priority] += 1
+        return False
+
+    def _remove(self, priority: int, waiter: asyncio.Future):
+        try:
+            self._waiters[priority].remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        self.in_flight -= 1
+        for priority, waiters in enumerate(self._waiters):
+            while waiters and self._has_slot(priority):
+                waiter = waiters.popleft()
+                if waiter.done():
+                    continue
+                self.in_flight += 1
+                waiter.set_result(None)
+            if waiters:
+                # Lower priorities never jump a waiting higher one
+                return
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "reserved": self.reserved,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed
+        }
+
+
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENCY, ADMISSION_RESERVED_SLOTS,
+    ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_SECONDS
+)
+
+
+class AdmissionControlMiddleware:
+    """Fails fast with 503 + Retry-After instead of queueing on the DB pool without bound"""
+
+    def __init__(self, app, controller: AdmissionController = admission,
+                 route_priorities: Dict[str, int] = None):
+        self.app = app
+        self.controller = controller
+        self.route_priorities = route_priorities or parse_route_priorities(ADMISSION_ROUTE_PRIORITIES)
+
+    async def __call__(self, scope, receive, send):
+        if (not ADMISSION_ENABLED or scope["type"] != "http"
+                or scope["path"] in EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        priority = self.route_priorities.get(scope["path"], NORMAL)
+        if not await self.controller.acquire(priority):
+            await self._reject(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+    async def _reject(self, send):
+        body = json.dumps({
+            "detail": {"error": {"code": "OVERLOADED", "message": "service is overloaded, retry later"}}
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,96 @@
+from typing import Dict
+from schemas import ErrorResponse, ErrorDetail
+from services.deadline import Deadline, current_deadline
+from config import REQUEST_TIMEOUT_SECONDS, REQUEST_TIMEOUT_MAX_SECONDS, REQUEST_ROUTE_TIMEOUTS
+import json
+
+
+TIMEOUT_HEADER = b"x-request-timeout"
+
+DEFAULT_ROUTE_TIMEOUTS = {
+    "/team/bulkDeactivate": 60.0,
+    "/admin/import": 600.0,
+    # Teams move one by one, each after SHARD_MOVE_GRACE_SECONDS
+    "/admin/rebalanceShards": 3600.0,
+}
+
+# Streams stay open by design; their statements are short and unbounded by a request budget
+EXEMPT_PATHS = {"/events", "/users/reviewStream"}
+
+
+def parse_route_timeouts(raw: str) -> Dict[str, float]:
+    timeouts = dict(DEFAULT_ROUTE_TIMEOUTS)
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        path, seconds = item.rsplit("=", 1)
+        timeouts[path.strip()] = float(seconds)
+    return timeouts
+
+
+class RequestDeadlineMiddleware:
+    """
+    Gives each request a time budget (X-Request-Timeout in seconds, capped,
+    or the route default). services.deadline turns it into statement_timeout /
+    lock_timeout for the request's transactions; a request that runs out of
+    budget is answered with 504 instead of the route's generic 500
+    """
+
+    def __init__(self, app, route_timeouts: Dict[str, float] = None):
+        self.app = app
+        self.route_timeouts = route_timeouts or parse_route_timeouts(REQUEST_ROUTE_TIMEOUTS)
+
+    def _timeout(self, scope) -> float:
+        timeout = self.route_timeouts.get(scope["path"], REQUEST_TIMEOUT_SECONDS)
+        for name, value in scope["headers"]:
+            if name == TIMEOUT_HEADER:
+                try:
+                    requested = float(value)
+                except ValueError:
+                    break
+                if requested > 0:
+                    timeout = min(requested, REQUEST_TIMEOUT_MAX_SECONDS)
+                break
+        return timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(self._timeout(scope))
+        response = {"started": False, "replaced": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["started"] = True
+                if deadline.expired and message["status"] >= 500:
+                    response["replaced"] = True
+                    await self._timeout_response(send, deadline)
+                    return
+            if not response["replaced"]:
+                await send(message)
+
+        token = current_deadline.set(deadline)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not deadline.expired or response["started"]:
+                raise
+            await self._timeout_response(send, deadline)
+        finally:
+            current_deadline.reset(token)
+
+    async def _timeout_response(self, send, deadline: Deadline):
+        error = ErrorResponse(error=ErrorDetail(
+            code="DEADLINE_EXCEEDED",
+            message=f"request did not complete within {deadline.timeout:g}s"
+        ))
+        body = json.dumps({"detail": error.model_dump()}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
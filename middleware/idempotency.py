@@ -0,0 +1,129 @@
+from services.idempotency import idempotency_store, IdempotencyStore, EXECUTE, REPLAY, MISMATCH
+from config import IDEMPOTENCY_ENABLED, IDEMPOTENCY_MAX_BODY_BYTES, IDEMPOTENCY_MAX_RESPONSE_BYTES
+import hashlib
+import json
+
+
+KEY_HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+
+def _header(scope, name: bytes) -> bytes:
+    for header, value in scope["headers"]:
+        if header == name:
+            return value
+    return None
+
+
+class IdempotencyMiddleware:
+    """
+    POST requests with an Idempotency-Key header run at most once per key
+    and route: a retry gets the original status and body back, a concurrent
+    duplicate waits for the first execution. Bodies up to
+    IDEMPOTENCY_MAX_BODY_BYTES are fingerprinted, so a key reused with
+    another payload is refused; larger (streamed) bodies are not buffered.
+    Server errors are not stored, so they can be retried
+    """
+
+    def __init__(self, app, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if not IDEMPOTENCY_ENABLED or scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        raw_key = _header(scope, KEY_HEADER)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+            await self._error(send, 400, "INVALID_IDEMPOTENCY_KEY",
+                              f"Idempotency-Key must be 1..{MAX_KEY_LENGTH} bytes")
+            return
+
+        key = f"{scope['path']} {raw_key.decode('latin-1')}"
+        receive, request_hash = await self._fingerprint(scope, receive)
+        outcome, record = await self.store.claim(key, request_hash)
+        if outcome == REPLAY:
+            await self._replay(send, record)
+            return
+        if outcome == MISMATCH:
+            await self._error(send, 422, "IDEMPOTENCY_KEY_REUSED",
+                              "Idempotency-Key was already used with a different request")
+            return
+        if outcome != EXECUTE:
+            await self._error(send, 409, "IDEMPOTENCY_IN_PROGRESS",
+                              "a request with this Idempotency-Key is still in progress")
+            return
+
+        response = {"status": None, "content_type": None, "body": [], "size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body" and response["size"] <= IDEMPOTENCY_MAX_RESPONSE_BYTES:
+                chunk = message.get("body", b"")
+                response["body"].append(chunk)
+                response["size"] += len(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            await self.store.release(key)
+            raise
+        status = response["status"]
+        if status is None or status >= 500 or response["size"] > IDEMPOTENCY_MAX_RESPONSE_BYTES:
+            await self.store.release(key)
+        else:
+            await self.store.complete(key, status, response["content_type"], b"".join(response["body"]))
+
+    async def _fingerprint(self, scope, receive):
+        """Buffer a small body to hash it; the app then reads it from the buffer"""
+        length = _header(scope, b"content-length")
+        if length is None or not length.isdigit() or int(length) > IDEMPOTENCY_MAX_BODY_BYTES:
+            return receive, None
+
+        messages = []
+        digest = hashlib.sha256()
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            digest.update(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+
+        async def buffered_receive():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return buffered_receive, digest.hexdigest()
+
+    async def _replay(self, send, record):
+        headers = [
+            (b"content-length", str(len(record.body or b"")).encode()),
+            (b"idempotent-replayed", b"true"),
+        ]
+        if record.content_type:
+            headers.append((b"content-type", record.content_type.encode("latin-1")))
+        await send({"type": "http.response.start", "status": record.status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": record.body or b""})
+
+    async def _error(self, send, status: int, code: str, message: str):
+        body = json.dumps({"detail": {"error": {"code": code, "message": message}}}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,85 @@
+from services.recording import traffic_recorder, TrafficRecorder
+import time
+
+
+# Streams and service endpoints are not traffic worth replaying
+SKIPPED_PATHS = {"/users/reviewStream", "/stats", "/docs", "/openapi.json"}
+# Request headers that change what the service does with a request
+RECORDED_HEADERS = {b"idempotency-key", b"x-request-timeout", b"content-type"}
+
+
+class TrafficRecordingMiddleware:
+    """
+    Records a TRAFFIC_RECORD_SAMPLE_RATE share of requests: method, path,
+    query, body, the headers in RECORDED_HEADERS, response status and body
+    and the time to the last response byte. Unsampled requests pay one
+    random() call; bodies over TRAFFIC_RECORD_MAX_BODY_BYTES are not kept
+    (such requests are recorded as truncated and skipped by the replay)
+    """
+
+    def __init__(self, app, recorder: TrafficRecorder = traffic_recorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in SKIPPED_PATHS or not self.recorder.sampled():
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        started = time.perf_counter()
+        limit = self.recorder.max_body_bytes
+        # Read up to the limit before the app does: requests refused before
+        # reading their body (admission control) are recorded with it too
+        buffered, size = [], 0
+        while size <= limit:
+            message = await receive()
+            buffered.append(message)
+            if message["type"] != "http.request":
+                break
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        oversized = size > limit
+        body = None if oversized else b"".join(
+            message.get("body", b"") for message in buffered if message["type"] == "http.request"
+        )
+        response = {"status": None, "chunks": [], "size": 0}
+
+        async def receive_wrapper():
+            if buffered:
+                return buffered.pop(0)
+            return await receive()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response["size"] += len(chunk)
+                if response["size"] <= limit:
+                    response["chunks"].append(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if oversized or response["size"] > limit:
+                self.recorder.oversized += 1
+            self.recorder.record({
+                "ts": round(started_at, 6),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope["query_string"].decode("latin-1"),
+                "headers": {
+                    name.decode("latin-1"): value.decode("latin-1")
+                    for name, value in scope["headers"] if name in RECORDED_HEADERS
+                },
+                # A request whose body was not kept cannot be replayed
+                "body": body,
+                "truncated": oversized,
+                "status": response["status"],
+                "duration_ms": round(duration_ms, 3),
+                "response": None if response["size"] > limit else b"".join(response["chunks"])
+            })
@@ -0,0 +1,46 @@
+from services.tracing import tracer, Tracer
+
+
+TRACEPARENT_HEADER = b"traceparent"
+
+
+class TracingMiddleware:
+    """
+    Root span per HTTP request, continuing the caller's trace from a W3C
+    traceparent header. Sampled responses carry X-Trace-Id so a slow
+    request can be found in the exported spans
+    """
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT_HEADER:
+                traceparent = value.decode("latin-1")
+                break
+        span = self.tracer.start_trace(
+            f"{scope['method']} {scope['path']}", traceparent,
+            {"http.method": scope["method"], "http.route": scope["path"]}
+        )
+        if span is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                span.set("http.status_code", message["status"])
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"x-trace-id", span.trace_id.encode())]
+                }
+            await send(message)
+
+        with self.tracer.activate(span):
+            await self.app(scope, receive, send_wrapper)
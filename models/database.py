@@ -2,11 +2,214 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker 
 from models.models import * 
 import sqlalchemy as db
-from config import DATABASE_URL
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    ADMIN_DB_POOL_SIZE, ADMIN_DB_MAX_OVERFLOW, ADMIN_LANE_CONCURRENCY, ADMIN_LANE_MAX_WAIT_SECONDS,
+    SHARD_DATABASE_URLS
+)
+import asyncio
+import hashlib
+import time
+
+
+def _hot_engine(url: str):
+    return create_async_engine(
+        url, echo=True, future=True,
+        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT
+    )
+
+
+def _admin_engine(url: str):
+    return create_async_engine(
+        url, echo=True, future=True,
+        pool_size=ADMIN_DB_POOL_SIZE, max_overflow=ADMIN_DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT
+    )
+
+
+engine = _hot_engine(DATABASE_URL)
+admin_engine = _admin_engine(DATABASE_URL)
+
+# Shard 0 is DATABASE_URL: it also keeps the shard directory and the global
+# tables (idempotency keys). Every shard has the full schema; jobs, webhooks
+# and the outbox live on their team's shard
+shard_engines = [engine] + [_hot_engine(url) for url in SHARD_DATABASE_URLS]
+admin_shard_engines = [admin_engine] + [_admin_engine(url) for url in SHARD_DATABASE_URLS]
+SHARD_COUNT = len(shard_engines)
+
+
+class LaneBusy(Exception):
+    """No slot in the lane within its wait budget"""
+
+
+class Lane:
+    """
+    Execution lane (bulkhead): its own connection pool, a concurrency cap and
+    metrics. Heavy admin work runs in the admin lane so it can never take
+    connections from the hot request paths
+    """
+
+    def __init__(self, name: str, lane_engines: List, concurrency: Optional[int] = None,
+                 max_wait: Optional[float] = None):
+        self.name = name
+        self.engines = lane_engines
+        self.engine = lane_engines[0]
+        # One pool per shard
+        self.session_makers = [
+            sessionmaker(lane_engine, class_=AsyncSession, expire_on_commit=False)
+            for lane_engine in lane_engines
+        ]
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @asynccontextmanager
+    async def enter(self, bounded_wait: bool = True):
+        """Run the block in this lane; raises LaneBusy if no slot frees up in time"""
+        if self._semaphore is not None:
+            started = time.monotonic()
+            self.waiting += 1
+            try:
+                if bounded_wait and self.max_wait is not None:
+                    await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+                else:
+                    await self._semaphore.acquire()
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise LaneBusy(self.name)
+            finally:
+                self.waiting -= 1
+            waited = time.monotonic() - started
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+        token = current_lane.set(self)
+        self.in_flight += 1
+        try:
+            yield self
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            current_lane.reset(token)
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def stats(self):
+        pool_stats = self._pool_stats(self.engine)
+        if len(self.engines) > 1:
+            pool_stats["shards"] = [self._pool_stats(lane_engine) for lane_engine in self.engines[1:]]
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+            "pool": pool_stats
+        }
+
+    @staticmethod
+    def _pool_stats(lane_engine):
+        pool = lane_engine.sync_engine.pool
+        pool_stats = {"status": pool.status()}
+        if hasattr(pool, "checkedout"):
+            pool_stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        return pool_stats
+
+
+hot_lane = Lane("hot", shard_engines)
+admin_lane = Lane("admin", admin_shard_engines, ADMIN_LANE_CONCURRENCY, ADMIN_LANE_MAX_WAIT_SECONDS)
+lanes = {lane.name: lane for lane in (hot_lane, admin_lane)}
+
+current_lane: ContextVar[Lane] = ContextVar("current_lane", default=hot_lane)
+# Set by services.shards routing from the team, user or PR a service call is about
+current_shard: ContextVar[int] = ContextVar("current_shard", default=0)
+
+
+def async_session_maker(shard: Optional[int] = None) -> AsyncSession:
+    """
+    New session on the current lane's pool (the hot pool unless inside
+    Lane.enter) of the given shard, by default the current one
+    """
+    return current_lane.get().session_makers[current_shard.get() if shard is None else shard]()
+
+
+@contextmanager
+def use_shard(shard: int):
+    """Run the block's async_session_maker() sessions on the given shard"""
+    token = current_shard.set(shard)
+    try:
+        yield shard
+    finally:
+        current_shard.reset(token)
+
+
+def shard_for_team(team_name: str, shard_count: int = SHARD_COUNT) -> int:
+    """
+    Placement of a new team: rendezvous (highest random weight) hashing of the
+    team name, stable across processes and restarts. Adding a shard only moves
+    the teams that now rank the new shard highest, about 1/N of them
+    """
+    if shard_count == 1:
+        return 0
+    return max(
+        range(shard_count),
+        key=lambda shard: hashlib.blake2b(f"{shard}:{team_name}".encode(), digest_size=8).digest()
+    )
+
+
+# Columns added to tables that already existed: create_all does not alter
+# existing tables, so init_db adds them to an older database
+LATE_COLUMNS = (
+    ("users", "primary_team_id", "BIGINT REFERENCES teams (id)"),
+    ("teams", "roster_version", "BIGINT NOT NULL DEFAULT 0"),
+    # Existing changes count as made at the upgrade (naive UTC, as datetime.utcnow)
+    ("reviewchanges", "created_at", "TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')"),
+)
+
+
+def _missing_columns(sync_conn) -> List[tuple]:
+    inspector = db.inspect(sync_conn)
+    existing = {}
+    for table, column, _ in LATE_COLUMNS:
+        if table not in existing:
+            existing[table] = {info["name"] for info in inspector.get_columns(table)}
+    return [late for late in LATE_COLUMNS if late[1] not in existing[late[0]]]
+
+
+async def upgrade_schema(conn):
+    """Add LATE_COLUMNS missing on the connection's database and backfill them"""
+    if_not_exists = "IF NOT EXISTS " if conn.dialect.name == "postgresql" else ""
+    for table, column, definition in await conn.run_sync(_missing_columns):
+        await conn.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{column} {definition}"))
+
+    # Primary team of users that have none yet (column just added, or added
+    # by hand): the oldest of their teams, as services.teams keeps it
+    await conn.execute(
+        db.update(User)
+        .where(db.and_(
+            User.primary_team_id.is_(None),
+            db.exists().where(TeamMember.member_id == User.id)
+        ))
+        .values(primary_team_id=(
+            db.select(db.func.min(TeamMember.team_id))
+            .where(TeamMember.member_id == User.id)
+            .scalar_subquery()
+        ))
+    )
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True) 
-async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False) 
 
 async def init_db(): 
-    async with engine.begin() as conn: 
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+    for shard_engine in shard_engines:
+        async with shard_engine.begin() as conn: 
+            await conn.run_sync(Base.metadata.create_all)
+            await upgrade_schema(conn)
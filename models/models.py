@@ -13,6 +13,9 @@ class User(Base):
     user_id = Column(String(50), unique=True, nullable=False, index=True)
     name = Column(String(50), nullable=False)
     isActive = Column(Boolean(), nullable=False, default=True)
+    # Denormalized min(teammembers.team_id): the user's oldest team, kept in
+    # sync by services.teams so hot paths read the team with the user row
+    primary_team_id = Column(BigInteger(), ForeignKey('teams.id'), nullable=True)
 
 
 class Team(Base):
@@ -20,6 +23,9 @@ class Team(Base):
     
     id = Column(BigInteger(), primary_key=True, autoincrement=True)
     team_name = Column(String(50), unique=True, nullable=False, index=True)
+    # Bumped on every membership or activity change of the team's members;
+    # in-memory rosters (services.assignment) compare it to detect drift
+    roster_version = Column(BigInteger(), nullable=False, default=0, server_default='0')
 
 
 class TeamMember(Base):
@@ -39,18 +45,185 @@ class PullRequest(Base):
     id = Column(BigInteger(), primary_key=True, autoincrement=True)
     pull_request_id = Column(String(50), unique=True, nullable=False, index=True)
     name = Column(String(255), nullable=False)
-    author_id = Column(BigInteger(), ForeignKey('users.id'), nullable=False, index=True)
+    author_id = Column(BigInteger(), ForeignKey('users.id'), nullable=False)
     isMerged = Column(Boolean(), nullable=False, default=False)
     createdAt = Column(DateTime, nullable=True, default=datetime.utcnow)
     mergedAt = Column(DateTime, nullable=True)
+    
+    # Driving indexes of /pullRequest/list: each ends with id, the keyset tiebreaker
+    __table_args__ = (
+        Index('ix_pullrequests_author_id_id', 'author_id', 'id'),
+        Index('ix_pullrequests_created_at_id', 'createdAt', 'id'),
+        Index('ix_pullrequests_merged_at_id', 'mergedAt', 'id'),
+        Index('ix_pullrequests_open_id', 'id',
+              postgresql_where=(isMerged == False), sqlite_where=(isMerged == False)),
+    )
 
 
 class Reviewers(Base):
     __tablename__ = 'reviewers'
     
     pr_id = Column(BigInteger(), ForeignKey('pullrequests.id'), nullable=False, index=True)
-    reviewer_id = Column(BigInteger(), ForeignKey('users.id'), nullable=False, index=True)
+    reviewer_id = Column(BigInteger(), ForeignKey('users.id'), nullable=False)
+    
+    __table_args__ = (
+        PrimaryKeyConstraint('pr_id', 'reviewer_id'),
+        Index('ix_reviewers_reviewer_id_pr_id', 'reviewer_id', 'pr_id'),
+    )
+
+
+class ArchivedPullRequest(Base):
+    """Merged PRs moved out of the hot tables by services.archive"""
+    __tablename__ = 'archivedpullrequests'
+    
+    id = Column(BigInteger(), primary_key=True, autoincrement=False)
+    pull_request_id = Column(String(50), unique=True, nullable=False, index=True)
+    name = Column(String(255), nullable=False)
+    author_id = Column(BigInteger(), ForeignKey('users.id'), nullable=False)
+    isMerged = Column(Boolean(), nullable=False, default=True)
+    createdAt = Column(DateTime, nullable=True)
+    mergedAt = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('ix_archivedpullrequests_author_id_id', 'author_id', 'id'),
+        Index('ix_archivedpullrequests_created_at_id', 'createdAt', 'id'),
+        Index('ix_archivedpullrequests_merged_at_id', 'mergedAt', 'id'),
+    )
+
+
+class ArchivedReviewer(Base):
+    __tablename__ = 'archivedreviewers'
+    
+    pr_id = Column(BigInteger(), ForeignKey('archivedpullrequests.id'), nullable=False, index=True)
+    reviewer_id = Column(BigInteger(), ForeignKey('users.id'), nullable=False)
     
     __table_args__ = (
         PrimaryKeyConstraint('pr_id', 'reviewer_id'),
+        Index('ix_archivedreviewers_reviewer_id_pr_id', 'reviewer_id', 'pr_id'),
+    )
+
+
+class AssignmentEvent(Base):
+    __tablename__ = 'assignmentevents'
+    
+    seq = Column(BigInteger(), primary_key=True, autoincrement=True)
+    event_type = Column(String(20), nullable=False)
+    pull_request_id = Column(String(50), nullable=True)
+    user_id = Column(String(50), nullable=True)
+    old_user_id = Column(String(50), nullable=True)
+    createdAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ReviewChange(Base):
+    """
+    Per-reviewer change log behind GET /users/getReview?since=: a row means
+    "this PR changed for this reviewer" (assigned, unassigned, merged,
+    archived); the current state is read from the hot tables
+    """
+    __tablename__ = 'reviewchanges'
+    
+    seq = Column(BigInteger(), primary_key=True, autoincrement=True)
+    user_id = Column(String(50), nullable=False)
+    pull_request_id = Column(String(50), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('ix_reviewchanges_user_id_seq', 'user_id', 'seq'),
+    )
+
+
+class Webhook(Base):
+    __tablename__ = 'webhooks'
+    
+    id = Column(BigInteger(), primary_key=True, autoincrement=True)
+    team_id = Column(BigInteger(), ForeignKey('teams.id'), nullable=False, index=True)
+    url = Column(String(2048), nullable=False)
+    createdAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class WebhookDelivery(Base):
+    __tablename__ = 'webhookdeliveries'
+    
+    id = Column(BigInteger(), primary_key=True, autoincrement=True)
+    webhook_id = Column(BigInteger(), ForeignKey('webhooks.id'), nullable=False)
+    event_seq = Column(BigInteger(), ForeignKey('assignmentevents.seq'), nullable=False)
+    status = Column(String(10), nullable=False, default='PENDING')
+    attempts = Column(Integer(), nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String(255), nullable=True)
+    
+    __table_args__ = (
+        UniqueConstraint('webhook_id', 'event_seq'),
+        Index('ix_webhookdeliveries_due', 'status', 'next_attempt_at'),
+    )
+
+
+class WebhookCursor(Base):
+    __tablename__ = 'webhookcursor'
+    
+    id = Column(Integer(), primary_key=True)
+    last_seq = Column(BigInteger(), nullable=False, default=0)
+
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    
+    id = Column(BigInteger(), primary_key=True, autoincrement=True)
+    job_type = Column(String(30), nullable=False)
+    status = Column(String(10), nullable=False, default='PENDING', index=True)
+    team_name = Column(String(50), nullable=False)
+    deactivated_users = Column(JSON(), nullable=True)
+    total = Column(Integer(), nullable=False, default=0)
+    processed = Column(Integer(), nullable=False, default=0)
+    cursor_pr_id = Column(BigInteger(), nullable=False, default=0)
+    cursor_reviewer_id = Column(BigInteger(), nullable=False, default=0)
+    attempts = Column(Integer(), nullable=False, default=0)
+    lease_owner = Column(String(36), nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+    error = Column(String(255), nullable=True)
+    createdAt = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finishedAt = Column(DateTime, nullable=True)
+
+
+class JobReassignment(Base):
+    __tablename__ = 'jobreassignments'
+    
+    id = Column(BigInteger(), primary_key=True, autoincrement=True)
+    job_id = Column(BigInteger(), ForeignKey('jobs.id'), nullable=False, index=True)
+    pr_id = Column(BigInteger(), ForeignKey('pullrequests.id'), nullable=False)
+    old_reviewer_id = Column(BigInteger(), ForeignKey('users.id'), nullable=False)
+    new_reviewer_id = Column(BigInteger(), ForeignKey('users.id'), nullable=False)
+
+
+class IdempotencyKey(Base):
+    """Stored outcome of a POST sent with an Idempotency-Key header (services.idempotency)"""
+    __tablename__ = 'idempotencykeys'
+    
+    # "<path> <Idempotency-Key>": the same key on two routes is two requests
+    key = Column(String(300), primary_key=True)
+    request_hash = Column(String(64), nullable=True)
+    # NULL while the first request is still running
+    status_code = Column(Integer(), nullable=True)
+    content_type = Column(String(100), nullable=True)
+    body = Column(LargeBinary(), nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class ShardEntry(Base):
+    """
+    Shard directory (services.shards), kept on shard 0: which shard holds a
+    team, a user or a PR. Ids missing here live on shard 0
+    """
+    __tablename__ = 'sharddirectory'
+    
+    # 'team', 'user' or 'pr'
+    kind = Column(String(4), nullable=False)
+    key = Column(String(50), nullable=False)
+    shard = Column(Integer(), nullable=False)
+    # Set while the team is copied to another shard; requests wait for the move
+    moving = Column(Boolean(), nullable=False, default=False)
+    
+    __table_args__ = (
+        PrimaryKeyConstraint('kind', 'key'),
     )
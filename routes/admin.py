@@ -0,0 +1,82 @@
+from fastapi import APIRouter, HTTPException, status, Request, Query
+from schemas import ImportResponse, PrimaryTeamCheckResponse, RebalanceShardsResponse, ErrorResponse
+from services import admin as admin_service
+from services import teams as team_service
+from services import shards as shard_service
+from models.database import admin_lane, LaneBusy
+from config import ADMISSION_RETRY_AFTER_SECONDS
+
+
+router = APIRouter(prefix="/admin")
+
+
+@router.post("/import", status_code=status.HTTP_200_OK,
+                  summary="Массовый импорт команд, пользователей и истории PR из NDJSON-потока",
+                  response_model=ImportResponse,
+                  responses={503: {"model": ErrorResponse}},
+                  openapi_extra={
+                      "requestBody": {
+                          "required": True,
+                          "content": {"application/x-ndjson": {"schema": {"type": "string"}}}
+                      }
+                  })
+async def import_data(request: Request):
+    try:
+        async with admin_lane.enter():
+            result = await admin_service.import_records(request.stream())
+        return ImportResponse(**result)
+    except LaneBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": {"code": "LANE_BUSY", "message": "too many bulk operations in progress, retry later"}},
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.post("/checkPrimaryTeams", status_code=status.HTTP_200_OK,
+                  summary="Сверить основную команду пользователей (users.primary_team_id) с составом команд",
+                  response_model=PrimaryTeamCheckResponse,
+                  responses={503: {"model": ErrorResponse}})
+async def check_primary_teams(repair: bool = Query(False, description="Исправить найденные расхождения")):
+    try:
+        async with admin_lane.enter():
+            result = await team_service.check_primary_teams(repair)
+        return PrimaryTeamCheckResponse(**result)
+    except LaneBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": {"code": "LANE_BUSY", "message": "too many bulk operations in progress, retry later"}},
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.post("/rebalanceShards", status_code=status.HTTP_200_OK,
+                  summary="Перенести команды на шарды по их хешу (и зарегистрировать старые id в каталоге)",
+                  response_model=RebalanceShardsResponse,
+                  responses={503: {"model": ErrorResponse}})
+async def rebalance_shards(dry_run: bool = Query(False, description="Только показать план переноса")):
+    try:
+        async with admin_lane.enter():
+            result = await shard_service.rebalance(dry_run)
+        return RebalanceShardsResponse(**result)
+    except LaneBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": {"code": "LANE_BUSY", "message": "too many bulk operations in progress, retry later"}},
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
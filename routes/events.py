@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, status, Query
+from schemas import EventsResponse, ErrorResponse
+from services import events as events_service
+from config import EVENTS_MAX_WAIT_SECONDS, EVENTS_MAX_PAGE_SIZE
+
+
+router = APIRouter()
+
+
+@router.get("/events", status_code=status.HTTP_200_OK,
+                summary="Лента событий назначений (long-poll): события после курсора after",
+                response_model=EventsResponse,
+                responses={400: {"model": ErrorResponse}})
+async def get_events(after: str = Query("0", description="next_after прошлого ответа (0 — с начала)"),
+                     limit: int = Query(100, ge=1, le=EVENTS_MAX_PAGE_SIZE),
+                     timeout: float = Query(EVENTS_MAX_WAIT_SECONDS, ge=0, le=EVENTS_MAX_WAIT_SECONDS,
+                                            description="Сколько секунд ждать новых событий")):
+    seqs = events_service.decode_events_cursor(after)
+    if seqs is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"error": {"code": "INVALID_CURSOR", "message": "after must be 0 or a next_after"}}
+        )
+    try:
+        events = await events_service.get_events(seqs, limit, timeout)
+        return EventsResponse(
+            events=events,
+            next_after=events_service.encode_events_cursor(events_service.advance_cursor(seqs, events))
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, status
+from schemas import JobResponse, ErrorResponse
+from services import jobs as job_service
+
+
+router = APIRouter(prefix="/jobs")
+
+
+@router.get("/{job_id}", status_code=status.HTTP_200_OK,
+                 summary="Статус фоновой задачи; после завершения содержит итоговый результат",
+                 response_model=JobResponse,
+                 responses={404: {"model": ErrorResponse}})
+async def get(job_id: int):
+    try:
+        job = await job_service.get_job(job_id)
+        if not job:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"error": {"code": "NOT_FOUND", "message": "job not found"}}
+            )
+        return JobResponse(**job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
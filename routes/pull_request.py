@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Query
+from typing import Optional
+from datetime import datetime
 from schemas import (
     PullRequestCreateRequest, PullRequestCreateResponse,
-    PullRequestMergeRequest, PullRequestMergeResponse,
+    PullRequestMergeRequest, PullRequestMergeResponse, PullRequestGetResponse,
     PullRequestReassignRequest, PullRequestReassignResponse,
-    ErrorResponse
+    PullRequestListResponse, ErrorResponse
 )
 from services import pull_request as pr_service
+from config import PR_LIST_MAX_PAGE_SIZE
 
 
 router = APIRouter(prefix="/pullRequest")
@@ -67,6 +70,28 @@ async def merge(request: PullRequestMergeRequest):
         )
 
 
+@router.get("/get", status_code=status.HTTP_200_OK,
+                summary="Получить PR с назначенными ревьюверами",
+                response_model=PullRequestGetResponse,
+                responses={404: {"model": ErrorResponse}})
+async def get(pull_request_id: str = Query(..., description="Идентификатор PR")):
+    try:
+        pr = await pr_service.get_pull_request(pull_request_id)
+        if not pr:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"error": {"code": "NOT_FOUND", "message": "PR not found"}}
+            )
+        return PullRequestGetResponse(pr=pr)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @router.post("/reassign", status_code=status.HTTP_200_OK,
                 summary="Переназначить конкретного ревьювера на другого из его команды",
                 response_model=PullRequestReassignResponse,
@@ -118,3 +143,41 @@ async def reassign(request: PullRequestReassignRequest):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
+
+
+@router.get("/list", status_code=status.HTTP_200_OK,
+                summary="Список PR с фильтрами по статусу, автору, команде, ревьюверу и датам (keyset-пагинация)",
+                response_model=PullRequestListResponse,
+                responses={400: {"model": ErrorResponse}})
+async def list_pull_requests(
+    pr_status: Optional[str] = Query(None, alias="status", pattern="^(OPEN|MERGED)$", description="OPEN или MERGED"),
+    author_id: Optional[str] = Query(None, description="Автор PR"),
+    team_name: Optional[str] = Query(None, description="Команда автора PR"),
+    reviewer_id: Optional[str] = Query(None, description="Назначенный ревьювер"),
+    created_from: Optional[datetime] = Query(None, description="createdAt >= created_from"),
+    created_to: Optional[datetime] = Query(None, description="createdAt < created_to"),
+    merged_from: Optional[datetime] = Query(None, description="mergedAt >= merged_from"),
+    merged_to: Optional[datetime] = Query(None, description="mergedAt < merged_to"),
+    limit: int = Query(100, ge=1, le=PR_LIST_MAX_PAGE_SIZE, description="Размер страницы"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    include_archived: bool = Query(False, description="Включить архивные (давно смёрдженные) PR")
+):
+    try:
+        result = await pr_service.list_pull_requests(
+            pr_status, author_id, team_name, reviewer_id,
+            created_from, created_to, merged_from, merged_to,
+            limit, cursor, include_archived
+        )
+        return PullRequestListResponse(**result)
+    except ValueError as e:
+        if str(e) == "INVALID_CURSOR":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"error": {"code": "INVALID_CURSOR", "message": "cursor is malformed"}}
+            )
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
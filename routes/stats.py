@@ -0,0 +1,36 @@
+from fastapi import APIRouter, status
+from services import single_flight, retry
+from middleware.admission import admission
+from models.database import lanes
+from services.archive import archiver
+from services.assignment import assignment_engine
+from services.idempotency import idempotency_store
+from services.events import review_change_purger
+from services.pull_request import create_batch
+from services.pr_cache import pr_cache
+from services.recording import traffic_recorder
+from services.shards import directory
+from services.tracing import tracer
+
+
+router = APIRouter()
+
+
+@router.get("/stats", status_code=status.HTTP_200_OK,
+                summary="Внутренние счётчики сервиса (объединение запросов, admission control, пулы и т.п.)")
+async def get_stats():
+    return {
+        "single_flight": single_flight.stats(),
+        "admission": admission.stats(),
+        "lanes": {name: lane.stats() for name, lane in lanes.items()},
+        "archive": archiver.stats(),
+        "assignment": assignment_engine.stats(),
+        "idempotency": idempotency_store.stats(),
+        "review_changes": review_change_purger.stats(),
+        "tracing": tracer.stats(),
+        "shards": directory.stats(),
+        "create_batch": create_batch.stats(),
+        "conflict_retries": retry.stats(),
+        "pr_cache": pr_cache.stats(),
+        "recording": traffic_recorder.stats()
+    }
@@ -2,9 +2,13 @@ from fastapi import APIRouter, HTTPException, status, Query
 from schemas import (
     TeamRequest, TeamCreateResponse, TeamResponse,
     BulkDeactivateRequest, BulkDeactivateResponse,
-    ErrorResponse
+    TeamUpdateRequest, TeamUpdateResponse,
+    JobResponse, ErrorResponse
 )
 from services import teams as team_service
+from services import jobs as job_service
+from models.database import admin_lane, LaneBusy
+from config import ADMISSION_RETRY_AFTER_SECONDS
 
 
 router = APIRouter(prefix="/team")
@@ -13,7 +17,7 @@ router = APIRouter(prefix="/team")
 @router.post("/add", status_code=status.HTTP_201_CREATED,
                   summary="Создать команду с участниками (создаёт/обновляет пользователей)",
                   response_model=TeamCreateResponse,
-                  responses={400: {"model": ErrorResponse}})
+                  responses={400: {"model": ErrorResponse}, 409: {"model": ErrorResponse}})
 async def add(request: TeamRequest):
     try:
         team = await team_service.add_team(request.team_name, request.members)
@@ -24,6 +28,46 @@ async def add(request: TeamRequest):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail={"error": {"code": "TEAM_EXISTS", "message": "team_name already exists"}}
             )
+        if str(e) == "CROSS_SHARD_MEMBER":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"error": {"code": "CROSS_SHARD_MEMBER", "message": "user belongs to a team on another shard"}}
+            )
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.post("/update", status_code=status.HTTP_200_OK,
+                  summary="Изменить состав команды диффом (добавить/обновить/убрать участников)",
+                  response_model=TeamUpdateResponse,
+                  responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse},
+                             409: {"model": ErrorResponse}})
+async def update(request: TeamUpdateRequest):
+    try:
+        result = await team_service.update_team(
+            request.team_name, request.add, request.update, request.remove, request.reassign_removed
+        )
+        return TeamUpdateResponse(**result)
+    except ValueError as e:
+        if str(e) == "NOT_FOUND":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"error": {"code": "NOT_FOUND", "message": "team not found"}}
+            )
+        if str(e) == "CONFLICTING_MEMBERS":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"error": {"code": "CONFLICTING_MEMBERS", "message": "user is both added/updated and removed"}}
+            )
+        if str(e) == "CROSS_SHARD_MEMBER":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"error": {"code": "CROSS_SHARD_MEMBER", "message": "user belongs to a team on another shard"}}
+            )
         raise
     except Exception as e:
         raise HTTPException(
@@ -57,11 +101,40 @@ async def get(team_name: str = Query(..., description="Уникальное им
 @router.post("/bulkDeactivate", status_code=status.HTTP_200_OK,
                   summary="Массовая деактивация пользователей команды с безопасным переназначением ревьюверов",
                   response_model=BulkDeactivateResponse,
-                  responses={404: {"model": ErrorResponse}})
+                  responses={404: {"model": ErrorResponse}, 503: {"model": ErrorResponse}})
 async def bulk_deactivate(request: BulkDeactivateRequest):
     try:
-        result = await team_service.bulk_deactivate_team(request.team_name)
+        async with admin_lane.enter():
+            result = await team_service.bulk_deactivate_team(request.team_name)
         return BulkDeactivateResponse(**result)
+    except LaneBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": {"code": "LANE_BUSY", "message": "too many bulk operations in progress, retry later"}},
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)}
+        )
+    except ValueError as e:
+        if str(e) == "NOT_FOUND":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"error": {"code": "NOT_FOUND", "message": "team not found"}}
+            )
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.post("/bulkDeactivateAsync", status_code=status.HTTP_202_ACCEPTED,
+                  summary="Массовая деактивация фоновой задачей: сразу возвращает id задачи (см. /jobs/{job_id})",
+                  response_model=JobResponse,
+                  responses={404: {"model": ErrorResponse}})
+async def bulk_deactivate_async(request: BulkDeactivateRequest):
+    try:
+        job = await job_service.submit_bulk_deactivate(request.team_name)
+        return JobResponse(**job)
     except ValueError as e:
         if str(e) == "NOT_FOUND":
             raise HTTPException(
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, HTTPException, status, Query, Header
+from fastapi.responses import StreamingResponse
+from typing import Optional
 from schemas import (
     SetIsActiveRequest, UserUpdateResponse, GetReviewResponse,
-    ErrorResponse
+    SetIsActiveBatchRequest, SetIsActiveBatchResponse,
+    EventInfo, ErrorResponse
 )
 from services import users as user_service
+from services.review_hub import review_hub, OVERFLOW_EVENT
+from config import REVIEW_STREAM_HEARTBEAT_SECONDS, EVENTS_MAX_PAGE_SIZE
+import asyncio
 
 
 router = APIRouter(prefix="/users")
@@ -29,18 +35,129 @@ async def setIsActive(request: SetIsActiveRequest):
         )
 
 
+@router.post("/setIsActiveBatch", status_code=status.HTTP_200_OK,
+                   summary="Установить флаг активности списку пользователей",
+                   response_model=SetIsActiveBatchResponse)
+async def setIsActiveBatch(request: SetIsActiveBatchRequest):
+    try:
+        result = await user_service.set_is_active_batch(
+            [(item.user_id, item.is_active) for item in request.users]
+        )
+        return SetIsActiveBatchResponse(**result)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @router.get("/getReview", status_code=status.HTTP_200_OK,
                   summary="Получить PR'ы, где пользователь назначен ревьювером",
-                  response_model=GetReviewResponse)
-async def getReview(user_id: str = Query(..., description="Идентификатор пользователя")):
+                  response_model=GetReviewResponse,
+                  responses={400: {"model": ErrorResponse}})
+async def getReview(user_id: str = Query(..., description="Идентификатор пользователя"),
+                    include_archived: bool = Query(False, description="Включить архивные (давно смёрдженные) PR"),
+                    since: Optional[str] = Query(None, description="next_token прошлого ответа: вернуть только изменения")):
+    if since is not None and (user_service.decode_review_token(since) is None or include_archived):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"error": {"code": "INVALID_TOKEN",
+                              "message": "since must be a next_token and cannot be combined with include_archived"}}
+        )
+    try:
+        if since is not None:
+            changes = await user_service.get_review_changes(user_id, since)
+            if changes is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={"error": {"code": "INVALID_TOKEN",
+                                      "message": "token is no longer valid, re-read the full list"}}
+                )
+            return GetReviewResponse(user_id=user_id, **changes)
+        result = await user_service.get_review(user_id, include_archived)
+        return GetReviewResponse(user_id=user_id, **result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+def _sse_message(event: dict) -> str:
+    if event is OVERFLOW_EVENT:
+        return "event: OVERFLOW\ndata: {}\n\n"
+    payload = EventInfo(**event).model_dump_json()
+    event_id = user_service.encode_review_token(event["seq"], event["shard"])
+    return f"id: {event_id}\nevent: {event['event_type']}\ndata: {payload}\n\n"
+
+
+async def _review_stream(subscriber, backlog):
+    # Seqs are per shard: the last replayed one of each
+    replayed = {}
     try:
-        pull_requests = await user_service.get_review(user_id)
-        return GetReviewResponse(
-            user_id=user_id,
-            pull_requests=pull_requests
+        yield ": connected\n\n"
+        for event in backlog:
+            if event is not OVERFLOW_EVENT:
+                replayed[event["shard"]] = event["seq"]
+            yield _sse_message(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscriber.queue.get(), REVIEW_STREAM_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            # Already replayed from the backlog
+            if event is not OVERFLOW_EVENT and event["seq"] <= replayed.get(event["shard"], 0):
+                continue
+            yield _sse_message(event)
+    finally:
+        review_hub.unsubscribe(subscriber)
+
+
+@router.get("/reviewStream", status_code=status.HTTP_200_OK,
+                  summary="SSE-поток событий назначения пользователя ревьювером",
+                  response_class=StreamingResponse,
+                  responses={200: {"content": {"text/event-stream": {}}}, 400: {"model": ErrorResponse},
+                             404: {"model": ErrorResponse}})
+async def reviewStream(user_id: str = Query(..., description="Идентификатор пользователя"),
+                       last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")):
+    if last_event_id is not None and user_service.decode_review_token(last_event_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"error": {"code": "INVALID_TOKEN", "message": "Last-Event-ID must be an id of this stream"}}
         )
+    try:
+        user = await user_service.get_user_by_string_id(user_id)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"error": {"code": "NOT_FOUND", "message": "user not found"}}
+            )
+        # Subscribe before reading the backlog so nothing falls in between
+        subscriber = await review_hub.subscribe(user_id)
+        backlog = []
+        if last_event_id is not None:
+            try:
+                backlog = await user_service.get_review_events(user_id, last_event_id, EVENTS_MAX_PAGE_SIZE)
+                if backlog is None:
+                    # Issued before the team moved: the client re-reads getReview
+                    backlog = [OVERFLOW_EVENT]
+            except Exception:
+                review_hub.unsubscribe(subscriber)
+                raise
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
+    return StreamingResponse(
+        _review_stream(subscriber, backlog),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
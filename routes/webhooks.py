@@ -0,0 +1,74 @@
+from fastapi import APIRouter, HTTPException, status, Query
+from schemas import (
+    WebhookCreateRequest, WebhookResponse, WebhookListResponse,
+    WebhookRemoveRequest, ErrorResponse
+)
+from services import webhooks as webhook_service
+
+
+router = APIRouter(prefix="/webhooks")
+
+
+@router.post("/add", status_code=status.HTTP_201_CREATED,
+                  summary="Зарегистрировать webhook для событий назначений команды",
+                  response_model=WebhookResponse,
+                  responses={404: {"model": ErrorResponse}})
+async def add(request: WebhookCreateRequest):
+    try:
+        webhook = await webhook_service.add_webhook(request.team_name, request.url)
+        return WebhookResponse(**webhook)
+    except ValueError as e:
+        if str(e) == "NOT_FOUND":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"error": {"code": "NOT_FOUND", "message": "team not found"}}
+            )
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/list", status_code=status.HTTP_200_OK,
+                 summary="Получить webhook'и команды",
+                 response_model=WebhookListResponse,
+                 responses={404: {"model": ErrorResponse}})
+async def list_(team_name: str = Query(..., description="Уникальное имя команды")):
+    try:
+        webhooks = await webhook_service.list_webhooks(team_name)
+        if webhooks is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"error": {"code": "NOT_FOUND", "message": "team not found"}}
+            )
+        return WebhookListResponse(team_name=team_name, webhooks=webhooks)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.post("/remove", status_code=status.HTTP_200_OK,
+                  summary="Удалить webhook вместе с недоставленными событиями",
+                  responses={404: {"model": ErrorResponse}})
+async def remove(request: WebhookRemoveRequest):
+    try:
+        removed = await webhook_service.remove_webhook(request.webhook_id)
+        if not removed:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"error": {"code": "NOT_FOUND", "message": "webhook not found"}}
+            )
+        return {"webhook_id": request.webhook_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
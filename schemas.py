@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
 from datetime import datetime
+from config import USERS_BATCH_MAX_SIZE
 
 
 class ErrorDetail(BaseModel):
@@ -48,6 +49,15 @@ class SetIsActiveRequest(BaseModel):
     is_active: bool
 
 
+class SetIsActiveBatchRequest(BaseModel):
+    users: List[SetIsActiveRequest] = Field(..., min_length=1, max_length=USERS_BATCH_MAX_SIZE)
+
+
+class SetIsActiveBatchResponse(BaseModel):
+    users: List[UserResponse]
+    not_found: List[str]
+
+
 class PullRequestShort(BaseModel):
     pull_request_id: str
     pull_request_name: str
@@ -83,6 +93,10 @@ class PullRequestMergeResponse(BaseModel):
     pr: PullRequestResponse
 
 
+class PullRequestGetResponse(BaseModel):
+    pr: PullRequestResponse
+
+
 class PullRequestReassignRequest(BaseModel):
     pull_request_id: str
     old_user_id: str
@@ -93,9 +107,23 @@ class PullRequestReassignResponse(BaseModel):
     replaced_by: str
 
 
+class PullRequestListItem(PullRequestShort):
+    createdAt: Optional[datetime] = None
+    mergedAt: Optional[datetime] = None
+
+
+class PullRequestListResponse(BaseModel):
+    pull_requests: List[PullRequestListItem]
+    next_cursor: Optional[str] = None
+
+
 class GetReviewResponse(BaseModel):
     user_id: str
     pull_requests: List[PullRequestShort]
+    # Pass as since= to get only the changes after this response
+    next_token: Optional[str] = None
+    # since= mode only: PRs that left the user's list
+    removed: List[str] = []
 
 
 class BulkDeactivateRequest(BaseModel):
@@ -113,3 +141,139 @@ class BulkDeactivateResponse(BaseModel):
     deactivated_users: List[str]
     reassignments: List[ReassignmentInfo]
 
+
+class TeamUpdateRequest(BaseModel):
+    team_name: str
+    add: List[TeamMember] = Field([], max_length=USERS_BATCH_MAX_SIZE)
+    update: List[TeamMember] = Field([], max_length=USERS_BATCH_MAX_SIZE)
+    remove: List[str] = Field([], max_length=USERS_BATCH_MAX_SIZE)
+    reassign_removed: bool = False
+
+
+class TeamUpdateResponse(BaseModel):
+    team_name: str
+    added: List[str]
+    updated: List[str]
+    removed: List[str]
+    reassignments: List[ReassignmentInfo]
+
+
+class ImportTeamRecord(BaseModel):
+    team_name: str = Field(..., min_length=1, max_length=50)
+
+
+class ImportUserRecord(BaseModel):
+    user_id: str = Field(..., min_length=1, max_length=50)
+    username: str = Field(..., min_length=1, max_length=50)
+    team_name: Optional[str] = Field(None, min_length=1, max_length=50)
+    is_active: bool = True
+
+
+class ImportPullRequestRecord(BaseModel):
+    pull_request_id: str = Field(..., min_length=1, max_length=50)
+    pull_request_name: str = Field(..., min_length=1, max_length=255)
+    author_id: str = Field(..., min_length=1, max_length=50)
+    isMerged: bool = False
+    createdAt: Optional[datetime] = None
+    mergedAt: Optional[datetime] = None
+
+
+class ImportReviewerRecord(BaseModel):
+    pull_request_id: str = Field(..., min_length=1, max_length=50)
+    reviewer_id: str = Field(..., min_length=1, max_length=50)
+
+
+class ImportReject(BaseModel):
+    line: int
+    code: str
+    message: str
+
+
+class ImportResponse(BaseModel):
+    teams: int
+    users: int
+    pull_requests: int
+    reviewers: int
+    rejected: int
+    rejects: List[ImportReject]
+
+
+class EventInfo(BaseModel):
+    # seq is per shard
+    seq: int
+    shard: int = 0
+    event_type: str
+    pull_request_id: Optional[str] = None
+    user_id: Optional[str] = None
+    old_user_id: Optional[str] = None
+    createdAt: datetime
+
+
+class EventsResponse(BaseModel):
+    events: List[EventInfo]
+    # The last seq; with several shards one per shard, comma-separated
+    next_after: Union[int, str]
+
+
+class WebhookCreateRequest(BaseModel):
+    team_name: str
+    url: str = Field(..., min_length=1, max_length=2048)
+
+
+class WebhookResponse(BaseModel):
+    webhook_id: int
+    team_name: str
+    url: str
+
+
+class WebhookListResponse(BaseModel):
+    team_name: str
+    webhooks: List[WebhookResponse]
+
+
+class WebhookRemoveRequest(BaseModel):
+    webhook_id: int
+
+
+class JobResponse(BaseModel):
+    job_id: int
+    job_type: str
+    status: str
+    team_name: str
+    total: int
+    processed: int
+    result: Optional[BulkDeactivateResponse] = None
+    error: Optional[str] = None
+
+
+class PrimaryTeamMismatch(BaseModel):
+    user_id: str
+    primary_team: Optional[str] = None
+    expected_team: Optional[str] = None
+
+
+class PrimaryTeamCheckResponse(BaseModel):
+    checked: int
+    mismatches: List[PrimaryTeamMismatch]
+    repaired: int
+
+
+class ShardMove(BaseModel):
+    team_name: str
+    from_shard: int
+    to_shard: int
+    # PLANNED (dry run), MOVED, IN_PLACE or why the team cannot move on its own:
+    # SHARED_MEMBERS, CROSS_TEAM_REVIEWS, HAS_WEBHOOKS, HAS_JOBS
+    status: str
+
+
+class ShardLeftover(BaseModel):
+    team_name: str
+    shard: int
+
+
+class RebalanceShardsResponse(BaseModel):
+    dry_run: bool
+    moves: List[ShardMove]
+    # Copies left on the old shard by interrupted moves
+    purged: List[ShardLeftover]
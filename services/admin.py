@@ -0,0 +1,440 @@
+from models.models import *
+from models.database import async_session_maker, SHARD_COUNT, shard_for_team
+from sqlalchemy import select, delete, exists, and_, or_, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import aliased
+from pydantic import ValidationError
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from schemas import (
+    ImportTeamRecord, ImportUserRecord,
+    ImportPullRequestRecord, ImportReviewerRecord
+)
+from services.teams import refresh_primary_teams
+from services.shards import directory, ShardMoving, DIRECTORY_CHUNK
+from services.reads import naive_utc
+from services import events as events_service
+from services.assignment import assignment_engine, bump_roster_versions
+from config import IMPORT_BATCH_SIZE, IMPORT_MAX_LINE_BYTES, IMPORT_MAX_REPORTED_REJECTS
+from contextlib import AsyncExitStack
+import json
+
+
+# Staging tables live only for the import transaction (ON COMMIT DROP)
+staging_metadata = MetaData()
+
+
+def _staging_table(name: str, *columns) -> Table:
+    return Table(
+        name, staging_metadata,
+        Column('line', Integer(), nullable=False),
+        *columns,
+        prefixes=['TEMPORARY'],
+        postgresql_on_commit='DROP'
+    )
+
+
+import_teams = _staging_table(
+    'import_teams',
+    Column('team_name', String(50), nullable=False)
+)
+import_users = _staging_table(
+    'import_users',
+    Column('user_id', String(50), nullable=False),
+    Column('username', String(50), nullable=False),
+    Column('team_name', String(50), nullable=True),
+    Column('is_active', Boolean(), nullable=False)
+)
+import_prs = _staging_table(
+    'import_prs',
+    Column('pull_request_id', String(50), nullable=False),
+    Column('name', String(255), nullable=False),
+    Column('author_id', String(50), nullable=False),
+    Column('is_merged', Boolean(), nullable=False),
+    Column('created_at', DateTime, nullable=True),
+    Column('merged_at', DateTime, nullable=True)
+)
+import_reviewers = _staging_table(
+    'import_reviewers',
+    Column('pull_request_id', String(50), nullable=False),
+    Column('reviewer_id', String(50), nullable=False)
+)
+
+# record "type" -> (schema, staging table)
+RECORD_TYPES = {
+    "team": (ImportTeamRecord, import_teams),
+    "user": (ImportUserRecord, import_users),
+    "pr": (ImportPullRequestRecord, import_prs),
+    "reviewer": (ImportReviewerRecord, import_reviewers),
+}
+
+
+class ImportReport:
+    """Merge counters plus a bounded list of rejected records"""
+
+    def __init__(self):
+        self.counts = {"teams": 0, "users": 0, "pull_requests": 0, "reviewers": 0}
+        self.rejected = 0
+        self.rejects: List[Dict] = []
+
+    def reject(self, line: int, code: str, message: str):
+        self.rejected += 1
+        if len(self.rejects) < IMPORT_MAX_REPORTED_REJECTS:
+            self.rejects.append({"line": line, "code": code, "message": message})
+
+    def as_dict(self) -> Dict:
+        return {
+            **self.counts,
+            "rejected": self.rejected,
+            "rejects": sorted(self.rejects, key=lambda r: r["line"])
+        }
+
+
+def _to_row(kind: str, record, line: int) -> Tuple:
+    if kind == "team":
+        return (line, record.team_name)
+    if kind == "user":
+        return (line, record.user_id, record.username, record.team_name, record.is_active)
+    if kind == "pr":
+        return (
+            line, record.pull_request_id, record.pull_request_name, record.author_id,
+            record.isMerged, naive_utc(record.createdAt), naive_utc(record.mergedAt)
+        )
+    return (line, record.pull_request_id, record.reviewer_id)
+
+
+def parse_record(raw: bytes) -> Tuple[str, object]:
+    """
+    Parse one NDJSON line into (type, validated record)
+    Raises ValueError with a short message for rejects
+    """
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        raise ValueError("malformed JSON")
+    if not isinstance(data, dict):
+        raise ValueError("record must be a JSON object")
+
+    kind = data.pop("type", None)
+    if kind not in RECORD_TYPES:
+        raise ValueError(f"unknown record type: {kind!r}")
+
+    schema, _ = RECORD_TYPES[kind]
+    try:
+        record = schema.model_validate(data)
+    except ValidationError as e:
+        error = e.errors()[0]
+        field = ".".join(str(part) for part in error["loc"])
+        raise ValueError(f"{field}: {error['msg']}")
+
+    if kind == "pr" and record.mergedAt is not None and not record.isMerged:
+        raise ValueError("mergedAt is set on a PR that is not merged")
+    return kind, record
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Optional[bytes]]:
+    """
+    Split a byte stream into lines without buffering more than one line
+    Yields None in place of a line longer than IMPORT_MAX_LINE_BYTES
+    """
+    buffer = b""
+    overflow = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield None if overflow else line
+            overflow = False
+        if len(buffer) > IMPORT_MAX_LINE_BYTES:
+            buffer = b""
+            overflow = True
+    if buffer or overflow:
+        yield None if overflow else buffer
+
+
+async def _copy_rows(driver_connection, table: Table, rows: List[Tuple]):
+    await driver_connection.copy_records_to_table(
+        table.name,
+        records=rows,
+        columns=[column.name for column in table.columns]
+    )
+
+
+async def _reject_staged(session, report: ImportReport, table: Table, condition, code: str, message: str):
+    """Report staged rows matching condition as rejects and drop them from staging"""
+    remaining = IMPORT_MAX_REPORTED_REJECTS - len(report.rejects)
+    if remaining > 0:
+        lines = await session.execute(
+            select(table.c.line).where(condition).order_by(table.c.line).limit(remaining)
+        )
+        for (line,) in lines.all():
+            report.rejects.append({"line": line, "code": code, "message": message})
+
+    result = await session.execute(delete(table).where(condition))
+    report.rejected += result.rowcount
+
+
+async def _merge_teams(session, report: ImportReport):
+    result = await session.execute(
+        insert(Team)
+        .from_select(['team_name'], select(import_teams.c.team_name).distinct())
+        .on_conflict_do_nothing(index_elements=['team_name'])
+    )
+    report.counts["teams"] += result.rowcount
+
+
+async def _merge_users(session, report: ImportReport):
+    await _reject_staged(
+        session, report, import_users,
+        and_(
+            import_users.c.team_name.isnot(None),
+            ~exists().where(Team.team_name == import_users.c.team_name)
+        ),
+        "NOT_FOUND", "team not found"
+    )
+
+    # Last record for a user wins, same as repeated /team/add calls
+    latest_users = (
+        select(import_users.c.user_id, import_users.c.username, import_users.c.is_active)
+        .distinct(import_users.c.user_id)
+        .order_by(import_users.c.user_id, import_users.c.line.desc())
+    )
+    upsert = insert(User).from_select(['user_id', 'name', 'isActive'], latest_users)
+    result = await session.execute(
+        upsert.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={"name": upsert.excluded.name, "isActive": upsert.excluded.isActive}
+        )
+    )
+    report.counts["users"] += result.rowcount
+
+    await session.execute(
+        insert(TeamMember)
+        .from_select(
+            ['team_id', 'member_id'],
+            select(Team.id, User.id)
+            .select_from(import_users)
+            .join(Team, Team.team_name == import_users.c.team_name)
+            .join(User, User.user_id == import_users.c.user_id)
+            .distinct()
+        )
+        .on_conflict_do_nothing()
+    )
+    imported_user_ids = select(User.id).join(import_users, import_users.c.user_id == User.user_id)
+    # A user may have joined an older team than their current primary one
+    await refresh_primary_teams(session, imported_user_ids)
+    # Other workers reload these rosters on their next pick
+    await bump_roster_versions(session, imported_user_ids)
+
+
+async def _merge_pull_requests(session, report: ImportReport):
+    earlier = aliased(import_prs)
+    await _reject_staged(
+        session, report, import_prs,
+        exists().where(
+            and_(
+                earlier.c.pull_request_id == import_prs.c.pull_request_id,
+                earlier.c.line < import_prs.c.line
+            )
+        ),
+        "DUPLICATE", "PR id repeated in upload"
+    )
+    await _reject_staged(
+        session, report, import_prs,
+        or_(
+            exists().where(PullRequest.pull_request_id == import_prs.c.pull_request_id),
+            exists().where(ArchivedPullRequest.pull_request_id == import_prs.c.pull_request_id)
+        ),
+        "PR_EXISTS", "PR id already exists"
+    )
+    await _reject_staged(
+        session, report, import_prs,
+        ~exists().where(User.user_id == import_prs.c.author_id),
+        "NOT_FOUND", "author not found"
+    )
+
+    result = await session.execute(
+        insert(PullRequest).from_select(
+            ['pull_request_id', 'name', 'author_id', 'isMerged', 'createdAt', 'mergedAt'],
+            select(
+                import_prs.c.pull_request_id,
+                import_prs.c.name,
+                User.id,
+                import_prs.c.is_merged,
+                func.coalesce(import_prs.c.created_at, func.timezone('UTC', func.now())),
+                import_prs.c.merged_at
+            )
+            .join(User, User.user_id == import_prs.c.author_id)
+        )
+    )
+    report.counts["pull_requests"] += result.rowcount
+
+
+async def _merge_reviewers(session, report: ImportReport):
+    await _reject_staged(
+        session, report, import_reviewers,
+        ~exists().where(PullRequest.pull_request_id == import_reviewers.c.pull_request_id),
+        "NOT_FOUND", "PR not found"
+    )
+    # Only PRs created by this upload take reviewers: staging keeps just the
+    # PR records that were merged, rejected ones (e.g. PR_EXISTS) are gone
+    await _reject_staged(
+        session, report, import_reviewers,
+        ~exists().where(import_prs.c.pull_request_id == import_reviewers.c.pull_request_id),
+        "PR_EXISTS", "PR not created by this import"
+    )
+    await _reject_staged(
+        session, report, import_reviewers,
+        ~exists().where(User.user_id == import_reviewers.c.reviewer_id),
+        "NOT_FOUND", "reviewer not found"
+    )
+    await _reject_staged(
+        session, report, import_reviewers,
+        exists()
+        .where(
+            and_(
+                PullRequest.pull_request_id == import_reviewers.c.pull_request_id,
+                User.user_id == import_reviewers.c.reviewer_id,
+                PullRequest.author_id == User.id
+            )
+        ),
+        "AUTHOR_REVIEWER", "author cannot review own PR"
+    )
+
+    result = await session.execute(
+        insert(Reviewers)
+        .from_select(
+            ['pr_id', 'reviewer_id'],
+            select(PullRequest.id, User.id)
+            .select_from(import_reviewers)
+            .join(PullRequest, PullRequest.pull_request_id == import_reviewers.c.pull_request_id)
+            .join(User, User.user_id == import_reviewers.c.reviewer_id)
+            .distinct()
+        )
+        .on_conflict_do_nothing()
+    )
+    report.counts["reviewers"] += result.rowcount
+    await events_service.record_review_changes_from(
+        session,
+        select(import_reviewers.c.reviewer_id, import_reviewers.c.pull_request_id).distinct()
+    )
+
+
+async def _route(kind: str, record, placed: Dict[str, Dict[str, int]]) -> int:
+    """
+    Shard a record is imported on: its team's for teams and members, its
+    author's for PRs, its PR's for reviewers. Ids placed earlier in the
+    upload are remembered in `placed`, the rest are looked up in the
+    directory, so a PR follows its author's record and a reviewer its PR's
+    """
+    if kind == "team" or (kind == "user" and record.team_name is not None):
+        team_name = record.team_name
+        if team_name not in placed["team"]:
+            entry = (await directory.fetch("team", [team_name])).get(team_name)
+            if entry is not None and entry[1]:
+                raise ShardMoving(f"team {team_name} is being moved to another shard")
+            placed["team"][team_name] = entry[0] if entry is not None else shard_for_team(team_name)
+        shard = placed["team"][team_name]
+    elif kind == "user":
+        shard = placed["user"].get(record.user_id)
+        if shard is None:
+            shard = await directory.shard_of("user", record.user_id)
+    elif kind == "pr":
+        shard = placed["user"].get(record.author_id)
+        if shard is None:
+            shard = await directory.shard_of("user", record.author_id)
+        placed["pr"][record.pull_request_id] = shard
+        return shard
+    else:
+        shard = placed["pr"].get(record.pull_request_id)
+        return shard if shard is not None else await directory.shard_of("pr", record.pull_request_id)
+
+    if kind == "user":
+        placed["user"][record.user_id] = shard
+    return shard
+
+
+async def _register_staged(session, report: ImportReport, shard: int):
+    """Claim the staged ids for the shard; users and PRs taken on another shard are rejected"""
+    for kind, table, column, code, message in (
+        # Routed by their directory entry, so a new name is never taken elsewhere
+        ("team", import_teams, import_teams.c.team_name, None, None),
+        ("user", import_users, import_users.c.user_id, "CROSS_SHARD_MEMBER", "user lives on another shard"),
+        ("pr", import_prs, import_prs.c.pull_request_id, "PR_EXISTS", "PR id already exists"),
+    ):
+        taken = []
+        result = await session.stream(select(column).distinct())
+        async for rows in result.partitions(DIRECTORY_CHUNK):
+            taken += await directory.register(kind, [row[0] for row in rows], shard)
+        if taken and code is not None:
+            await _reject_staged(session, report, table, column.in_(taken), code, message)
+
+
+async def _open_staging(session):
+    """Create the staging tables in the session's transaction; returns the driver connection for COPY"""
+    connection = await session.connection()
+    for table in staging_metadata.sorted_tables:
+        await connection.execute(CreateTable(table))
+    raw_connection = await connection.get_raw_connection()
+    return raw_connection.driver_connection
+
+
+async def import_records(chunks: AsyncIterator[bytes]) -> Dict:
+    """
+    POST /admin/import
+    Load teams, users, historical PRs and their reviewers from an NDJSON stream.
+    Records are COPY'd into temp tables in batches, then merged set-based in one
+    transaction; memory use is bounded by IMPORT_BATCH_SIZE, not upload size.
+    With several shards every record is staged on its shard (see _route) and
+    each shard is merged and committed in its own transaction
+    Returns merge counts and rejected records
+    """
+    report = ImportReport()
+    placed: Dict[str, Dict[str, int]] = {"team": {}, "user": {}, "pr": {}}
+
+    async with AsyncExitStack() as stack:
+        sessions, drivers = {}, {}
+        batches: Dict[Tuple[int, str], List[Tuple]] = {}
+        line_number = 0
+        async for raw in iter_lines(chunks):
+            line_number += 1
+            if raw is None:
+                report.reject(line_number, "INVALID_RECORD", "line too long")
+                continue
+            if not raw.strip():
+                continue
+            try:
+                kind, record = parse_record(raw)
+            except ValueError as e:
+                report.reject(line_number, "INVALID_RECORD", str(e))
+                continue
+
+            shard = await _route(kind, record, placed) if SHARD_COUNT > 1 else 0
+            if shard not in sessions:
+                sessions[shard] = await stack.enter_async_context(
+                    async_session_maker(shard if SHARD_COUNT > 1 else None)
+                )
+                drivers[shard] = await _open_staging(sessions[shard])
+            batch = batches.setdefault((shard, kind), [])
+            batch.append(_to_row(kind, record, line_number))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await _copy_rows(drivers[shard], RECORD_TYPES[kind][1], batch)
+                batch.clear()
+
+        for (shard, kind), batch in batches.items():
+            if batch:
+                await _copy_rows(drivers[shard], RECORD_TYPES[kind][1], batch)
+
+        for shard, session in sorted(sessions.items()):
+            if SHARD_COUNT > 1:
+                await _register_staged(session, report, shard)
+            await _merge_teams(session, report)
+            await _merge_users(session, report)
+            await _merge_pull_requests(session, report)
+            await _merge_reviewers(session, report)
+
+            await session.commit()
+    # Imported history changes loads too, not just memberships
+    assignment_engine.invalidate()
+
+    return report.as_dict()
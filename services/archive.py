@@ -0,0 +1,196 @@
+from models.models import *
+from models.database import async_session_maker, admin_lane, use_shard, SHARD_COUNT
+from sqlalchemy import select, insert, delete, and_, exists
+from sqlalchemy.orm import aliased
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from services import events as events_service
+from services.shards import routed
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_SECONDS
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+PR_COLUMNS = ['id', 'pull_request_id', 'name', 'author_id', 'isMerged', 'createdAt', 'mergedAt']
+
+
+@routed("pr", "pull_request_id")
+async def get_archived_pr(pull_request_id: str) -> Optional[ArchivedPullRequest]:
+    """Get an archived PR by string ID"""
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(ArchivedPullRequest).where(ArchivedPullRequest.pull_request_id == pull_request_id)
+        )
+        return result.scalar_one_or_none()
+
+
+@routed("pr", "pull_request_id")
+async def get_archived_pr_dict(pull_request_id: str) -> Optional[Dict]:
+    """Archived PR in the shape of the PullRequest schema (always MERGED)"""
+    async with async_session_maker() as session:
+        author = aliased(User)
+        result = await session.execute(
+            select(ArchivedPullRequest, author.user_id)
+            .join(author, author.id == ArchivedPullRequest.author_id)
+            .where(ArchivedPullRequest.pull_request_id == pull_request_id)
+        )
+        row = result.first()
+        if not row:
+            return None
+        pr, author_id = row
+
+        reviewers = await session.execute(
+            select(User.user_id)
+            .join(ArchivedReviewer, ArchivedReviewer.reviewer_id == User.id)
+            .where(ArchivedReviewer.pr_id == pr.id)
+        )
+        return {
+            "pull_request_id": pr.pull_request_id,
+            "pull_request_name": pr.name,
+            "author_id": author_id,
+            "status": "MERGED",
+            "assigned_reviewers": [row[0] for row in reviewers.all()],
+            "createdAt": pr.createdAt,
+            "mergedAt": pr.mergedAt
+        }
+
+
+async def get_archived_reviews(session, reviewer_id: int) -> List[Dict]:
+    """Archived PRs reviewed by the user, as PullRequestShort dicts"""
+    author = aliased(User)
+    result = await session.execute(
+        select(ArchivedPullRequest.pull_request_id, ArchivedPullRequest.name, author.user_id)
+        .join(ArchivedReviewer, ArchivedReviewer.pr_id == ArchivedPullRequest.id)
+        .join(author, author.id == ArchivedPullRequest.author_id)
+        .where(ArchivedReviewer.reviewer_id == reviewer_id)
+        .order_by(ArchivedPullRequest.id)
+    )
+    return [
+        {
+            "pull_request_id": pull_request_id,
+            "pull_request_name": name,
+            "author_id": author_id,
+            "status": "MERGED"
+        }
+        for pull_request_id, name, author_id in result.all()
+    ]
+
+
+async def archive_batch(cutoff: datetime, limit: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move up to `limit` PRs merged before cutoff, with their reviewer rows, to
+    the archive tables in one short transaction. Rows locked by a concurrent
+    writer are skipped rather than waited for, so the batch never queues
+    behind the hot path. Returns the number of PRs moved
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(PullRequest.id)
+            .where(
+                and_(
+                    PullRequest.isMerged == True,
+                    PullRequest.mergedAt < cutoff,
+                    # Still referenced by a bulk-deactivation job report
+                    ~exists().where(JobReassignment.pr_id == PullRequest.id)
+                )
+            )
+            .order_by(PullRequest.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        pr_ids = [row[0] for row in result.all()]
+        if not pr_ids:
+            return 0
+
+        await session.execute(
+            insert(ArchivedPullRequest).from_select(
+                PR_COLUMNS,
+                select(*(getattr(PullRequest, column) for column in PR_COLUMNS))
+                .where(PullRequest.id.in_(pr_ids))
+            )
+        )
+        await session.execute(
+            insert(ArchivedReviewer).from_select(
+                ['pr_id', 'reviewer_id'],
+                select(Reviewers.pr_id, Reviewers.reviewer_id)
+                .where(Reviewers.pr_id.in_(pr_ids))
+            )
+        )
+        # Archived PRs leave the reviewers' hot lists
+        await events_service.record_review_changes_from(
+            session,
+            select(User.user_id, PullRequest.pull_request_id)
+            .select_from(Reviewers)
+            .join(User, User.id == Reviewers.reviewer_id)
+            .join(PullRequest, PullRequest.id == Reviewers.pr_id)
+            .where(Reviewers.pr_id.in_(pr_ids))
+        )
+        await session.execute(delete(Reviewers).where(Reviewers.pr_id.in_(pr_ids)))
+        await session.execute(delete(PullRequest).where(PullRequest.id.in_(pr_ids)))
+        await session.commit()
+        return len(pr_ids)
+
+
+class PRArchiver:
+    """
+    Background retention: periodically drains merged PRs older than
+    ARCHIVE_AFTER_DAYS into the archive, batch by batch, in the admin lane
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.last_run: Optional[datetime] = None
+
+    async def run_once(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        moved = 0
+        async with admin_lane.enter(bounded_wait=False):
+            for shard in range(SHARD_COUNT):
+                with use_shard(shard):
+                    while True:
+                        batch = await archive_batch(cutoff, ARCHIVE_BATCH_SIZE)
+                        moved += batch
+                        self.archived += batch
+                        if batch < ARCHIVE_BATCH_SIZE:
+                            break
+                        # Let hot-path work in between batches
+                        await asyncio.sleep(0)
+        self.last_run = datetime.utcnow()
+        return moved
+
+    async def _run(self):
+        while True:
+            try:
+                moved = await self.run_once()
+                if moved:
+                    logger.info("archived %d merged PRs", moved)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("archive round failed")
+            await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "archived": self.archived,
+            "last_run": self.last_run.isoformat() if self.last_run else None
+        }
+
+
+archiver = PRArchiver()
@@ -0,0 +1,295 @@
+from models.models import *
+from models.database import async_session_maker, current_shard, use_shard, SHARD_COUNT
+from sqlalchemy import select, update, and_, or_, func, bindparam
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from config import ASSIGNMENT_ROSTER_TTL_SECONDS
+import heapq
+import time
+
+
+class Roster:
+    """
+    A team's members in parallel arrays: internal id, string id, active flag
+    and open-review load. Active members sit in a min-heap keyed by
+    (load, position), so the least loaded reviewer is found in O(log n).
+    Heap entries are never updated in place: a changed member gets a fresh
+    entry and outdated ones are dropped when popped
+    """
+
+    __slots__ = ("team_id", "version", "loaded_at", "ids", "user_ids", "active", "load",
+                 "positions", "_heap")
+
+    def __init__(self, team_id: int, version: int, members: List[Tuple[int, str, bool, int]]):
+        self.team_id = team_id
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.ids = array('q', (member[0] for member in members))
+        self.user_ids = [member[1] for member in members]
+        self.active = bytearray(bool(member[2]) for member in members)
+        self.load = array('l', (member[3] for member in members))
+        self.positions = {member_id: pos for pos, member_id in enumerate(self.ids)}
+        self._rebuild()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _rebuild(self):
+        self._heap = [(self.load[pos], pos) for pos in range(len(self.ids)) if self.active[pos]]
+        heapq.heapify(self._heap)
+
+    def _push(self, pos: int):
+        if not self.active[pos]:
+            return
+        heapq.heappush(self._heap, (self.load[pos], pos))
+        if len(self._heap) > 4 * len(self.ids) + 16:
+            self._rebuild()
+
+    def pick(self, count: int, exclude: Set[int]) -> List[int]:
+        """Positions of up to `count` least loaded active members not in exclude; their load is taken"""
+        heap = self._heap
+        picked: List[int] = []
+        skipped = []
+        seen = set()
+        while heap and len(picked) < count:
+            load, pos = heapq.heappop(heap)
+            if pos in seen or not self.active[pos] or load != self.load[pos]:
+                continue
+            seen.add(pos)
+            if self.ids[pos] in exclude:
+                skipped.append((load, pos))
+                continue
+            picked.append(pos)
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        for pos in picked:
+            self.load[pos] += 1
+            heapq.heappush(heap, (self.load[pos], pos))
+        return picked
+
+    def candidates(self, exclude: Set[int]) -> List[int]:
+        """All active members not in exclude, least loaded first"""
+        return [
+            self.ids[pos]
+            for _, pos in sorted(
+                (self.load[pos], pos) for pos in range(len(self.ids))
+                if self.active[pos] and self.ids[pos] not in exclude
+            )
+        ]
+
+    def add_load(self, pos: int, delta: int):
+        self.load[pos] = max(0, self.load[pos] + delta)
+        self._push(pos)
+
+    def set_active(self, pos: int, is_active: bool):
+        was_active = self.active[pos]
+        self.active[pos] = is_active
+        if is_active and not was_active:
+            self._push(pos)
+
+
+def _open_load(user_id_column):
+    return (
+        select(func.count())
+        .select_from(Reviewers)
+        .join(PullRequest, PullRequest.id == Reviewers.pr_id)
+        .where(and_(Reviewers.reviewer_id == user_id_column, PullRequest.isMerged == False))
+        .scalar_subquery()
+    )
+
+
+def _roster_query():
+    return (
+        select(Team.id, Team.roster_version, User.id, User.user_id, User.isActive, _open_load(User.id))
+        .select_from(Team)
+        .outerjoin(TeamMember, TeamMember.team_id == Team.id)
+        .outerjoin(User, User.id == TeamMember.member_id)
+        .order_by(Team.id, User.id)
+    )
+
+
+async def bump_roster_versions(session, member_ids, team_ids: Iterable[int] = ()) -> Dict[int, int]:
+    """
+    Bump roster_version of every team of the given members (plus team_ids,
+    e.g. a team that just lost members) in the caller's transaction.
+    Returns {team_id: new_version} for AssignmentEngine.apply_versions
+    """
+    condition = Team.id.in_(select(TeamMember.team_id).where(TeamMember.member_id.in_(member_ids)))
+    team_ids = list(team_ids)
+    if team_ids:
+        condition = or_(condition, Team.id.in_(team_ids))
+    result = await session.execute(
+        update(Team)
+        .where(condition)
+        .values(roster_version=Team.roster_version + 1)
+        .returning(Team.id, Team.roster_version)
+    )
+    return dict(result.all())
+
+
+# Core statement, so a list of parameter sets runs as one executemany.
+# Parameter names differ from the columns, which update() reserves for SET
+_reviewers = Reviewers.__table__
+REPLACE_REVIEWER = (
+    update(_reviewers)
+    .where(and_(_reviewers.c.pr_id == bindparam("pr"), _reviewers.c.reviewer_id == bindparam("old_reviewer")))
+    .values(reviewer_id=bindparam("new_reviewer"))
+)
+
+
+async def lock_candidates(session, candidate_ids: List[int]) -> List[int]:
+    """
+    Of the given candidates (in order), the ones still active, share-locked
+    until the caller's commit so they cannot be deactivated under it.
+    Members being deactivated right now are skipped instead of waited for
+    """
+    if not candidate_ids:
+        return []
+    result = await session.execute(
+        select(User.id)
+        .where(and_(User.id.in_(candidate_ids), User.isActive == True))
+        .with_for_update(read=True, skip_locked=True)
+    )
+    locked = set(result.scalars().all())
+    return [candidate_id for candidate_id in candidate_ids if candidate_id in locked]
+
+
+class AssignmentEngine:
+    """
+    Picks reviewers from in-memory team rosters instead of querying the DB.
+    The DB stays the source of truth: callers pass the team's roster_version
+    read with the user row, and a roster that does not match it (another
+    worker changed the team) or is older than the TTL is reloaded first.
+    Load counts are advisory and only steer the choice. Team and user ids
+    are per shard, so each shard has its own maps, picked by the current one
+    """
+
+    def __init__(self):
+        self._shards: List[Tuple[Dict[int, Roster], Dict[int, List[Roster]]]] = [
+            ({}, {}) for _ in range(SHARD_COUNT)
+        ]
+        self.picks = 0
+        self.reloads = 0
+        self.version_mismatches = 0
+
+    @property
+    def _rosters(self) -> Dict[int, Roster]:
+        return self._shards[current_shard.get()][0]
+
+    @property
+    def _memberships(self) -> Dict[int, List[Roster]]:
+        return self._shards[current_shard.get()][1]
+
+    def _install(self, roster: Roster):
+        self._drop(roster.team_id)
+        self._rosters[roster.team_id] = roster
+        for member_id in roster.ids:
+            self._memberships.setdefault(member_id, []).append(roster)
+
+    def _drop(self, team_id: int):
+        roster = self._rosters.pop(team_id, None)
+        if roster is None:
+            return
+        for member_id in roster.ids:
+            rosters = self._memberships.get(member_id)
+            if rosters is None:
+                continue
+            rosters.remove(roster)
+            if not rosters:
+                del self._memberships[member_id]
+
+    @staticmethod
+    def _build(rows) -> List[Roster]:
+        rosters = []
+        current_team, version, members = None, 0, []
+        for team_id, team_version, member_id, user_id, is_active, load in rows:
+            if team_id != current_team:
+                if current_team is not None:
+                    rosters.append(Roster(current_team, version, members))
+                current_team, version, members = team_id, team_version, []
+            if member_id is not None:
+                members.append((member_id, user_id, is_active, load))
+        if current_team is not None:
+            rosters.append(Roster(current_team, version, members))
+        return rosters
+
+    async def load_all(self) -> int:
+        """Warm the rosters of all teams (at startup)"""
+        loaded = 0
+        for shard in range(SHARD_COUNT):
+            with use_shard(shard):
+                async with async_session_maker() as session:
+                    result = await session.execute(_roster_query())
+                    rosters = self._build(result.all())
+                for roster in rosters:
+                    self._install(roster)
+            loaded += len(rosters)
+        return loaded
+
+    async def _roster(self, session, team_id: int, version: Optional[int]) -> Roster:
+        roster = self._rosters.get(team_id)
+        if roster is not None and version is not None and roster.version != version:
+            self.version_mismatches += 1
+            roster = None
+        if roster is not None and time.monotonic() - roster.loaded_at > ASSIGNMENT_ROSTER_TTL_SECONDS:
+            roster = None
+        if roster is None:
+            self.reloads += 1
+            result = await session.execute(_roster_query().where(Team.id == team_id))
+            rosters = self._build(result.all())
+            roster = rosters[0] if rosters else Roster(team_id, version or 0, [])
+            self._install(roster)
+        return roster
+
+    async def pick(self, session, team_id: int, version: Optional[int], count: int,
+                   exclude: Set[int]) -> List[Tuple[int, str]]:
+        """Up to `count` (id, user_id) of the least loaded active members not in exclude"""
+        roster = await self._roster(session, team_id, version)
+        self.picks += 1
+        return [(roster.ids[pos], roster.user_ids[pos]) for pos in roster.pick(count, exclude)]
+
+    async def candidates(self, session, team_id: int, version: Optional[int],
+                         exclude: Set[int]) -> List[int]:
+        roster = await self._roster(session, team_id, version)
+        return roster.candidates(exclude)
+
+    def adjust_load(self, member_ids: Iterable[int], delta: int):
+        for member_id in member_ids:
+            for roster in self._memberships.get(member_id, ()):
+                roster.add_load(roster.positions[member_id], delta)
+
+    def apply_versions(self, versions: Dict[int, int], active: Optional[Dict[int, bool]] = None):
+        """
+        Apply a committed change to cached rosters. A roster exactly one version
+        behind is patched in place; anything else means we missed a change
+        made elsewhere, so the roster is dropped and reloaded on next use
+        """
+        for team_id, version in versions.items():
+            roster = self._rosters.get(team_id)
+            if roster is None:
+                continue
+            if active is None or roster.version != version - 1:
+                self._drop(team_id)
+                continue
+            for member_id, is_active in active.items():
+                pos = roster.positions.get(member_id)
+                if pos is not None:
+                    roster.set_active(pos, is_active)
+            roster.version = version
+
+    def invalidate(self):
+        for rosters, memberships in self._shards:
+            rosters.clear()
+            memberships.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "rosters": sum(len(rosters) for rosters, _ in self._shards),
+            "members": sum(len(roster) for rosters, _ in self._shards for roster in rosters.values()),
+            "picks": self.picks,
+            "reloads": self.reloads,
+            "version_mismatches": self.version_mismatches
+        }
+
+
+assignment_engine = AssignmentEngine()
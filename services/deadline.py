@@ -0,0 +1,86 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from contextvars import ContextVar
+from typing import Optional
+import time
+
+
+# Postgres codes for statement_timeout and lock_timeout
+QUERY_CANCELED = "57014"
+LOCK_NOT_AVAILABLE = "55P03"
+
+# Re-apply the timeout once the budget has shrunk by this much since the
+# last SET, so a request overshoots its deadline by at most this margin
+RESET_SLACK_MS = 100
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the next statement"""
+
+
+class Deadline:
+    __slots__ = ("timeout", "expires_at", "expired")
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self.expired = False
+
+    def remaining_ms(self) -> int:
+        return int((self.expires_at - time.monotonic()) * 1000)
+
+
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+def _apply_timeouts(session, connection, remaining_ms: int):
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {remaining_ms}")
+        connection.exec_driver_sql(f"SET LOCAL lock_timeout = {remaining_ms}")
+    session.info["statement_timeout_ms"] = remaining_ms
+
+
+def _check(deadline: Deadline) -> int:
+    remaining_ms = deadline.remaining_ms()
+    if remaining_ms <= 0:
+        deadline.expired = True
+        raise DeadlineExceeded(f"request deadline of {deadline.timeout:g}s exceeded")
+    return remaining_ms
+
+
+@event.listens_for(Session, "after_begin")
+def _after_begin(session, transaction, connection):
+    deadline = current_deadline.get()
+    if deadline is not None:
+        _apply_timeouts(session, connection, _check(deadline))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("statement_timeout_ms", None)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _before_execute(orm_execute_state):
+    """Carry the remaining budget across the statements of one transaction"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return
+    remaining_ms = _check(deadline)
+    session = orm_execute_state.session
+    applied_ms = session.info.get("statement_timeout_ms")
+    if applied_ms is not None and applied_ms - remaining_ms > RESET_SLACK_MS:
+        _apply_timeouts(session, session.connection(), remaining_ms)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    deadline = current_deadline.get()
+    if deadline is None:
+        return
+    original = context.original_exception
+    sqlstate = getattr(original, "sqlstate", None) or getattr(original.__cause__, "sqlstate", None)
+    if sqlstate in (QUERY_CANCELED, LOCK_NOT_AVAILABLE):
+        deadline.expired = True
@@ -0,0 +1,335 @@
+from models.models import *
+from models.database import engine, shard_engines, async_session_maker, admin_lane, use_shard, current_shard, SHARD_COUNT
+from sqlalchemy import select, insert, delete, func, event, and_, or_, bindparam, Integer
+from sqlalchemy.orm import Session
+from typing import List, Dict, Optional, Tuple, Union
+from datetime import datetime, timedelta
+from config import EVENTS_POLL_INTERVAL_SECONDS, REVIEW_CHANGES_RETENTION_SECONDS, REVIEW_CHANGES_PURGE_INTERVAL_SECONDS
+import asyncio
+import heapq
+import itertools
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = "assignment_events"
+
+# Outbox writers hold this advisory lock from insert to commit, so seq order
+# matches commit order and a reader never skips a later-committed lower seq
+OUTBOX_LOCK_KEY = 0x0A55_1647
+
+
+class EventNotifier:
+    """Wakes long-polling readers when new events are committed"""
+
+    def __init__(self):
+        self._waiter: Optional[asyncio.Future] = None
+
+    def waiter(self) -> asyncio.Future:
+        if self._waiter is None or self._waiter.done():
+            self._waiter = asyncio.get_running_loop().create_future()
+        return self._waiter
+
+    def notify(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        self._waiter = None
+
+
+notifier = EventNotifier()
+# One LISTEN connection per shard
+_listener_connections: Dict[int, object] = {}
+
+
+def make_event(event_type: str, pull_request_id: Optional[str] = None,
+               user_id: Optional[str] = None, old_user_id: Optional[str] = None) -> Dict:
+    return {
+        "event_type": event_type,
+        "pull_request_id": pull_request_id,
+        "user_id": user_id,
+        "old_user_id": old_user_id
+    }
+
+
+async def record_events(session, events: List[Dict]):
+    """
+    Append events to the outbox in the caller's transaction.
+    Call right before commit: the outbox lock is held until the transaction ends
+    """
+    if not events:
+        return
+
+    await _lock_outbox(session)
+    if engine.dialect.name == "postgresql":
+        # Delivered to listeners on commit, collapsed to one per transaction
+        await session.execute(select(func.pg_notify(EVENTS_CHANNEL, "")))
+
+    await session.execute(insert(AssignmentEvent), events)
+    session.info.setdefault("events", []).extend(events)
+
+    # Assignments and reassignments change the reviewers' lists
+    changes = []
+    for item in events:
+        if item["event_type"] in ("ASSIGNED", "REASSIGNED"):
+            changes.append((item["user_id"], item["pull_request_id"]))
+        if item["event_type"] == "REASSIGNED" and item["old_user_id"]:
+            changes.append((item["old_user_id"], item["pull_request_id"]))
+    await record_review_changes(session, changes)
+
+
+async def _lock_outbox(session):
+    if engine.dialect.name == "postgresql":
+        await session.execute(select(func.pg_advisory_xact_lock(OUTBOX_LOCK_KEY)))
+
+
+async def record_review_changes(session, changes: List[Tuple[str, str]]):
+    """
+    Log (user_id, pull_request_id) pairs whose review list entry changed, in
+    the caller's transaction. Shares the outbox lock, so change seqs are
+    committed in order and a since= token never skips a late commit
+    """
+    if not changes:
+        return
+    await _lock_outbox(session)
+    await session.execute(
+        insert(ReviewChange),
+        [{"user_id": user_id, "pull_request_id": pull_request_id} for user_id, pull_request_id in changes]
+    )
+
+
+async def record_review_changes_from(session, query):
+    """Same as record_review_changes for a select of (user_id, pull_request_id) rows"""
+    await _lock_outbox(session)
+    await session.execute(insert(ReviewChange).from_select(['user_id', 'pull_request_id'], query))
+
+
+REVIEW_CHANGES_PURGE_BATCH_SIZE = 1000
+
+# Oldest rows first, and only below the first row still within retention:
+# the log stays a suffix, so its first seq tells which since= tokens are
+# complete. Without such a row the newest one is kept for the same reason
+_first_retained = select(func.min(ReviewChange.seq)).where(ReviewChange.created_at >= bindparam("cutoff"))
+PURGE_REVIEW_CHANGES = delete(ReviewChange).where(and_(
+    ReviewChange.seq.in_(
+        select(ReviewChange.seq).order_by(ReviewChange.seq).limit(bindparam("limit", type_=Integer))
+    ),
+    ReviewChange.seq < func.coalesce(
+        _first_retained.scalar_subquery(), select(func.max(ReviewChange.seq)).scalar_subquery()
+    )
+))
+
+
+class ReviewChangePurger:
+    """
+    Background retention of the getReview since= change log: drops changes
+    older than REVIEW_CHANGES_RETENTION_SECONDS, batch by batch, in the
+    admin lane. Tokens from before the oldest kept change get INVALID_TOKEN
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.purged = 0
+
+    async def purge_expired(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=REVIEW_CHANGES_RETENTION_SECONDS)
+        purged = 0
+        async with admin_lane.enter(bounded_wait=False):
+            for shard in range(SHARD_COUNT):
+                with use_shard(shard):
+                    while True:
+                        async with async_session_maker() as session:
+                            result = await session.execute(
+                                PURGE_REVIEW_CHANGES, {"cutoff": cutoff, "limit": REVIEW_CHANGES_PURGE_BATCH_SIZE}
+                            )
+                            await session.commit()
+                        purged += result.rowcount
+                        self.purged += result.rowcount
+                        if result.rowcount < REVIEW_CHANGES_PURGE_BATCH_SIZE:
+                            break
+                        await asyncio.sleep(0)
+        return purged
+
+    async def _run(self):
+        while True:
+            try:
+                await self.purge_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("review change purge failed")
+            await asyncio.sleep(REVIEW_CHANGES_PURGE_INTERVAL_SECONDS)
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict:
+        return {"purged": self.purged}
+
+
+review_change_purger = ReviewChangePurger()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    if session.info.pop("events", None):
+        notifier.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("events", None)
+
+
+async def get_last_seqs() -> List[int]:
+    """Last outbox seq of every shard"""
+    seqs = []
+    for shard in range(SHARD_COUNT):
+        async with async_session_maker(shard) as session:
+            result = await session.execute(select(func.max(AssignmentEvent.seq)))
+            seqs.append(result.scalar() or 0)
+    return seqs
+
+
+def encode_events_cursor(seqs: List[int]) -> Union[int, str]:
+    """next_after of /events: the last seq read, one per shard (comma-separated) with several shards"""
+    return seqs[0] if SHARD_COUNT == 1 else ",".join(str(seq) for seq in seqs)
+
+
+def decode_events_cursor(token: str) -> Optional[List[int]]:
+    """Per-shard seqs of an after= token ("0" starts every shard), None if it is malformed"""
+    parts = token.split(",")
+    if not all(part.isdigit() for part in parts):
+        return None
+    if parts == ["0"]:
+        return [0] * SHARD_COUNT
+    if len(parts) != SHARD_COUNT:
+        return None
+    return [int(part) for part in parts]
+
+
+def advance_cursor(after: List[int], events: List[Dict]) -> List[int]:
+    seqs = list(after)
+    for item in events:
+        seqs[item["shard"]] = item["seq"]
+    return seqs
+
+
+def event_to_dict(row: AssignmentEvent) -> Dict:
+    """Seqs are per shard: the event carries the shard it was read from"""
+    return {
+        "seq": row.seq,
+        "shard": current_shard.get(),
+        "event_type": row.event_type,
+        "pull_request_id": row.pull_request_id,
+        "user_id": row.user_id,
+        "old_user_id": row.old_user_id,
+        "createdAt": row.createdAt
+    }
+
+
+async def get_user_events(user_id: str, after: int, limit: int) -> List[Dict]:
+    """
+    Events after seq that concern user_id, for resuming a review stream.
+    Read from the current shard: call it on the user's one
+    """
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(AssignmentEvent)
+            .where(
+                and_(
+                    AssignmentEvent.seq > after,
+                    or_(AssignmentEvent.user_id == user_id, AssignmentEvent.old_user_id == user_id)
+                )
+            )
+            .order_by(AssignmentEvent.seq)
+            .limit(limit)
+        )
+        return [event_to_dict(row) for row in result.scalars().all()]
+
+
+async def _read_events(shard: int, after: int, limit: int) -> List[Dict]:
+    with use_shard(shard):
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(AssignmentEvent)
+                .where(AssignmentEvent.seq > after)
+                .order_by(AssignmentEvent.seq)
+                .limit(limit)
+            )
+            return [event_to_dict(row) for row in result.scalars().all()]
+
+
+async def get_events(after: List[int], limit: int, timeout: float) -> List[Dict]:
+    """
+    GET /events
+    Return outbox events with seq > after[shard] of every shard; when there
+    are none yet, wait up to timeout seconds for a commit without holding a
+    DB connection. Shards are merged by createdAt, each one in seq order
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while True:
+        # Taken before the query so a commit in between still wakes us
+        waiter = notifier.waiter()
+
+        pages = await asyncio.gather(*(
+            _read_events(shard, seq, limit) for shard, seq in enumerate(after)
+        ))
+        # merge never reorders within a page, so every shard's cursor stays a prefix
+        events = list(itertools.islice(heapq.merge(*pages, key=lambda item: item["createdAt"]), limit))
+
+        remaining = deadline - loop.time()
+        if events or remaining <= 0:
+            return events
+
+        # Without LISTEN on every shard, commits from other workers are only seen by re-polling
+        if len(_listener_connections) < SHARD_COUNT:
+            remaining = min(remaining, EVENTS_POLL_INTERVAL_SECONDS)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), remaining)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _on_notify(connection, pid, channel, payload):
+    notifier.notify()
+
+
+def _on_listener_terminated(connection):
+    for shard, listener in list(_listener_connections.items()):
+        if listener[1] is connection:
+            del _listener_connections[shard]
+
+
+async def start_listener():
+    """LISTEN for outbox commits made by any worker on every shard (Postgres only)"""
+    if engine.dialect.name != "postgresql":
+        return
+
+    for shard, shard_engine in enumerate(shard_engines):
+        connection = await shard_engine.connect()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        await driver_connection.add_listener(EVENTS_CHANNEL, _on_notify)
+        driver_connection.add_termination_listener(_on_listener_terminated)
+        _listener_connections[shard] = (connection, driver_connection)
+
+
+async def stop_listener():
+    listeners = list(_listener_connections.values())
+    _listener_connections.clear()
+    for connection, driver_connection in listeners:
+        await driver_connection.remove_listener(EVENTS_CHANNEL, _on_notify)
+        await connection.close()
@@ -0,0 +1,113 @@
+from typing import Awaitable, Callable, Dict, List
+from models.database import current_shard, use_shard
+from services.deadline import Deadline, current_deadline
+from config import REQUEST_TIMEOUT_SECONDS
+import asyncio
+import contextvars
+
+
+class GroupCommit:
+    """
+    Write coalescer: concurrent calls are collected for up to `window`
+    seconds (or until `max_size` are waiting) and handed to `handler` as one
+    batch, which runs them in a single transaction. The handler returns one
+    result or exception per item, in order, and each caller gets its own.
+    A batch never mixes shards; while one is running the next one fills up,
+    so batches grow with commit latency
+    """
+
+    def __init__(self, name: str, handler: Callable[[List], Awaitable[List]],
+                 window: float, max_size: int):
+        self.name = name
+        self.handler = handler
+        self.window = window
+        self.max_size = max_size
+        self._pending: Dict[int, List] = {}
+        self._full: Dict[int, asyncio.Event] = {}
+        self._flushers: Dict[int, asyncio.Task] = {}
+        self.submitted = 0
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    async def submit(self, item):
+        shard = current_shard.get()
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(shard, [])
+        pending.append((item, future))
+        self.submitted += 1
+
+        full = self._full.setdefault(shard, asyncio.Event())
+        if len(pending) >= self.max_size:
+            full.set()
+        if shard not in self._flushers:
+            # Own context: the batch is not bound to the first caller's
+            # deadline, trace or cancellation
+            self._flushers[shard] = asyncio.create_task(
+                self._flush(shard), context=contextvars.Context()
+            )
+        return await future
+
+    async def _flush(self, shard: int):
+        pending = self._pending[shard]
+        full = self._full[shard]
+        try:
+            with use_shard(shard):
+                while pending:
+                    if len(pending) < self.max_size:
+                        try:
+                            await asyncio.wait_for(full.wait(), self.window)
+                        except asyncio.TimeoutError:
+                            pass
+                    full.clear()
+
+                    batch = [entry for entry in pending[:self.max_size] if not entry[1].done()]
+                    del pending[:self.max_size]
+                    if batch:
+                        await self._run(batch)
+        finally:
+            del self._flushers[shard]
+            # Cancelled at shutdown: nobody will pick these up
+            for _, future in pending:
+                future.cancel()
+            pending.clear()
+
+    async def _run(self, batch: List):
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        token = current_deadline.set(Deadline(REQUEST_TIMEOUT_SECONDS))
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            current_deadline.reset(token)
+
+        for (_, future), result in zip(batch, results):
+            # The caller may have gone away (client disconnect)
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def stop(self):
+        flushers = list(self._flushers.values())
+        for task in flushers:
+            task.cancel()
+        for task in flushers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "largest_batch": self.largest_batch,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": sum(len(pending) for pending in self._pending.values())
+        }
@@ -0,0 +1,219 @@
+from models.models import *
+from models.database import async_session_maker
+from services.deadline import current_deadline
+from sqlalchemy import select, update, delete, and_, or_
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta
+from config import (
+    IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_WAIT_SECONDS, IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+    REQUEST_TIMEOUT_MAX_SECONDS
+)
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+EXECUTE, REPLAY, MISMATCH, IN_PROGRESS = "execute", "replay", "mismatch", "in_progress"
+
+# How often a duplicate polls for a first execution running in another worker
+POLL_INTERVAL_SECONDS = 0.05
+PURGE_BATCH_SIZE = 1000
+
+
+class IdempotencyStore:
+    """
+    Outcomes of POST requests by Idempotency-Key in the idempotencykeys table.
+    The first request claims the key with a row whose status_code is NULL and
+    fills it in when done; a retry is answered from the row with one primary
+    key lookup. Duplicates arriving while the first one runs wait for it:
+    on a local future within this worker, by polling the row across workers.
+    A claim whose owner died expires at locked_until and can be taken over
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.executed = 0
+        self.replayed = 0
+        self.waited = 0
+        self.purged = 0
+
+    @staticmethod
+    def _lock_until(now: datetime) -> datetime:
+        deadline = current_deadline.get()
+        seconds = deadline.remaining_ms() / 1000 if deadline is not None else REQUEST_TIMEOUT_MAX_SECONDS
+        return now + timedelta(seconds=max(seconds, 0) + 1)
+
+    async def _lookup(self, key: str) -> Optional[IdempotencyKey]:
+        async with async_session_maker() as session:
+            return await session.get(IdempotencyKey, key)
+
+    async def _try_claim(self, key: str, request_hash: Optional[str]) -> bool:
+        now = datetime.utcnow()
+        values = {
+            "request_hash": request_hash,
+            "status_code": None,
+            "content_type": None,
+            "body": None,
+            "locked_until": self._lock_until(now),
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        }
+        async with async_session_maker() as session:
+            # Take over an expired outcome or an abandoned claim
+            result = await session.execute(
+                update(IdempotencyKey)
+                .where(
+                    and_(
+                        IdempotencyKey.key == key,
+                        or_(
+                            IdempotencyKey.expires_at < now,
+                            and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.locked_until < now)
+                        )
+                    )
+                )
+                .values(**values)
+            )
+            if result.rowcount == 0:
+                session.add(IdempotencyKey(key=key, **values))
+            try:
+                await session.commit()
+            except IntegrityError:
+                return False
+        return True
+
+    async def claim(self, key: str, request_hash: Optional[str]) -> Tuple[str, Optional[IdempotencyKey]]:
+        """
+        EXECUTE: the caller owns the key and must call complete() or release().
+        REPLAY: the stored outcome is returned. MISMATCH: the key was used with
+        another body. IN_PROGRESS: the first execution did not finish in time
+        """
+        loop = asyncio.get_running_loop()
+        waited_until = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.waited += 1
+                try:
+                    await asyncio.wait_for(asyncio.shield(inflight), waited_until - loop.time())
+                except asyncio.TimeoutError:
+                    return IN_PROGRESS, None
+                continue
+
+            record = await self._lookup(key)
+            now = datetime.utcnow()
+            live = record is not None and record.expires_at >= now
+            if live and record.status_code is not None:
+                if record.request_hash != request_hash:
+                    return MISMATCH, record
+                self.replayed += 1
+                return REPLAY, record
+            if live and record.locked_until >= now:
+                # Running in another worker
+                if record.request_hash != request_hash:
+                    return MISMATCH, record
+                if loop.time() >= waited_until:
+                    return IN_PROGRESS, None
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+                continue
+
+            if key in self._inflight:
+                continue
+            self._inflight[key] = loop.create_future()
+            try:
+                claimed = await self._try_claim(key, request_hash)
+            except BaseException:
+                self._finish(key)
+                raise
+            if claimed:
+                self.executed += 1
+                return EXECUTE, None
+            # Lost the race to another worker
+            self._finish(key)
+
+    def _finish(self, key: str):
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def complete(self, key: str, status_code: int, content_type: Optional[str], body: bytes):
+        token = current_deadline.set(None)
+        try:
+            async with async_session_maker() as session:
+                await session.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == key)
+                    .values(status_code=status_code, content_type=content_type, body=body, locked_until=None)
+                )
+                await session.commit()
+        finally:
+            current_deadline.reset(token)
+            self._finish(key)
+
+    async def release(self, key: str):
+        """Forget a claim whose request failed, so that a retry runs again"""
+        token = current_deadline.set(None)
+        try:
+            async with async_session_maker() as session:
+                await session.execute(
+                    delete(IdempotencyKey)
+                    .where(and_(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)))
+                )
+                await session.commit()
+        finally:
+            current_deadline.reset(token)
+            self._finish(key)
+
+    async def purge_expired(self) -> int:
+        purged = 0
+        while True:
+            async with async_session_maker() as session:
+                expired = (
+                    select(IdempotencyKey.key)
+                    .where(IdempotencyKey.expires_at < datetime.utcnow())
+                    .limit(PURGE_BATCH_SIZE)
+                )
+                result = await session.execute(
+                    delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired))
+                )
+                await session.commit()
+            purged += result.rowcount
+            self.purged += result.rowcount
+            if result.rowcount < PURGE_BATCH_SIZE:
+                return purged
+
+    async def _run(self):
+        while True:
+            try:
+                await self.purge_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("idempotency key purge failed")
+            await asyncio.sleep(IDEMPOTENCY_PURGE_INTERVAL_SECONDS)
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "waited": self.waited,
+            "in_flight": len(self._inflight),
+            "purged": self.purged
+        }
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,450 @@
+from models.models import *
+from models.database import async_session_maker, admin_lane, use_shard, SHARD_COUNT
+from services import events as events_service
+from services.teams import get_pr_reviewer_sets, pick_replacements
+from services.reads import fetch_team
+from services.deadline import current_deadline
+from services.assignment import assignment_engine, bump_roster_versions
+from services.pr_cache import pr_cache
+from services.retry import retry_on_conflict
+from services.shards import routed, shard_id, split_shard_id
+from sqlalchemy import select, update, and_, or_, func, tuple_, case
+from sqlalchemy.orm import aliased
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+from config import JOB_CHUNK_SIZE, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL_SECONDS
+import asyncio
+import logging
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+JOB_BULK_DEACTIVATE = "BULK_DEACTIVATE"
+ACTIVE_STATUSES = ("PENDING", "RUNNING")
+
+
+class JobLost(Exception):
+    """Lease expired and another worker took the job over"""
+
+
+@routed("team", "team_name")
+async def submit_bulk_deactivate(team_name: str) -> Dict:
+    """
+    POST /team/bulkDeactivateAsync
+    Queue a bulk deactivation on the team's shard and start it in the background
+    Returns the job in PENDING state
+    """
+    async with async_session_maker() as session:
+        team = await fetch_team(session, team_name)
+        if not team:
+            raise ValueError("NOT_FOUND")
+
+        job = Job(job_type=JOB_BULK_DEACTIVATE, team_name=team_name, status="PENDING",
+                  total=0, processed=0, cursor_pr_id=0, cursor_reviewer_id=0, attempts=0)
+        session.add(job)
+        await session.commit()
+
+    job_runner.launch(shard_id(job.id))
+    return _job_to_dict(job)
+
+
+def _job_to_dict(job: Job, result: Optional[Dict] = None) -> Dict:
+    return {
+        "job_id": shard_id(job.id),
+        "job_type": job.job_type,
+        "status": job.status,
+        "team_name": job.team_name,
+        "total": job.total,
+        "processed": job.processed,
+        "result": result,
+        "error": job.error
+    }
+
+
+async def get_job(job_id: int) -> Optional[Dict]:
+    """
+    GET /jobs/{job_id}
+    Progress of a job; once DONE, result holds the BulkDeactivateResponse payload
+    """
+    placement = split_shard_id(job_id)
+    if placement is None:
+        return None
+    shard, job_id = placement
+    with use_shard(shard):
+        return await _get_job(job_id)
+
+
+async def _get_job(job_id: int) -> Optional[Dict]:
+    async with async_session_maker() as session:
+        job = await session.get(Job, job_id)
+        if not job:
+            return None
+        if job.status != "DONE":
+            return _job_to_dict(job)
+
+        old_reviewer = aliased(User)
+        new_reviewer = aliased(User)
+        reassignments = await session.execute(
+            select(PullRequest.pull_request_id, old_reviewer.user_id, new_reviewer.user_id)
+            .select_from(JobReassignment)
+            .join(PullRequest, PullRequest.id == JobReassignment.pr_id)
+            .join(old_reviewer, old_reviewer.id == JobReassignment.old_reviewer_id)
+            .join(new_reviewer, new_reviewer.id == JobReassignment.new_reviewer_id)
+            .where(JobReassignment.job_id == job.id)
+            .order_by(JobReassignment.id)
+        )
+        return _job_to_dict(job, {
+            "team_name": job.team_name,
+            "deactivated_users": [user_id for _, user_id in job.deactivated_users or []],
+            "reassignments": [
+                {"pr_id": pr_id, "old_reviewer_id": old_id, "new_reviewer_id": new_id}
+                for pr_id, old_id, new_id in reassignments.all()
+            ]
+        })
+
+
+async def _claim(job_id: int, owner: str) -> bool:
+    now = datetime.utcnow()
+    async with async_session_maker() as session:
+        result = await session.execute(
+            update(Job)
+            .where(
+                and_(
+                    Job.id == job_id,
+                    Job.status.in_(ACTIVE_STATUSES),
+                    Job.attempts < JOB_MAX_ATTEMPTS,
+                    or_(Job.lease_until.is_(None), Job.lease_until < now)
+                )
+            )
+            .values(
+                lease_owner=owner,
+                lease_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                attempts=Job.attempts + 1
+            )
+        )
+        await session.commit()
+        return result.rowcount == 1
+
+
+async def _renew(session, job_id: int, owner: str) -> Job:
+    """
+    Extend the lease inside the chunk's transaction; the row lock it takes
+    keeps a competing claim out until this chunk commits
+    """
+    result = await session.execute(
+        update(Job)
+        .where(and_(Job.id == job_id, Job.lease_owner == owner))
+        .values(lease_until=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS))
+    )
+    if result.rowcount != 1:
+        raise JobLost()
+    return await session.get(Job, job_id)
+
+
+async def _release(job_id: int, owner: str, error: str):
+    """Give the job back for a retry, or fail it once attempts run out"""
+    async with async_session_maker() as session:
+        await session.execute(
+            update(Job)
+            .where(and_(Job.id == job_id, Job.lease_owner == owner))
+            .values(
+                status=case((Job.attempts >= JOB_MAX_ATTEMPTS, "FAILED"), else_=Job.status),
+                lease_until=None,
+                error=error[:255]
+            )
+        )
+        await session.commit()
+
+
+async def _deactivate_users(job_id: int, owner: str):
+    """Phase 1: deactivate the team in one short transaction"""
+    async with async_session_maker() as session:
+        job = await _renew(session, job_id, owner)
+        if job.status != "PENDING":
+            return
+
+        team = await fetch_team(session, job.team_name)
+        if not team:
+            job.status = "FAILED"
+            job.error = "NOT_FOUND"
+            await session.commit()
+            return
+
+        team_users = await session.execute(
+            select(User.id, User.user_id)
+            .join(TeamMember, User.id == TeamMember.member_id)
+            .where(
+                and_(
+                    TeamMember.team_id == team.id,
+                    User.isActive == True
+                )
+            )
+        )
+        active_users = [(user_id, user_string_id) for user_id, user_string_id in team_users.all()]
+        active_user_ids = [user_id for user_id, _ in active_users]
+
+        versions = {}
+        if active_user_ids:
+            await session.execute(
+                update(User)
+                .where(User.id.in_(active_user_ids))
+                .values(isActive=False)
+            )
+            versions = await bump_roster_versions(session, active_user_ids)
+            open_reviews = await session.execute(
+                select(func.count())
+                .select_from(Reviewers)
+                .join(PullRequest, Reviewers.pr_id == PullRequest.id)
+                .where(
+                    and_(
+                        Reviewers.reviewer_id.in_(active_user_ids),
+                        PullRequest.isMerged == False
+                    )
+                )
+            )
+            job.total = open_reviews.scalar()
+
+        job.deactivated_users = [list(user) for user in active_users]
+        job.status = "RUNNING"
+        await events_service.record_events(session, [
+            events_service.make_event("DEACTIVATED", user_id=user_string_id)
+            for _, user_string_id in active_users
+        ])
+        await session.commit()
+        assignment_engine.apply_versions(versions, {user_id: False for user_id in active_user_ids})
+
+
+def _open_reviews(deactivated_ids: List[int], cursor: Tuple[int, int]):
+    return (
+        select(
+            Reviewers.pr_id,
+            Reviewers.reviewer_id,
+            PullRequest.author_id,
+            PullRequest.pull_request_id
+        )
+        .join(PullRequest, Reviewers.pr_id == PullRequest.id)
+        .where(
+            and_(
+                Reviewers.reviewer_id.in_(deactivated_ids),
+                PullRequest.isMerged == False,
+                tuple_(Reviewers.pr_id, Reviewers.reviewer_id) > tuple_(*cursor)
+            )
+        )
+        .order_by(Reviewers.pr_id, Reviewers.reviewer_id)
+    )
+
+
+@retry_on_conflict
+async def _reassign_chunk(job_id: int, owner: str) -> bool:
+    """
+    Phase 2: reassign up to JOB_CHUNK_SIZE open reviews held by deactivated
+    users and advance the keyset cursor in the same commit, so a resumed job
+    continues exactly where the last commit left off.
+    Returns False once there is nothing left
+    """
+    async with async_session_maker() as session:
+        job = await _renew(session, job_id, owner)
+        if job.status != "RUNNING":
+            return False
+
+        deactivated_ids = [user_id for user_id, _ in job.deactivated_users or []]
+        chunk = []
+        rows = []
+        if deactivated_ids:
+            cursor = (job.cursor_pr_id, job.cursor_reviewer_id)
+            chunk = (await session.execute(_open_reviews(deactivated_ids, cursor).limit(JOB_CHUNK_SIZE))).all()
+        if chunk:
+            # Same lock order as /pullRequest/reassign and /team/bulkDeactivate:
+            # the chunk's PR rows in id order, then their reviewers, re-read
+            # under the lock (a concurrent reassign may have replaced some)
+            locked = await session.execute(
+                select(PullRequest.id)
+                .where(and_(PullRequest.id.in_({row[0] for row in chunk}), PullRequest.isMerged == False))
+                .order_by(PullRequest.id)
+                .with_for_update()
+            )
+            locked_ids = list(locked.scalars().all())
+            if locked_ids:
+                reread = await session.execute(
+                    _open_reviews(deactivated_ids, cursor)
+                    .where(and_(
+                        Reviewers.pr_id.in_(locked_ids),
+                        tuple_(Reviewers.pr_id, Reviewers.reviewer_id) <= tuple_(chunk[-1][0], chunk[-1][1])
+                    ))
+                    .with_for_update(of=Reviewers)
+                )
+                rows = reread.all()
+
+        if not chunk:
+            job.status = "DONE"
+            job.finishedAt = datetime.utcnow()
+            job.lease_owner = None
+            job.lease_until = None
+            await session.commit()
+            return False
+
+        team = await fetch_team(session, job.team_name)
+        candidate_ids = []
+        if team:
+            candidates = await session.execute(
+                select(User.id)
+                .join(TeamMember, User.id == TeamMember.member_id)
+                .where(
+                    and_(
+                        User.isActive == True,
+                        TeamMember.team_id == team.id,
+                        User.id.notin_(deactivated_ids)
+                    )
+                )
+            )
+            candidate_ids = [row[0] for row in candidates.all()]
+
+        replacements = []
+        if candidate_ids:
+            used = await session.execute(
+                select(JobReassignment.new_reviewer_id)
+                .where(JobReassignment.job_id == job.id)
+                .distinct()
+            )
+            existing_reviewers = await get_pr_reviewer_sets(session, {row[0] for row in rows})
+            replacements = pick_replacements(
+                rows, candidate_ids, {row[0] for row in used.all()}, existing_reviewers
+            )
+
+        if replacements:
+            for pr_id, old_reviewer_id, new_reviewer_id, _ in replacements:
+                await session.execute(
+                    update(Reviewers)
+                    .where(
+                        and_(
+                            Reviewers.pr_id == pr_id,
+                            Reviewers.reviewer_id == old_reviewer_id
+                        )
+                    )
+                    .values(reviewer_id=new_reviewer_id)
+                )
+            session.add_all([
+                JobReassignment(job_id=job.id, pr_id=pr_id,
+                                old_reviewer_id=old_reviewer_id, new_reviewer_id=new_reviewer_id)
+                for pr_id, old_reviewer_id, new_reviewer_id, _ in replacements
+            ])
+
+            string_ids = dict(job.deactivated_users)
+            new_ids = await session.execute(
+                select(User.id, User.user_id)
+                .where(User.id.in_({row[2] for row in replacements}))
+            )
+            string_ids.update(new_ids.all())
+            await events_service.record_events(session, [
+                events_service.make_event(
+                    "REASSIGNED", pr_string_id, string_ids[new_reviewer_id], string_ids[old_reviewer_id]
+                )
+                for _, old_reviewer_id, new_reviewer_id, pr_string_id in replacements
+            ])
+
+        job.cursor_pr_id, job.cursor_reviewer_id = chunk[-1][0], chunk[-1][1]
+        job.processed = job.processed + len(chunk)
+        await session.commit()
+        assignment_engine.adjust_load([row[1] for row in replacements], -1)
+        assignment_engine.adjust_load([row[2] for row in replacements], 1)
+        pr_cache.invalidate(row[3] for row in replacements)
+        return True
+
+
+async def _run_bulk_deactivate(job_id: int, owner: str):
+    await _deactivate_users(job_id, owner)
+    while await _reassign_chunk(job_id, owner):
+        pass
+
+
+class JobRunner:
+    """
+    Runs jobs as background tasks, each on its shard. Jobs whose lease
+    expired (worker died or was stopped) are picked up again by the
+    periodic scan of every shard
+    """
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        self._scan_task: Optional[asyncio.Task] = None
+
+    def launch(self, job_id: int):
+        """Run the job with this public (shard-qualified) id"""
+        task = asyncio.create_task(self._run_job(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_job(self, job_id: int):
+        # Launched from the submitting request; the job outlives its deadline
+        current_deadline.set(None)
+        # Jobs queue for the admin lane rather than fail: the client already has a 202
+        shard, job_id = split_shard_id(job_id)
+        async with admin_lane.enter(bounded_wait=False):
+            with use_shard(shard):
+                await self._run_claimed(job_id)
+
+    async def _run_claimed(self, job_id: int):
+        owner = str(uuid.uuid4())
+        if not await _claim(job_id, owner):
+            return
+        try:
+            await _run_bulk_deactivate(job_id, owner)
+        except JobLost:
+            logger.warning("job %s: lease lost, leaving it to the new owner", job_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("job %s failed", job_id)
+            await _release(job_id, owner, f"{type(e).__name__}: {e}")
+
+    async def resume_stale(self) -> int:
+        now = datetime.utcnow()
+        job_ids = []
+        for shard in range(SHARD_COUNT):
+            async with async_session_maker(shard) as session:
+                result = await session.execute(
+                    select(Job.id)
+                    .where(
+                        and_(
+                            Job.status.in_(ACTIVE_STATUSES),
+                            Job.attempts < JOB_MAX_ATTEMPTS,
+                            or_(Job.lease_until.is_(None), Job.lease_until < now)
+                        )
+                    )
+                )
+                job_ids += [shard_id(row[0], shard) for row in result.all()]
+        for job_id in job_ids:
+            self.launch(job_id)
+        return len(job_ids)
+
+    async def _scan(self):
+        while True:
+            try:
+                await self.resume_stale()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("job scan failed")
+            await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
+
+    async def start(self):
+        if self._scan_task is None or self._scan_task.done():
+            self._scan_task = asyncio.create_task(self._scan())
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        if self._scan_task is not None:
+            tasks.append(self._scan_task)
+            self._scan_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def wait_idle(self):
+        """Wait for the jobs launched by this worker to finish"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+job_runner = JobRunner()
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from config import PR_CACHE_ENABLED, PR_CACHE_SIZE, PR_CACHE_TTL_SECONDS
+import time
+
+
+class PullRequestCache:
+    """
+    Assembled PR payloads (PullRequestResponse dicts) by string id, LRU-bounded
+    to `size` entries. Writers of this process put the new payload after
+    their commit (create, merge, reassign) or drop it (bulk reassignments);
+    the TTL bounds how long a write by another process can go unnoticed.
+    A miss is filled only if no write happened since its read started, so a
+    slow reader never puts back a payload older than a concurrent write
+    """
+
+    def __init__(self, size: int = PR_CACHE_SIZE, ttl: float = PR_CACHE_TTL_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+        # Bumped by every write-through and invalidation
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_fills = 0
+
+    def get(self, pull_request_id: str) -> Optional[Dict]:
+        if not PR_CACHE_ENABLED:
+            return None
+        entry = self._entries.get(pull_request_id)
+        if entry is None or entry[1] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(pull_request_id)
+        self.hits += 1
+        return entry[0]
+
+    def epoch(self) -> int:
+        """Token of a read-through: pass it to fill() with the payload read"""
+        return self._epoch
+
+    def fill(self, pr: Dict, epoch: int):
+        if epoch != self._epoch:
+            self.stale_fills += 1
+            return
+        self._remember(pr)
+
+    def put(self, pr: Dict):
+        """Write-through of a payload just committed"""
+        self._epoch += 1
+        self._remember(pr)
+
+    def invalidate(self, pull_request_ids: Iterable[str]):
+        self._epoch += 1
+        for pull_request_id in pull_request_ids:
+            self._entries.pop(pull_request_id, None)
+
+    def _remember(self, pr: Dict):
+        if not PR_CACHE_ENABLED:
+            return
+        pull_request_id = pr["pull_request_id"]
+        self._entries.pop(pull_request_id, None)
+        while len(self._entries) >= self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._entries[pull_request_id] = (
+            {**pr, "assigned_reviewers": list(pr["assigned_reviewers"])},
+            time.monotonic() + self.ttl
+        )
+
+    def clear(self):
+        self._epoch += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": PR_CACHE_ENABLED,
+            "size": len(self._entries),
+            "capacity": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_fills": self.stale_fills
+        }
+
+
+pr_cache = PullRequestCache()
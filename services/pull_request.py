@@ -1,67 +1,194 @@
 from models.models import *
-from models.database import async_session_maker
-from sqlalchemy import select, update, and_
-from typing import Optional, Dict
+from models.database import async_session_maker, SHARD_COUNT
+from sqlalchemy import select, insert, update, and_, tuple_, union_all, bindparam, Integer, String
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from typing import Iterable, Optional, Dict, List, Set, Tuple
+from collections import Counter
 from datetime import datetime
+import asyncio
+import base64
+import json
+from services import events as events_service
+from services import archive as archive_service
+from services.reads import (
+    PullRequestRow, UserRow, fetch_pull_request, fetch_user, in_list, not_in_list, naive_utc
+)
+from services.assignment import assignment_engine, lock_candidates, REPLACE_REVIEWER
+from services.retry import retry_on_conflict
+from services.shards import directory, routed
+from services.group_commit import GroupCommit
+from services.single_flight import single_flight
+from services.pr_cache import pr_cache
+from config import (
+    ASSIGNMENT_ENGINE_ENABLED, PR_CREATE_BATCH_ENABLED, PR_CREATE_BATCH_WINDOW_SECONDS,
+    PR_CREATE_BATCH_MAX_SIZE
+)
 
 
-async def get_pr_by_string_id(pull_request_id: str) -> Optional[PullRequest]:
+# Statements of the create / merge / reassign paths, prebuilt (see services.reads)
+USER_WITH_ROSTER_VERSION = (
+    select(User, Team.roster_version)
+    .outerjoin(Team, Team.id == User.primary_team_id)
+    .where(User.user_id == bindparam("user_id"))
+)
+USER_STRING_ID = select(User.user_id).where(User.id == bindparam("id"))
+
+_TEAM_REVIEWERS = (
+    select(User.id, User.user_id)
+    .join(TeamMember, User.id == TeamMember.member_id)
+    .where(
+        and_(
+            User.isActive == True,
+            not_in_list(User.id, "exclude_ids"),
+            TeamMember.team_id == bindparam("team_id")
+        )
+    )
+)
+PICK_REVIEWERS = _TEAM_REVIEWERS.limit(bindparam("limit", type_=Integer))
+PICK_REVIEWERS_LOCKED = PICK_REVIEWERS.with_for_update(of=User, read=True, skip_locked=True)
+
+EXISTING_PR_IDS = (
+    select(PullRequest.pull_request_id)
+    .where(in_list(PullRequest.pull_request_id, "pull_request_ids", String))
+    .union_all(
+        select(ArchivedPullRequest.pull_request_id)
+        .where(in_list(ArchivedPullRequest.pull_request_id, "pull_request_ids", String))
+    )
+)
+AUTHORS = (
+    select(User.id, User.user_id, User.primary_team_id, Team.roster_version)
+    .outerjoin(Team, Team.id == User.primary_team_id)
+    .where(in_list(User.user_id, "user_ids", String))
+)
+
+# Only the merge that flips isMerged gets a row back: concurrent merges of
+# the same PR queue on the row lock and find it already merged
+MERGE_PR = (
+    update(PullRequest)
+    .where(and_(PullRequest.id == bindparam("pr_id"), PullRequest.isMerged == False))
+    .values(isMerged=True, mergedAt=bindparam("merged_at"))
+    .returning(PullRequest.mergedAt)
+)
+MERGED_AT = select(PullRequest.mergedAt).where(PullRequest.id == bindparam("pr_id"))
+PR_REVIEWERS = (
+    select(Reviewers.reviewer_id, User.user_id)
+    .join(User, User.id == Reviewers.reviewer_id)
+    .where(Reviewers.pr_id == bindparam("pr_id"))
+)
+PR_REVIEWER_IDS = select(Reviewers.reviewer_id).where(Reviewers.pr_id == bindparam("pr_id"))
+LOCK_PR = select(PullRequest.isMerged).where(PullRequest.id == bindparam("pr_id")).with_for_update()
+_author = aliased(User)
+PR_WITH_AUTHOR = (
+    select(
+        PullRequest.id, PullRequest.pull_request_id, PullRequest.name, _author.user_id,
+        PullRequest.isMerged, PullRequest.createdAt, PullRequest.mergedAt
+    )
+    .join(_author, _author.id == PullRequest.author_id)
+    .where(PullRequest.pull_request_id == bindparam("pull_request_id"))
+)
+
+
+@routed("pr", "pull_request_id")
+async def get_pr_by_string_id(pull_request_id: str) -> Optional[PullRequestRow]:
     """Get PR by string ID"""
     async with async_session_maker() as session:
-        result = await session.execute(
-            select(PullRequest).where(PullRequest.pull_request_id == pull_request_id)
-        )
-        return result.scalar_one_or_none()
+        return await fetch_pull_request(session, pull_request_id)
 
 
-async def get_user_by_string_id(user_id: str) -> Optional[User]:
+@routed("user", "user_id")
+async def get_user_by_string_id(user_id: str) -> Optional[UserRow]:
     """Get user by string ID"""
     async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.user_id == user_id)
-        )
-        return result.scalar_one_or_none()
+        return await fetch_user(session, user_id)
+
+
+async def get_user_with_roster_version(session, user_id: str) -> Optional[Tuple[User, Optional[int]]]:
+    """User by string ID together with the roster version of their primary team"""
+    result = await session.execute(USER_WITH_ROSTER_VERSION, {"user_id": user_id})
+    return result.first()
+
+
+async def _pick_reviewers_sql(session, team_id: int, exclude_ids: Set[int],
+                              limit: Optional[int], lock: bool = False) -> List[Tuple[int, str]]:
+    """
+    Reviewer selection in SQL, used when the assignment engine is disabled.
+    With lock, picked members are share-locked like lock_candidates does
+    """
+    params = {"team_id": team_id, "exclude_ids": list(exclude_ids)}
+    if limit is None:
+        query = _TEAM_REVIEWERS
+    else:
+        query = PICK_REVIEWERS_LOCKED if lock else PICK_REVIEWERS
+        params["limit"] = limit
+    result = await session.execute(query, params)
+    return [(row[0], row[1]) for row in result.all()]
+
+
+async def _lock_first_candidate(session, candidate_ids: List[int], chunk: int = 8) -> Optional[int]:
+    """The first (least loaded) candidate that lock_candidates lets us have"""
+    for start in range(0, len(candidate_ids), chunk):
+        locked = await lock_candidates(session, candidate_ids[start:start + chunk])
+        if locked:
+            return locked[0]
+    return None
 
 
 async def _get_user_string_id(session, user_id: int) -> str:
     """Helper to get user string ID from internal ID"""
-    result = await session.execute(
-        select(User.user_id).where(User.id == user_id)
-    )
+    result = await session.execute(USER_STRING_ID, {"id": user_id})
     row = result.first()
     return row[0] if row else ""
 
 
+def _pr_dict(pull_request_id: str, pull_request_name: str, author_id: str,
+             assigned_reviewers: List[str], created_at: datetime) -> Dict:
+    return {
+        "pull_request_id": pull_request_id,
+        "pull_request_name": pull_request_name,
+        "author_id": author_id,
+        "status": "OPEN",
+        "assigned_reviewers": assigned_reviewers,
+        "createdAt": created_at,
+        "mergedAt": None
+    }
+
+
+@routed("user", "author_id")
 async def create_pull_request(pull_request_id: str, pull_request_name: str, author_id: str) -> Dict:
     """
     POST /pullRequest/create
     Create a PR and automatically assign up to 2 reviewers from the author's team
     Returns PR object
     """
+    if PR_CREATE_BATCH_ENABLED:
+        return await create_batch.submit((pull_request_id, pull_request_name, author_id))
+    return await _create_pull_request(pull_request_id, pull_request_name, author_id)
+
+
+async def _create_pull_request(pull_request_id: str, pull_request_name: str, author_id: str) -> Dict:
     async with async_session_maker() as session:
         # Check if PR already exists
         existing_pr = await get_pr_by_string_id(pull_request_id)
-        if existing_pr:
+        if existing_pr or await archive_service.get_archived_pr(pull_request_id):
             raise ValueError("PR_EXISTS")
         
-        # Get author
-        author = await get_user_by_string_id(author_id)
-        if not author:
+        # Get author with their team's roster version
+        author_row = await get_user_with_roster_version(session, author_id)
+        if not author_row:
             raise ValueError("NOT_FOUND")
         
-        # Get author's team
-        author_team = await session.execute(
-            select(Team, TeamMember)
-            .join(TeamMember, Team.id == TeamMember.team_id)
-            .where(TeamMember.member_id == author.id)
-            .limit(1)
-        )
-        team_row = author_team.first()
+        author, roster_version = author_row
         
-        if not team_row:
+        # Author's team comes with the user row
+        if author.primary_team_id is None:
             raise ValueError("NOT_FOUND")
         
-        team, _ = team_row
+        team_id = author.primary_team_id
+        
+        # PR ids are unique across shards
+        if await directory.register("pr", [pull_request_id]):
+            raise ValueError("PR_EXISTS")
         
         # Create new PR
         new_pr = PullRequest(
@@ -74,51 +201,165 @@ async def create_pull_request(pull_request_id: str, pull_request_name: str, auth
         session.add(new_pr)
         await session.flush()
         
-        # Find available reviewers (active, not the author, in the same team, limit 2)
-        reviewers_query = (
-            select(User.id)
-            .join(TeamMember, User.id == TeamMember.member_id)
-            .where(
-                and_(
-                    User.isActive == True,
-                    User.id != author.id,
-                    TeamMember.team_id == team.id
-                )
-            )
-            .limit(2)
-        )
+        # Pick up to 2 reviewers (active, not the author, in the same team)
+        if ASSIGNMENT_ENGINE_ENABLED:
+            picked = await assignment_engine.pick(session, team_id, roster_version, 2, {author.id})
+        else:
+            picked = await _pick_reviewers_sql(session, team_id, {author.id}, 2)
         
-        reviewers_result = await session.execute(reviewers_query)
-        reviewer_ids = [row[0] for row in reviewers_result.all()]
+        assigned_reviewer_string_ids = [reviewer_string_id for _, reviewer_string_id in picked]
         
-        # Add reviewers
-        assigned_reviewer_string_ids = []
-        if reviewer_ids:
-            reviewers = [
+        try:
+            # Add reviewers
+            session.add_all([
                 Reviewers(pr_id=new_pr.id, reviewer_id=reviewer_id)
-                for reviewer_id in reviewer_ids
-            ]
-            session.add_all(reviewers)
-            
-            # Get string IDs for reviewers
-            for reviewer_id in reviewer_ids:
-                string_id = await _get_user_string_id(session, reviewer_id)
-                if string_id:
-                    assigned_reviewer_string_ids.append(string_id)
+                for reviewer_id, _ in picked
+            ])
+            await events_service.record_events(session, [
+                events_service.make_event("ASSIGNED", pull_request_id, reviewer_string_id)
+                for reviewer_string_id in assigned_reviewer_string_ids
+            ])
+            await session.commit()
+        except BaseException:
+            # The picked reviewers' load was taken in the roster: give it back
+            _release_picks([picked])
+            raise
         
-        await session.commit()
-        
-        return {
-            "pull_request_id": pull_request_id,
-            "pull_request_name": pull_request_name,
-            "author_id": author_id,
-            "status": "OPEN",
-            "assigned_reviewers": assigned_reviewer_string_ids,
-            "createdAt": new_pr.createdAt,
-            "mergedAt": None
+        pr = _pr_dict(pull_request_id, pull_request_name, author_id,
+                      assigned_reviewer_string_ids, new_pr.createdAt)
+        pr_cache.put(pr)
+        return pr
+
+
+def _release_picks(picks: Iterable[List[Tuple[int, str]]]):
+    """Give back the roster load taken by picks whose transaction did not commit"""
+    if ASSIGNMENT_ENGINE_ENABLED:
+        assignment_engine.adjust_load([reviewer_id for picked in picks for reviewer_id, _ in picked], -1)
+
+
+def _pick_spread(members: List[Tuple[int, str]], batch_load: Counter, author_id: int) -> List[Tuple[int, str]]:
+    """SQL fallback within a batch: the 2 members picked least so far in it"""
+    picked = sorted(
+        (member for member in members if member[0] != author_id),
+        key=lambda member: batch_load[member[0]]
+    )[:2]
+    batch_load.update(reviewer_id for reviewer_id, _ in picked)
+    return picked
+
+
+async def create_pull_requests(items: List[Tuple[str, str, str]]) -> List:
+    """
+    Create a batch of PRs (pull_request_id, name, author_id) of one shard in
+    one transaction, for create_batch: the checks and inserts are one
+    statement each for the whole batch, reviewers are picked in turn so the
+    batch's load is spread. Returns each item's PR dict or ValueError, in order.
+    If the batch hits a concurrent insert of the same id, items are retried
+    one by one
+    """
+    results: List = [None] * len(items)
+    pull_request_ids = [item[0] for item in items]
+
+    async with async_session_maker() as session:
+        existing = set((await session.execute(
+            EXISTING_PR_IDS, {"pull_request_ids": pull_request_ids}
+        )).scalars())
+        authors = {
+            row.user_id: row
+            for row in (await session.execute(
+                AUTHORS, {"user_ids": list({item[2] for item in items})}
+            )).all()
         }
 
+        accepted = []
+        for index, (pull_request_id, _, author_id) in enumerate(items):
+            author = authors.get(author_id)
+            if pull_request_id in existing:
+                results[index] = ValueError("PR_EXISTS")
+            elif author is None or author.primary_team_id is None:
+                results[index] = ValueError("NOT_FOUND")
+            else:
+                # A repeated id in the batch loses like a later request would
+                existing.add(pull_request_id)
+                accepted.append(index)
+
+        # PR ids are unique across shards
+        taken = set(await directory.register("pr", [items[index][0] for index in accepted]))
+        for index in accepted:
+            if items[index][0] in taken:
+                results[index] = ValueError("PR_EXISTS")
+        accepted = [index for index in accepted if results[index] is None]
+        if not accepted:
+            return results
+
+        created_at = datetime.utcnow()
+        picks: Dict[int, List[Tuple[int, str]]] = {}
+        try:
+            inserted = await session.execute(
+                insert(PullRequest).returning(PullRequest.pull_request_id, PullRequest.id),
+                [
+                    {"pull_request_id": items[index][0], "name": items[index][1],
+                     "author_id": authors[items[index][2]].id, "isMerged": False, "createdAt": created_at}
+                    for index in accepted
+                ]
+            )
+            pr_ids = dict(inserted.all())
+
+            team_members: Dict[int, List[Tuple[int, str]]] = {}
+            batch_load = Counter()
+            for index in accepted:
+                author = authors[items[index][2]]
+                team_id = author.primary_team_id
+                if ASSIGNMENT_ENGINE_ENABLED:
+                    picks[index] = await assignment_engine.pick(
+                        session, team_id, author.roster_version, 2, {author.id}
+                    )
+                else:
+                    if team_id not in team_members:
+                        team_members[team_id] = await _pick_reviewers_sql(session, team_id, set(), None)
+                    picks[index] = _pick_spread(team_members[team_id], batch_load, author.id)
 
+            reviewers = [
+                {"pr_id": pr_ids[items[index][0]], "reviewer_id": reviewer_id}
+                for index in accepted for reviewer_id, _ in picks[index]
+            ]
+            if reviewers:
+                await session.execute(insert(Reviewers), reviewers)
+            await events_service.record_events(session, [
+                events_service.make_event("ASSIGNED", items[index][0], reviewer_string_id)
+                for index in accepted for _, reviewer_string_id in picks[index]
+            ])
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            _release_picks(picks.values())
+            retry = accepted
+        except BaseException:
+            _release_picks(picks.values())
+            raise
+        else:
+            retry = []
+            for index in accepted:
+                pull_request_id, pull_request_name, author_id = items[index]
+                results[index] = _pr_dict(
+                    pull_request_id, pull_request_name, author_id,
+                    [reviewer_string_id for _, reviewer_string_id in picks[index]], created_at
+                )
+                pr_cache.put(results[index])
+
+    for index in retry:
+        try:
+            results[index] = await _create_pull_request(*items[index])
+        except Exception as e:
+            results[index] = e
+    return results
+
+
+create_batch = GroupCommit(
+    "pullRequest.create", create_pull_requests, PR_CREATE_BATCH_WINDOW_SECONDS, PR_CREATE_BATCH_MAX_SIZE
+)
+
+
+@routed("pr", "pull_request_id")
 async def merge_pull_request(pull_request_id: str) -> Optional[Dict]:
     """
     POST /pullRequest/merge
@@ -128,32 +369,35 @@ async def merge_pull_request(pull_request_id: str) -> Optional[Dict]:
     async with async_session_maker() as session:
         pr = await get_pr_by_string_id(pull_request_id)
         if not pr:
-            return None
+            # Archived PRs are merged by definition
+            return await archive_service.get_archived_pr_dict(pull_request_id)
         
         # Update PR
-        merged_at = datetime.utcnow() if not pr.isMerged else pr.mergedAt
-        await session.execute(
-            update(PullRequest)
-            .where(PullRequest.id == pr.id)
-            .values(isMerged=True, mergedAt=merged_at)
-        )
-        await session.commit()
-        
+        merged_at = (await session.execute(
+            MERGE_PR, {"pr_id": pr.id, "merged_at": datetime.utcnow()}
+        )).scalar()
+        merged_now = merged_at is not None
+        if not merged_now:
+            merged_at = (await session.execute(MERGED_AT, {"pr_id": pr.id})).scalar()
         # Get reviewers
-        reviewers_result = await session.execute(
-            select(Reviewers.reviewer_id)
-            .where(Reviewers.pr_id == pr.id)
-        )
-        reviewer_ids = [row[0] for row in reviewers_result.all()]
-        assigned_reviewers = []
-        for reviewer_id in reviewer_ids:
-            string_id = await _get_user_string_id(session, reviewer_id)
-            if string_id:
-                assigned_reviewers.append(string_id)
+        reviewers_result = await session.execute(PR_REVIEWERS, {"pr_id": pr.id})
+        reviewers = reviewers_result.all()
+        assigned_reviewers = [reviewer_string_id for _, reviewer_string_id in reviewers]
+        if merged_now:
+            await events_service.record_events(session, [
+                events_service.make_event("MERGED", pr.pull_request_id)
+            ])
+            # Status changed in every reviewer's list
+            await events_service.record_review_changes(session, [
+                (reviewer_string_id, pr.pull_request_id) for reviewer_string_id in assigned_reviewers
+            ])
+        await session.commit()
+        if merged_now:
+            assignment_engine.adjust_load([reviewer_id for reviewer_id, _ in reviewers], -1)
         
         author_string_id = await _get_user_string_id(session, pr.author_id)
         
-        return {
+        merged = {
             "pull_request_id": pr.pull_request_id,
             "pull_request_name": pr.name,
             "author_id": author_string_id,
@@ -162,8 +406,12 @@ async def merge_pull_request(pull_request_id: str) -> Optional[Dict]:
             "createdAt": pr.createdAt,
             "mergedAt": merged_at
         }
+        pr_cache.put(merged)
+        return merged
 
 
+@routed("pr", "pull_request_id")
+@retry_on_conflict
 async def reassign_reviewer(pull_request_id: str, old_user_id: str) -> Optional[Dict]:
     """
     POST /pullRequest/reassign
@@ -174,110 +422,302 @@ async def reassign_reviewer(pull_request_id: str, old_user_id: str) -> Optional[
         # Get PR
         pr = await get_pr_by_string_id(pull_request_id)
         if not pr:
+            if await archive_service.get_archived_pr(pull_request_id):
+                raise ValueError("PR_MERGED")
             raise ValueError("NOT_FOUND")
         
-        # Check if PR is merged
-        if pr.isMerged:
+        # Lock order of writers: PR row, then candidate users. Concurrent
+        # reassigns and bulk deactivations touching this PR queue here, so
+        # reviewers are read and changed by one transaction at a time
+        locked_pr = await session.execute(LOCK_PR, {"pr_id": pr.id})
+        is_merged = locked_pr.scalar_one_or_none()
+        
+        # Check if PR is merged (archived in the meantime means merged too)
+        if is_merged is None or is_merged:
             raise ValueError("PR_MERGED")
         
-        # Get old reviewer
-        old_reviewer = await get_user_by_string_id(old_user_id)
-        if not old_reviewer:
+        # Get old reviewer with their team's roster version
+        old_reviewer_row = await get_user_with_roster_version(session, old_user_id)
+        if not old_reviewer_row:
             raise ValueError("NOT_FOUND")
         
-        # Check if old reviewer is assigned to this PR
-        reviewer_check = await session.execute(
-            select(Reviewers)
-            .where(
-                and_(
-                    Reviewers.pr_id == pr.id,
-                    Reviewers.reviewer_id == old_reviewer.id
-                )
-            )
-        )
-        if not reviewer_check.first():
-            raise ValueError("NOT_ASSIGNED")
+        old_reviewer, roster_version = old_reviewer_row
         
-        # Get old reviewer's team
-        old_reviewer_team = await session.execute(
-            select(TeamMember.team_id)
-            .where(TeamMember.member_id == old_reviewer.id)
-            .limit(1)
-        )
-        team_row = old_reviewer_team.first()
+        # Existing reviewers of this PR; the old one must be among them
+        existing_reviewers = await session.execute(PR_REVIEWER_IDS, {"pr_id": pr.id})
+        existing_reviewer_ids = {row[0] for row in existing_reviewers.all()}
+        if old_reviewer.id not in existing_reviewer_ids:
+            raise ValueError("NOT_ASSIGNED")
         
-        if not team_row:
+        # Old reviewer's team comes with the user row
+        if old_reviewer.primary_team_id is None:
             raise ValueError("NOT_FOUND")
         
-        team_id = team_row[0]
-        
-        # Get existing reviewers for this PR
-        existing_reviewers = await session.execute(
-            select(Reviewers.reviewer_id)
-            .where(Reviewers.pr_id == pr.id)
-        )
-        existing_reviewer_ids = {row[0] for row in existing_reviewers.all()}
+        team_id = old_reviewer.primary_team_id
         
         # Find a candidate (active, not the old reviewer, not already a reviewer, in the same team)
-        candidate_query = (
-            select(User.id)
-            .join(TeamMember, User.id == TeamMember.member_id)
-            .where(
-                and_(
-                    User.isActive == True,
-                    User.id != old_reviewer.id,
-                    User.id.notin_(existing_reviewer_ids),
-                    TeamMember.team_id == team_id
-                )
-            )
-            .limit(1)
-        )
-        
-        candidate_result = await session.execute(candidate_query)
-        candidate_row = candidate_result.first()
+        exclude_ids = existing_reviewer_ids | {old_reviewer.id}
+        if ASSIGNMENT_ENGINE_ENABLED:
+            candidate_ids = await assignment_engine.candidates(session, team_id, roster_version, exclude_ids)
+            new_reviewer_id = await _lock_first_candidate(session, candidate_ids)
+            picked = [] if new_reviewer_id is None else [
+                (new_reviewer_id, await _get_user_string_id(session, new_reviewer_id))
+            ]
+        else:
+            picked = await _pick_reviewers_sql(session, team_id, exclude_ids, 1, lock=True)
         
-        if not candidate_row:
+        if not picked:
             raise ValueError("NO_CANDIDATE")
         
-        new_reviewer_id = candidate_row[0]
-        new_reviewer_string_id = await _get_user_string_id(session, new_reviewer_id)
+        new_reviewer_id, new_reviewer_string_id = picked[0]
         
         # Update the reviewer
-        await session.execute(
-            update(Reviewers)
-            .where(
-                and_(
-                    Reviewers.pr_id == pr.id,
-                    Reviewers.reviewer_id == old_reviewer.id
-                )
-            )
-            .values(reviewer_id=new_reviewer_id)
-        )
+        await session.execute(REPLACE_REVIEWER, {
+            "pr": pr.id, "old_reviewer": old_reviewer.id, "new_reviewer": new_reviewer_id
+        })
+        await events_service.record_events(session, [
+            events_service.make_event("REASSIGNED", pr.pull_request_id, new_reviewer_string_id, old_user_id)
+        ])
         await session.commit()
+        assignment_engine.adjust_load([old_reviewer.id], -1)
+        assignment_engine.adjust_load([new_reviewer_id], 1)
         
         # Get updated PR with reviewers
-        reviewers_result = await session.execute(
-            select(Reviewers.reviewer_id)
-            .where(Reviewers.pr_id == pr.id)
-        )
-        reviewer_ids = [row[0] for row in reviewers_result.all()]
-        assigned_reviewers = []
-        for reviewer_id in reviewer_ids:
-            string_id = await _get_user_string_id(session, reviewer_id)
-            if string_id:
-                assigned_reviewers.append(string_id)
+        reviewers_result = await session.execute(PR_REVIEWERS, {"pr_id": pr.id})
+        assigned_reviewers = [reviewer_string_id for _, reviewer_string_id in reviewers_result.all()]
         
         author_string_id = await _get_user_string_id(session, pr.author_id)
         
-        return {
-            "pr": {
-                "pull_request_id": pr.pull_request_id,
-                "pull_request_name": pr.name,
-                "author_id": author_string_id,
-                "status": "OPEN",
-                "assigned_reviewers": assigned_reviewers,
-                "createdAt": pr.createdAt,
-                "mergedAt": None
-            },
-            "replaced_by": new_reviewer_string_id
-        }
+        updated = _pr_dict(pr.pull_request_id, pr.name, author_string_id, assigned_reviewers, pr.createdAt)
+        pr_cache.put(updated)
+        return {"pr": updated, "replaced_by": new_reviewer_string_id}
+
+
+async def get_pull_request(pull_request_id: str) -> Optional[Dict]:
+    """
+    GET /pullRequest/get
+    PR with its reviewers, from pr_cache when it is there
+    Returns PR object or None if not found
+    """
+    cached = pr_cache.get(pull_request_id)
+    if cached is not None:
+        return cached
+    return await _load_pull_request(pull_request_id)
+
+
+@single_flight
+@routed("pr", "pull_request_id")
+async def _load_pull_request(pull_request_id: str) -> Optional[Dict]:
+    """Assemble the PR payload from the hot tables or the archive and fill pr_cache"""
+    epoch = pr_cache.epoch()
+    async with async_session_maker() as session:
+        row = (await session.execute(PR_WITH_AUTHOR, {"pull_request_id": pull_request_id})).first()
+        if row is None:
+            pr = await archive_service.get_archived_pr_dict(pull_request_id)
+        else:
+            reviewers = await session.execute(PR_REVIEWERS, {"pr_id": row.id})
+            pr = {
+                "pull_request_id": row.pull_request_id,
+                "pull_request_name": row.name,
+                "author_id": row.user_id,
+                "status": "MERGED" if row.isMerged else "OPEN",
+                "assigned_reviewers": [reviewer_string_id for _, reviewer_string_id in reviewers.all()],
+                "createdAt": row.createdAt,
+                "mergedAt": row.mergedAt
+            }
+    if pr is not None:
+        pr_cache.fill(pr, epoch)
+    return pr
+
+
+def encode_cursor(sort_value: Optional[datetime], pr_id: int, shard: int = 0) -> str:
+    position = [sort_value.isoformat() if sort_value else None, pr_id]
+    if SHARD_COUNT > 1:
+        # Ids are per shard: the shard breaks ties between equal (sort value, id)
+        position.append(shard)
+    raw = json.dumps(position)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int, int]:
+    try:
+        sort_value, pr_id, *rest = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        shard = int(rest[0]) if rest else 0
+        if len(rest) > 1 or not 0 <= shard < SHARD_COUNT:
+            raise ValueError(cursor)
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(pr_id), shard
+    except (ValueError, TypeError):
+        raise ValueError("INVALID_CURSOR")
+
+
+def list_sort_key(created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                  merged_from: Optional[datetime] = None, merged_to: Optional[datetime] = None) -> Optional[str]:
+    """
+    Order of the listing. A time range is read along its (ts, id) index,
+    otherwise PRs come in id order, which every other driving index ends with
+    """
+    if merged_from or merged_to:
+        return "mergedAt"
+    if created_from or created_to:
+        return "createdAt"
+    return None
+
+
+def build_list_query(pr_model=PullRequest, reviewer_model=Reviewers, status: Optional[str] = None,
+                     author_id: Optional[int] = None, team_id: Optional[int] = None,
+                     reviewer_id: Optional[int] = None,
+                     created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                     merged_from: Optional[datetime] = None, merged_to: Optional[datetime] = None,
+                     after: Optional[Tuple[Optional[datetime], int]] = None, limit: int = 100):
+    """
+    One page of PRs matching the filters (internal ids), keyset-paginated.
+    Works on the hot tables and on their archive twins alike
+    """
+    sort_key = list_sort_key(created_from, created_to, merged_from, merged_to)
+    sort_column = getattr(pr_model, sort_key) if sort_key else None
+    author = aliased(User)
+
+    query = (
+        select(
+            pr_model.id, pr_model.pull_request_id, pr_model.name, author.user_id,
+            pr_model.isMerged, pr_model.createdAt, pr_model.mergedAt
+        )
+        .join(author, author.id == pr_model.author_id)
+    )
+    if reviewer_id is not None:
+        query = query.join(
+            reviewer_model,
+            and_(reviewer_model.pr_id == pr_model.id, reviewer_model.reviewer_id == reviewer_id)
+        )
+
+    conditions = []
+    if status is not None:
+        conditions.append(pr_model.isMerged == (status == "MERGED"))
+    if author_id is not None:
+        conditions.append(pr_model.author_id == author_id)
+    if team_id is not None:
+        conditions.append(pr_model.author_id.in_(
+            select(TeamMember.member_id).where(TeamMember.team_id == team_id)
+        ))
+    if created_from is not None:
+        conditions.append(pr_model.createdAt >= created_from)
+    if created_to is not None:
+        conditions.append(pr_model.createdAt < created_to)
+    if merged_from is not None:
+        conditions.append(pr_model.mergedAt >= merged_from)
+    if merged_to is not None:
+        conditions.append(pr_model.mergedAt < merged_to)
+    if after is not None:
+        after_value, after_id = after
+        if sort_column is not None:
+            conditions.append(tuple_(sort_column, pr_model.id) > tuple_(after_value, after_id))
+        else:
+            conditions.append(pr_model.id > after_id)
+
+    order_by = (sort_column, pr_model.id) if sort_column is not None else (pr_model.id,)
+    return query.where(and_(*conditions)).order_by(*order_by).limit(limit)
+
+
+async def _list_shard(shard: int, filters: Dict, author_id: Optional[str], team_name: Optional[str],
+                      reviewer_id: Optional[str], include_archived: bool, sort_key: Optional[str]) -> List:
+    """Rows of one page of the listing from one shard, in (sort value, id) order"""
+    async with async_session_maker(shard) as session:
+        for key, model, column, value in (
+            ("author_id", User, User.user_id, author_id),
+            ("team_id", Team, Team.team_name, team_name),
+            ("reviewer_id", User, User.user_id, reviewer_id),
+        ):
+            if value is None:
+                continue
+            row = (await session.execute(select(model.id).where(column == value))).first()
+            if not row:
+                return []
+            filters = {**filters, key: row[0]}
+
+        query = build_list_query(PullRequest, Reviewers, **filters)
+        if include_archived and filters["status"] != "OPEN":
+            # Page through both table sets at once: archived PRs keep their ids
+            branches = [
+                query.subquery(),
+                build_list_query(ArchivedPullRequest, ArchivedReviewer, **filters).subquery()
+            ]
+            merged = union_all(*(select(branch) for branch in branches)).subquery()
+            order_by = (merged.c[sort_key], merged.c.id) if sort_key else (merged.c.id,)
+            query = select(merged).order_by(*order_by).limit(filters["limit"])
+
+        return (await session.execute(query)).all()
+
+
+async def list_pull_requests(status: Optional[str] = None, author_id: Optional[str] = None,
+                             team_name: Optional[str] = None, reviewer_id: Optional[str] = None,
+                             created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+                             merged_from: Optional[datetime] = None, merged_to: Optional[datetime] = None,
+                             limit: int = 100, cursor: Optional[str] = None,
+                             include_archived: bool = False) -> Dict:
+    """
+    GET /pullRequest/list
+    PRs filtered by status, author, author's team, reviewer and time ranges
+    Returns a page of PRs and the cursor of the next page (None on the last one).
+    With several shards a user or team filter reads its one shard, otherwise
+    every shard is read and the pages are merged by (sort value, id, shard)
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # Columns are naive UTC: an aware bound (e.g. ...Z) would not compare with them
+    created_from, created_to = naive_utc(created_from), naive_utc(created_to)
+    merged_from, merged_to = naive_utc(merged_from), naive_utc(merged_to)
+    sort_key = list_sort_key(created_from, created_to, merged_from, merged_to)
+    filters = {
+        "status": status,
+        "created_from": created_from, "created_to": created_to,
+        "merged_from": merged_from, "merged_to": merged_to,
+        "limit": limit + 1
+    }
+
+    if SHARD_COUNT == 1:
+        shards = [0]
+    elif team_name is not None:
+        shards = [await directory.shard_of("team", team_name)]
+    elif author_id is not None or reviewer_id is not None:
+        # Reviewers are members of the author's team, so both live on one shard
+        shards = list({await directory.shard_of("user", user_id)
+                       for user_id in (author_id, reviewer_id) if user_id is not None})
+    else:
+        shards = list(range(SHARD_COUNT))
+
+    def shard_after(shard: int):
+        if after is None:
+            return None
+        after_value, after_id, after_shard = after
+        # Equal (sort value, id) on a later shard comes after the cursor
+        return (after_value, after_id - 1) if shard > after_shard else (after_value, after_id)
+
+    pages = await asyncio.gather(*(
+        _list_shard(shard, {**filters, "after": shard_after(shard)},
+                    author_id, team_name, reviewer_id, include_archived, sort_key)
+        for shard in shards
+    ))
+    rows = sorted(
+        ((row, shard) for shard, page in zip(shards, pages) for row in page),
+        key=lambda item: (getattr(item[0], sort_key) if sort_key else 0, item[0].id, item[1])
+    )
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last, shard = page[-1]
+        next_cursor = encode_cursor(getattr(last, sort_key) if sort_key else None, last.id, shard)
+
+    return {
+        "pull_requests": [
+            {
+                "pull_request_id": row.pull_request_id,
+                "pull_request_name": row.name,
+                "author_id": row.user_id,
+                "status": "MERGED" if row.isMerged else "OPEN",
+                "createdAt": row.createdAt,
+                "mergedAt": row.mergedAt
+            }
+            for row, _ in page
+        ],
+        "next_cursor": next_cursor
+    }
@@ -0,0 +1,152 @@
+from models.models import *
+from models.database import engine
+from sqlalchemy import select, bindparam, any_, all_, BigInteger, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import aliased
+from typing import List, NamedTuple, Optional
+from datetime import datetime, timezone
+
+
+# Read paths select plain table columns: rows come back as tuples and are
+# never turned into ORM entities, so nothing lands in the session's identity
+# map. Field names follow the model attributes, so callers that only read
+# user.isActive or pr.mergedAt work with either
+
+
+class UserRow(NamedTuple):
+    id: int
+    user_id: str
+    name: str
+    isActive: bool
+    primary_team_id: Optional[int]
+
+
+class TeamRow(NamedTuple):
+    id: int
+    team_name: str
+    roster_version: int
+
+
+class PullRequestRow(NamedTuple):
+    id: int
+    pull_request_id: str
+    name: str
+    author_id: int
+    isMerged: bool
+    createdAt: Optional[datetime]
+    mergedAt: Optional[datetime]
+
+
+class ReviewRow(NamedTuple):
+    """PullRequestShort of a PR the user reviews"""
+    pull_request_id: str
+    pull_request_name: str
+    author_id: str
+    status: str
+
+
+class MemberRow(NamedTuple):
+    """TeamMember schema of a team member"""
+    user_id: str
+    username: str
+    is_active: bool
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Columns are naive UTC timestamps (see datetime.utcnow defaults)"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# Hot statements are built once at import with bound parameters: building a
+# select per call costs more CPU than running it, while a prebuilt one keeps
+# its cache key and hits the compiled cache straight away. Id lists are one
+# array parameter on Postgres, so the SQL text (and the driver's prepared
+# statement) does not change with the list length
+
+
+def in_list(column, name: str, item_type=BigInteger):
+    if engine.dialect.name == "postgresql":
+        return column == any_(bindparam(name, type_=ARRAY(item_type)))
+    return column.in_(bindparam(name, expanding=True))
+
+
+def not_in_list(column, name: str, item_type=BigInteger):
+    if engine.dialect.name == "postgresql":
+        return column != all_(bindparam(name, type_=ARRAY(item_type)))
+    return column.notin_(bindparam(name, expanding=True))
+
+
+users = User.__table__
+teams = Team.__table__
+pull_requests = PullRequest.__table__
+reviewers = Reviewers.__table__
+team_members = TeamMember.__table__
+
+USER_COLUMNS = (users.c.id, users.c.user_id, users.c.name, users.c.isActive, users.c.primary_team_id)
+TEAM_COLUMNS = (teams.c.id, teams.c.team_name, teams.c.roster_version)
+PR_COLUMNS = (
+    pull_requests.c.id, pull_requests.c.pull_request_id, pull_requests.c.name, pull_requests.c.author_id,
+    pull_requests.c.isMerged, pull_requests.c.createdAt, pull_requests.c.mergedAt
+)
+
+
+USER_BY_STRING_ID = select(*USER_COLUMNS).where(users.c.user_id == bindparam("user_id"))
+TEAM_BY_NAME = select(*TEAM_COLUMNS).where(teams.c.team_name == bindparam("team_name"))
+PR_BY_STRING_ID = select(*PR_COLUMNS).where(pull_requests.c.pull_request_id == bindparam("pull_request_id"))
+
+_author = aliased(users)
+REVIEWS = (
+    select(pull_requests.c.pull_request_id, pull_requests.c.name, _author.c.user_id, pull_requests.c.isMerged)
+    .select_from(reviewers)
+    .join(pull_requests, pull_requests.c.id == reviewers.c.pr_id)
+    .join(_author, _author.c.id == pull_requests.c.author_id)
+    .where(reviewers.c.reviewer_id == bindparam("reviewer_id"))
+)
+REVIEWS_OF_PRS = REVIEWS.where(in_list(pull_requests.c.pull_request_id, "pull_request_ids", String))
+
+TEAM_MEMBERS = (
+    select(users.c.user_id, users.c.name, users.c.isActive)
+    .select_from(team_members)
+    .join(users, users.c.id == team_members.c.member_id)
+    .where(team_members.c.team_id == bindparam("team_id"))
+)
+
+
+async def fetch_user(session, user_id: str) -> Optional[UserRow]:
+    result = await session.execute(USER_BY_STRING_ID, {"user_id": user_id})
+    row = result.first()
+    return UserRow._make(row) if row else None
+
+
+async def fetch_team(session, team_name: str) -> Optional[TeamRow]:
+    result = await session.execute(TEAM_BY_NAME, {"team_name": team_name})
+    row = result.first()
+    return TeamRow._make(row) if row else None
+
+
+async def fetch_pull_request(session, pull_request_id: str) -> Optional[PullRequestRow]:
+    result = await session.execute(PR_BY_STRING_ID, {"pull_request_id": pull_request_id})
+    row = result.first()
+    return PullRequestRow._make(row) if row else None
+
+
+async def fetch_reviews(session, reviewer_id: int,
+                        pull_request_ids: Optional[List[str]] = None) -> List[ReviewRow]:
+    """Hot-table PRs reviewed by the user (optionally only the given ones), author string id joined in"""
+    if pull_request_ids is None:
+        result = await session.execute(REVIEWS, {"reviewer_id": reviewer_id})
+    else:
+        result = await session.execute(
+            REVIEWS_OF_PRS, {"reviewer_id": reviewer_id, "pull_request_ids": list(pull_request_ids)}
+        )
+    return [
+        ReviewRow(pull_request_id, name, author_id, "MERGED" if is_merged else "OPEN")
+        for pull_request_id, name, author_id, is_merged in result.tuples()
+    ]
+
+
+async def fetch_team_members(session, team_id: int) -> List[MemberRow]:
+    result = await session.execute(TEAM_MEMBERS, {"team_id": team_id})
+    return [MemberRow._make(row) for row in result.tuples()]
@@ -0,0 +1,129 @@
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from config import (
+    TRAFFIC_RECORD_SAMPLE_RATE, TRAFFIC_RECORD_PATH, TRAFFIC_RECORD_MAX_BODY_BYTES,
+    TRAFFIC_RECORD_BATCH_SIZE, TRAFFIC_RECORD_QUEUE_SIZE, TRAFFIC_RECORD_FLUSH_INTERVAL_SECONDS
+)
+import asyncio
+import json
+import logging
+import random
+
+
+logger = logging.getLogger(__name__)
+
+
+def _text(body: Optional[bytes]) -> Optional[str]:
+    return None if body is None else body.decode("utf-8", errors="replace")
+
+
+def _payload(body: Optional[bytes]):
+    """Response body as JSON when it is JSON, so replays can be diffed field by field"""
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return _text(body)
+
+
+def to_line(entry: Dict) -> str:
+    """JSONL line of a recorded request; bodies are decoded here, off the request path"""
+    return json.dumps({
+        **entry,
+        "body": _text(entry["body"]),
+        "response": _payload(entry["response"])
+    }) + "\n"
+
+
+class TrafficRecorder:
+    """
+    Sampled requests with their response, for benchmarks.replay. The
+    middleware only keeps the raw bodies of a sampled request; records are
+    buffered in a bounded queue (overflow is dropped and counted) and written
+    by a background task in batches, in a thread
+    """
+
+    def __init__(self, path: str, sample_rate: float, max_body_bytes: int, batch_size: int,
+                 queue_size: int, interval: float):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: Deque[Dict] = deque(maxlen=queue_size)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.oversized = 0
+        self.write_errors = 0
+
+    def sampled(self) -> bool:
+        return random.random() < self.sample_rate
+
+    def record(self, entry: Dict):
+        self.recorded += 1
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(entry)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _write(self, entries: List[Dict]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(to_line(entry) for entry in entries)
+
+    async def flush(self):
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                await asyncio.to_thread(self._write, batch)
+                self.written += len(batch)
+            except Exception:
+                self.write_errors += 1
+                self.dropped += len(batch)
+                logger.exception("traffic recording write failed")
+                return
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "path": self.path,
+            "recorded": self.recorded,
+            "written": self.written,
+            "queued": len(self._queue),
+            "dropped": self.dropped,
+            "oversized": self.oversized,
+            "write_errors": self.write_errors
+        }
+
+
+traffic_recorder = TrafficRecorder(
+    TRAFFIC_RECORD_PATH, TRAFFIC_RECORD_SAMPLE_RATE, TRAFFIC_RECORD_MAX_BODY_BYTES,
+    TRAFFIC_RECORD_BATCH_SIZE, TRAFFIC_RECORD_QUEUE_SIZE, TRAFFIC_RECORD_FLUSH_INTERVAL_SECONDS
+)
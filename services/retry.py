@@ -0,0 +1,78 @@
+from typing import Dict
+from sqlalchemy.exc import DBAPIError
+from services.deadline import current_deadline
+from config import CONFLICT_RETRY_ATTEMPTS, CONFLICT_RETRY_BASE_SECONDS, CONFLICT_RETRY_MAX_SECONDS
+import asyncio
+import functools
+import random
+
+
+# Postgres codes of transactions aborted by a concurrent one
+SERIALIZATION_FAILURE = "40001"
+DEADLOCK_DETECTED = "40P01"
+RETRYABLE = {SERIALIZATION_FAILURE, DEADLOCK_DETECTED}
+
+
+def is_conflict(error: DBAPIError) -> bool:
+    original = error.orig
+    sqlstate = getattr(original, "sqlstate", None) or getattr(original.__cause__, "sqlstate", None)
+    return sqlstate in RETRYABLE
+
+
+class ConflictRetry:
+    """
+    Re-runs a write transaction aborted by a deadlock or serialization
+    failure, up to `attempts` times with jittered exponential backoff.
+    Stops early when the request's deadline would expire during the pause
+    """
+
+    def __init__(self, name: str, attempts: int = CONFLICT_RETRY_ATTEMPTS):
+        self.name = name
+        self.attempts = attempts
+        self.calls = 0
+        self.retries = 0
+        self.exhausted = 0
+
+    def _backoff(self, attempt: int) -> float:
+        cap = min(CONFLICT_RETRY_MAX_SECONDS, CONFLICT_RETRY_BASE_SECONDS * 2 ** attempt)
+        return random.uniform(0, cap)
+
+    async def run(self, fn, *args, **kwargs):
+        self.calls += 1
+        attempt = 0
+        while True:
+            try:
+                return await fn(*args, **kwargs)
+            except DBAPIError as e:
+                if not is_conflict(e):
+                    raise
+                attempt += 1
+                pause = self._backoff(attempt)
+                deadline = current_deadline.get()
+                if attempt >= self.attempts or (deadline is not None and deadline.remaining_ms() <= pause * 1000):
+                    self.exhausted += 1
+                    raise
+                self.retries += 1
+            await asyncio.sleep(pause)
+
+    def stats(self) -> Dict:
+        return {"calls": self.calls, "retries": self.retries, "exhausted": self.exhausted}
+
+
+groups: Dict[str, ConflictRetry] = {}
+
+
+def retry_on_conflict(fn):
+    """Run a service function (one transaction per call) again on deadlock / serialization failure"""
+    group = groups.setdefault(fn.__qualname__, ConflictRetry(fn.__qualname__))
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await group.run(fn, *args, **kwargs)
+
+    wrapper.group = group
+    return wrapper
+
+
+def stats() -> Dict:
+    return {name: group.stats() for name, group in groups.items()}
@@ -0,0 +1,117 @@
+from services import events as events_service
+from services.deadline import current_deadline
+from typing import Dict, List, Set, Optional
+from config import (
+    REVIEW_STREAM_QUEUE_SIZE, EVENTS_MAX_WAIT_SECONDS,
+    EVENTS_MAX_PAGE_SIZE, EVENTS_POLL_INTERVAL_SECONDS
+)
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Sent instead of the dropped backlog when a subscriber falls behind;
+# the client should re-read /users/getReview
+OVERFLOW_EVENT = {"event_type": "OVERFLOW"}
+
+
+class Subscriber:
+    __slots__ = ("user_id", "queue")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=REVIEW_STREAM_QUEUE_SIZE)
+
+    def put(self, event: Dict) -> bool:
+        """Enqueue without blocking the hub; returns False if the backlog was dropped"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW_EVENT)
+            return False
+
+
+class ReviewHub:
+    """
+    Fans committed assignment events out to per-user subscribers.
+    A single tail task follows the outbox of every shard, so idle subscribers
+    hold no DB connection and the DB sees one query per commit, not one per
+    subscriber
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+        self._after: List[int] = []
+        self.published = 0
+        self.overflows = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def subscribe(self, user_id: str) -> Subscriber:
+        await self.start()
+        subscriber = Subscriber(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.user_id]
+
+    def publish(self, event: Dict):
+        for user_id in {event.get("user_id"), event.get("old_user_id")}:
+            for subscriber in self._subscribers.get(user_id, ()):
+                self.published += 1
+                if not subscriber.put(event):
+                    self.overflows += 1
+
+    async def start(self):
+        async with self._start_lock:
+            if self._task is not None and not self._task.done():
+                return
+            self._after = await events_service.get_last_seqs()
+            self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _tail(self):
+        # Started by the first subscriber's request but serves everyone
+        current_deadline.set(None)
+        while True:
+            try:
+                events = await events_service.get_events(
+                    self._after, EVENTS_MAX_PAGE_SIZE, EVENTS_MAX_WAIT_SECONDS
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("review hub: failed to read events")
+                await asyncio.sleep(EVENTS_POLL_INTERVAL_SECONDS)
+                continue
+
+            for event in events:
+                self._after[event["shard"]] = event["seq"]
+                if self._subscribers:
+                    self.publish(event)
+
+
+review_hub = ReviewHub()
@@ -0,0 +1,452 @@
+from models.models import *
+from models.database import async_session_maker, use_shard, current_shard, shard_for_team, SHARD_COUNT
+from sqlalchemy import select, update, insert, delete, and_, or_, exists
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional, Tuple
+from config import (
+    SHARD_DIRECTORY_CACHE_SECONDS, SHARD_DIRECTORY_CACHE_SIZE,
+    SHARD_MOVE_WAIT_SECONDS, SHARD_MOVE_GRACE_SECONDS
+)
+import asyncio
+import functools
+import inspect
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY_SHARD = 0
+MOVE_POLL_SECONDS = 0.2
+DIRECTORY_CHUNK = 5000
+
+# Jobs and webhooks live on their team's shard; their public ids carry the
+# shard above these bits, so ids of shard 0 are the plain row ids
+SHARD_ID_BITS = 40
+
+
+class ShardMoving(Exception):
+    """The team did not finish moving to another shard within SHARD_MOVE_WAIT_SECONDS"""
+
+
+class ShardDirectory:
+    """
+    String id -> shard lookups over the sharddirectory table with a short
+    in-process cache. An entry only changes when the rebalancer moves a team:
+    it first marks the team's ids as moving, then waits out the cache TTL
+    (SHARD_MOVE_GRACE_SECONDS), so a cached entry is never stale for long.
+    Lookups of moving ids wait for the move instead of failing
+    """
+
+    def __init__(self):
+        self._cache: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.move_waits = 0
+
+    def _remember(self, kind: str, key: str, shard: int, expires: float):
+        self._cache.pop((kind, key), None)
+        if len(self._cache) >= SHARD_DIRECTORY_CACHE_SIZE:
+            del self._cache[next(iter(self._cache))]
+        self._cache[(kind, key)] = (shard, expires)
+
+    async def fetch(self, kind: str, keys: List[str]) -> Dict[str, Tuple[int, bool]]:
+        """Uncached {key: (shard, moving)} of the registered keys"""
+        entries = {}
+        async with async_session_maker(DIRECTORY_SHARD) as session:
+            for start in range(0, len(keys), DIRECTORY_CHUNK):
+                result = await session.execute(
+                    select(ShardEntry.key, ShardEntry.shard, ShardEntry.moving)
+                    .where(and_(ShardEntry.kind == kind, ShardEntry.key.in_(keys[start:start + DIRECTORY_CHUNK])))
+                )
+                entries.update((key, (shard, moving)) for key, shard, moving in result.all())
+        return entries
+
+    async def shards_of(self, kind: str, keys: List[str]) -> Dict[str, int]:
+        """Shard of every key (unregistered ones live on shard 0)"""
+        now = time.monotonic()
+        shards, missing = {}, []
+        for key in keys:
+            cached = self._cache.get((kind, key))
+            if cached is not None and cached[1] > now:
+                shards[key] = cached[0]
+            else:
+                missing.append(key)
+        self.hits += len(shards)
+        if not missing:
+            return shards
+
+        self.misses += len(missing)
+        deadline = now + SHARD_MOVE_WAIT_SECONDS
+        while True:
+            entries = await self.fetch(kind, missing)
+            if not any(moving for _, moving in entries.values()):
+                break
+            self.move_waits += 1
+            if time.monotonic() > deadline:
+                raise ShardMoving(f"{kind} {missing[0]} is being moved to another shard")
+            await asyncio.sleep(MOVE_POLL_SECONDS)
+
+        expires = time.monotonic() + SHARD_DIRECTORY_CACHE_SECONDS
+        for key in missing:
+            shards[key] = entries[key][0] if key in entries else DIRECTORY_SHARD
+            self._remember(kind, key, shards[key], expires)
+        return shards
+
+    async def shard_of(self, kind: str, key: str) -> int:
+        return (await self.shards_of(kind, [key]))[key]
+
+    async def register(self, kind: str, keys: List[str], shard: Optional[int] = None) -> List[str]:
+        """
+        Record new keys as living on the shard (the current one by default).
+        Returns the keys that are already registered on another shard: the
+        caller treats them as taken. A key registered by a transaction that
+        then fails points at a shard that does not have it, which reads as
+        "not found" and is reused by the next create on that shard
+        """
+        if SHARD_COUNT == 1 or not keys:
+            return []
+        shard = current_shard.get() if shard is None else shard
+        keys = list(dict.fromkeys(keys))
+        deadline = time.monotonic() + SHARD_MOVE_WAIT_SECONDS
+        while True:
+            async with async_session_maker(DIRECTORY_SHARD) as session:
+                result = await session.execute(
+                    select(ShardEntry.key, ShardEntry.shard, ShardEntry.moving)
+                    .where(and_(ShardEntry.kind == kind, ShardEntry.key.in_(keys)))
+                )
+                rows = result.all()
+                if any(moving for _, _, moving in rows):
+                    # E.g. a member of a team that is being moved: wait for its new shard
+                    self.move_waits += 1
+                    if time.monotonic() > deadline:
+                        raise ShardMoving(f"{kind} {keys[0]} is being moved to another shard")
+                    await asyncio.sleep(MOVE_POLL_SECONDS)
+                    continue
+                existing = {key: placed for key, placed, _ in rows}
+                missing = [key for key in keys if key not in existing]
+                if missing:
+                    await session.execute(
+                        insert(ShardEntry),
+                        [{"kind": kind, "key": key, "shard": shard, "moving": False} for key in missing]
+                    )
+                    try:
+                        await session.commit()
+                    except IntegrityError:
+                        # Registered concurrently: look again
+                        continue
+            break
+
+        expires = time.monotonic() + SHARD_DIRECTORY_CACHE_SECONDS
+        for key in missing:
+            self._remember(kind, key, shard, expires)
+        return [key for key, placed in existing.items() if placed != shard]
+
+    async def place(self, entries: Dict[str, List[str]], shard: int, moving: bool):
+        """Point the keys of each kind at the shard and set their moving flag (rebalancer only)"""
+        async with async_session_maker(DIRECTORY_SHARD) as session:
+            for kind, keys in entries.items():
+                for start in range(0, len(keys), DIRECTORY_CHUNK):
+                    chunk = keys[start:start + DIRECTORY_CHUNK]
+                    result = await session.execute(
+                        update(ShardEntry)
+                        .where(and_(ShardEntry.kind == kind, ShardEntry.key.in_(chunk)))
+                        .values(shard=shard, moving=moving)
+                        .returning(ShardEntry.key)
+                        .execution_options(synchronize_session=False)
+                    )
+                    updated = set(result.scalars().all())
+                    missing = [key for key in chunk if key not in updated]
+                    if missing:
+                        await session.execute(
+                            insert(ShardEntry),
+                            [{"kind": kind, "key": key, "shard": shard, "moving": moving} for key in missing]
+                        )
+                    for key in chunk:
+                        self._cache.pop((kind, key), None)
+            await session.commit()
+
+    def invalidate(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "shards": SHARD_COUNT,
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "move_waits": self.move_waits
+        }
+
+
+directory = ShardDirectory()
+
+
+def shard_id(row_id: int, shard: Optional[int] = None) -> int:
+    """Public id of a row of the shard (the current one by default)"""
+    shard = current_shard.get() if shard is None else shard
+    return shard << SHARD_ID_BITS | row_id
+
+
+def split_shard_id(public_id: int) -> Optional[Tuple[int, int]]:
+    """(shard, row id) of a public id, None if there is no such shard"""
+    shard, row_id = public_id >> SHARD_ID_BITS, public_id & ((1 << SHARD_ID_BITS) - 1)
+    if not 0 <= shard < SHARD_COUNT:
+        return None
+    return shard, row_id
+
+
+def routed(kind: str, arg: str):
+    """
+    Run the decorated service function on the shard that holds its `arg`
+    argument, a team name, user id or PR id (kind 'team', 'user' or 'pr'):
+    its async_session_maker() sessions open there. With a single database
+    the function is returned unchanged
+    """
+    def decorator(fn):
+        if SHARD_COUNT == 1:
+            return fn
+        position = list(inspect.signature(fn).parameters).index(arg)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = kwargs[arg] if arg in kwargs else args[position]
+            with use_shard(await directory.shard_of(kind, key)):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def _team_scope(team_name: str):
+    """Subqueries of the team, its members and their hot and archived PRs"""
+    team_id = select(Team.id).where(Team.team_name == team_name).scalar_subquery()
+    member_ids = select(TeamMember.member_id).where(TeamMember.team_id == team_id)
+    pr_ids = select(PullRequest.id).where(PullRequest.author_id.in_(member_ids))
+    archived_ids = select(ArchivedPullRequest.id).where(ArchivedPullRequest.author_id.in_(member_ids))
+    return team_id, member_ids, pr_ids, archived_ids
+
+
+async def _blocker(session, team_name: str) -> Optional[str]:
+    """Why the team cannot be moved on its own, if it cannot"""
+    team_id, member_ids, _, _ = _team_scope(team_name)
+    checks = (
+        # A user lives on one shard: a member of several teams pins them together
+        ("SHARED_MEMBERS", exists().where(and_(TeamMember.member_id.in_(member_ids), TeamMember.team_id != team_id))),
+        ("CROSS_TEAM_REVIEWS", exists().where(and_(
+            Reviewers.pr_id == PullRequest.id,
+            PullRequest.author_id.in_(member_ids) != Reviewers.reviewer_id.in_(member_ids)
+        ))),
+        ("CROSS_TEAM_REVIEWS", exists().where(and_(
+            ArchivedReviewer.pr_id == ArchivedPullRequest.id,
+            ArchivedPullRequest.author_id.in_(member_ids) != ArchivedReviewer.reviewer_id.in_(member_ids)
+        ))),
+        # Webhooks and job history keep their shard-qualified ids (shard_id)
+        ("HAS_WEBHOOKS", exists().where(Webhook.team_id == team_id)),
+        ("HAS_JOBS", exists().where(or_(
+            JobReassignment.old_reviewer_id.in_(member_ids), JobReassignment.new_reviewer_id.in_(member_ids)
+        ))),
+    )
+    for reason, condition in checks:
+        if (await session.execute(select(condition))).scalar():
+            return reason
+    return None
+
+
+async def _team_keys(session, team_name: str) -> Dict[str, List[str]]:
+    """Directory keys of the team: its name, member ids and PR ids"""
+    _, member_ids, pr_ids, archived_ids = _team_scope(team_name)
+    users = await session.execute(select(User.user_id).where(User.id.in_(member_ids)))
+    prs = await session.execute(select(PullRequest.pull_request_id).where(PullRequest.id.in_(pr_ids)))
+    archived = await session.execute(
+        select(ArchivedPullRequest.pull_request_id).where(ArchivedPullRequest.id.in_(archived_ids))
+    )
+    return {
+        "team": [team_name],
+        "user": list(users.scalars().all()),
+        "pr": list(prs.scalars().all()) + list(archived.scalars().all())
+    }
+
+
+async def _purge(session, team_name: str):
+    """Delete the team with its members and their PRs from the session's shard"""
+    team_id, member_ids, pr_ids, archived_ids = _team_scope(team_name)
+    user_ids = select(User.user_id).where(User.id.in_(member_ids))
+    await session.execute(delete(ReviewChange).where(ReviewChange.user_id.in_(user_ids)))
+    await session.execute(delete(Reviewers).where(Reviewers.pr_id.in_(pr_ids)))
+    await session.execute(delete(PullRequest).where(PullRequest.id.in_(pr_ids)))
+    await session.execute(delete(ArchivedReviewer).where(ArchivedReviewer.pr_id.in_(archived_ids)))
+    await session.execute(delete(ArchivedPullRequest).where(ArchivedPullRequest.id.in_(archived_ids)))
+    members = (await session.execute(member_ids)).scalars().all()
+    await session.execute(delete(TeamMember).where(TeamMember.team_id == team_id))
+    await session.execute(delete(User).where(User.id.in_(members)))
+    await session.execute(delete(Team).where(Team.team_name == team_name))
+
+
+async def _copy(source_session, target_session, team_name: str) -> Dict[str, int]:
+    """Insert the team's rows from the source shard into the target one; ids are reassigned"""
+    _, member_ids, pr_ids, archived_ids = _team_scope(team_name)
+    team = (await source_session.execute(select(Team).where(Team.team_name == team_name))).scalar_one()
+    new_team_id = (await target_session.execute(
+        insert(Team).returning(Team.id),
+        [{"team_name": team.team_name, "roster_version": team.roster_version}]
+    )).scalar_one()
+
+    users = (await source_session.execute(select(User).where(User.id.in_(member_ids)))).scalars().all()
+    user_map = {}
+    if users:
+        inserted = await target_session.execute(
+            insert(User).returning(User.id, User.user_id),
+            [{"user_id": user.user_id, "name": user.name, "isActive": user.isActive,
+              "primary_team_id": new_team_id} for user in users]
+        )
+        new_ids = dict((user_id, new_id) for new_id, user_id in inserted.all())
+        user_map = {user.id: new_ids[user.user_id] for user in users}
+        await target_session.execute(
+            insert(TeamMember), [{"team_id": new_team_id, "member_id": new_id} for new_id in user_map.values()]
+        )
+
+    # Archived PRs take fresh ids from the target's pullrequests, like the archiver does
+    hot = (await source_session.execute(select(PullRequest).where(PullRequest.id.in_(pr_ids)))).scalars().all()
+    archived = (await source_session.execute(
+        select(ArchivedPullRequest).where(ArchivedPullRequest.id.in_(archived_ids))
+    )).scalars().all()
+    pr_map = {}
+    if hot or archived:
+        inserted = await target_session.execute(
+            insert(PullRequest).returning(PullRequest.id, PullRequest.pull_request_id),
+            [{"pull_request_id": pr.pull_request_id, "name": pr.name, "author_id": user_map[pr.author_id],
+              "isMerged": pr.isMerged, "createdAt": pr.createdAt, "mergedAt": pr.mergedAt}
+             for pr in [*hot, *archived]]
+        )
+        new_ids = dict((pull_request_id, new_id) for new_id, pull_request_id in inserted.all())
+        pr_map = {("hot", pr.id): new_ids[pr.pull_request_id] for pr in hot}
+        pr_map.update({("archived", pr.id): new_ids[pr.pull_request_id] for pr in archived})
+
+    for table, reviewer_model, source_ids in (("hot", Reviewers, pr_ids), ("archived", ArchivedReviewer, archived_ids)):
+        reviews = await source_session.execute(
+            select(reviewer_model.pr_id, reviewer_model.reviewer_id).where(reviewer_model.pr_id.in_(source_ids))
+        )
+        rows = [{"pr_id": pr_map[(table, pr_id)], "reviewer_id": user_map[reviewer_id]}
+                for pr_id, reviewer_id in reviews.all()]
+        if rows:
+            await target_session.execute(insert(reviewer_model), rows)
+
+    if archived:
+        moved_ids = [pr_map[("archived", pr.id)] for pr in archived]
+        await target_session.execute(
+            insert(ArchivedPullRequest).from_select(
+                ['id', 'pull_request_id', 'name', 'author_id', 'isMerged', 'createdAt', 'mergedAt'],
+                select(PullRequest.id, PullRequest.pull_request_id, PullRequest.name, PullRequest.author_id,
+                       PullRequest.isMerged, PullRequest.createdAt, PullRequest.mergedAt)
+                .where(PullRequest.id.in_(moved_ids))
+            )
+        )
+        await target_session.execute(delete(PullRequest).where(PullRequest.id.in_(moved_ids)))
+
+    return {"users": len(users), "pull_requests": len(hot) + len(archived)}
+
+
+async def move_team(team_name: str, target: int, grace: float = SHARD_MOVE_GRACE_SECONDS) -> Dict:
+    """
+    Move a team with its members, their PRs (hot and archived) and reviews
+    to the target shard. The team must be self-contained: members in no
+    other team, reviews only among members, no webhooks or job history.
+    Every step can be re-run after a crash: mark the ids as moving, wait
+    out cached routes, copy (replacing a copy left by an interrupted run),
+    point the directory at the target, delete the source rows.
+    Since tokens of /users/getReview issued on the source shard stop
+    being accepted, clients re-read the full list once
+    """
+    entry = (await directory.fetch("team", [team_name])).get(team_name)
+    source = entry[0] if entry else DIRECTORY_SHARD
+    result = {"team_name": team_name, "from_shard": source, "to_shard": target}
+    if source == target:
+        return {**result, "status": "IN_PLACE"}
+
+    async with async_session_maker(source) as session:
+        if (await session.execute(select(Team.id).where(Team.team_name == team_name))).first() is None:
+            raise ValueError("NOT_FOUND")
+        keys = await _team_keys(session, team_name)
+    await directory.place(keys, source, moving=True)
+    await asyncio.sleep(grace)
+
+    async with async_session_maker(source) as source_session, async_session_maker(target) as target_session:
+        # Nothing is written to the team any more: check and read a final state
+        reason = await _blocker(source_session, team_name)
+        if reason is not None:
+            await directory.place(keys, source, moving=False)
+            return {**result, "status": reason}
+        keys = await _team_keys(source_session, team_name)
+        await _purge(target_session, team_name)
+        counts = await _copy(source_session, target_session, team_name)
+        await target_session.commit()
+
+    await directory.place(keys, target, moving=False)
+    async with async_session_maker(source) as session:
+        await _purge(session, team_name)
+        await session.commit()
+    logger.info("moved team %s from shard %d to shard %d", team_name, source, target)
+    return {**result, "status": "MOVED", **counts}
+
+
+async def _register_existing(shard: int):
+    """Register the ids stored on the shard that predate the directory (e.g. after enabling sharding)"""
+    with use_shard(shard):
+        async with async_session_maker() as session:
+            for kind, column in (
+                ("team", Team.team_name),
+                ("user", User.user_id),
+                ("pr", PullRequest.pull_request_id),
+                ("pr", ArchivedPullRequest.pull_request_id),
+            ):
+                result = await session.stream(select(column))
+                async for rows in result.partitions(DIRECTORY_CHUNK):
+                    await directory.register(kind, [row[0] for row in rows], shard)
+
+
+async def rebalance(dry_run: bool = False, grace: float = SHARD_MOVE_GRACE_SECONDS) -> Dict:
+    """
+    POST /admin/rebalanceShards
+    Register ids that predate the directory, delete what interrupted moves
+    left on their old shard and move every team whose placement
+    (shard_for_team) is another shard, one team at a time.
+    Only a copy whose directory entry points at another shard and is not
+    moving is a leftover: an unregistered team is registered where it is.
+    dry_run only reports the planned moves and leftovers
+    """
+    moves, purged = [], []
+    for shard in range(SHARD_COUNT):
+        async with async_session_maker(shard) as session:
+            names = list((await session.execute(select(Team.team_name).order_by(Team.team_name))).scalars().all())
+        homes = await directory.fetch("team", names)
+        for team_name in names:
+            home, moving = homes.get(team_name, (shard, False))
+            if home != shard:
+                if not moving:
+                    purged.append({"team_name": team_name, "shard": shard})
+                continue
+            target = shard_for_team(team_name)
+            if target != shard:
+                moves.append({"team_name": team_name, "from_shard": shard, "to_shard": target, "status": "PLANNED"})
+
+    if dry_run:
+        return {"dry_run": True, "moves": moves, "purged": purged}
+
+    if SHARD_COUNT > 1:
+        for shard in range(SHARD_COUNT):
+            await _register_existing(shard)
+    leftovers, purged = purged, []
+    for leftover in leftovers:
+        # Re-check: a move may have started or finished since the scan
+        entry = (await directory.fetch("team", [leftover["team_name"]])).get(leftover["team_name"])
+        if entry is None or entry[0] == leftover["shard"] or entry[1]:
+            continue
+        async with async_session_maker(leftover["shard"]) as session:
+            await _purge(session, leftover["team_name"])
+            await session.commit()
+        purged.append(leftover)
+    for move in moves:
+        outcome = await move_team(move["team_name"], move["to_shard"], grace)
+        move["status"] = outcome["status"]
+    return {"dry_run": False, "moves": moves, "purged": purged}
@@ -0,0 +1,96 @@
+from typing import Dict, Hashable
+from services.deadline import Deadline, DeadlineExceeded, current_deadline
+from config import SINGLE_FLIGHT_ENABLED, REQUEST_TIMEOUT_SECONDS
+import asyncio
+import contextvars
+import functools
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-flight execution and its
+    result. Nothing is kept once it completes, so results are never stale.
+    The shared execution runs in a clean context with the default budget,
+    not the leader's deadline and lane; each caller waits for it only as
+    long as its own deadline allows. If the shared budget runs out first,
+    every waiter gets DeadlineExceeded, which the middleware turns into 504
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn, *args):
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            # A separate task, so a leader cancelled by client disconnect
+            # does not cancel the followers' query
+            task = asyncio.get_running_loop().create_task(
+                self._run(fn, *args), context=contextvars.Context()
+            )
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._forget, key))
+        else:
+            self.coalesced += 1
+
+        deadline = current_deadline.get()
+        if deadline is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(0, deadline.remaining_ms()) / 1000)
+        except asyncio.TimeoutError:
+            deadline.expired = True
+            raise DeadlineExceeded(f"request deadline of {deadline.timeout:g}s exceeded")
+        except DeadlineExceeded:
+            # The shared budget ran out, not this caller's; answer 504 anyway
+            # rather than a 500 for a caller that still had time left
+            deadline.expired = True
+            raise
+
+    @staticmethod
+    async def _run(fn, *args):
+        deadline = Deadline(REQUEST_TIMEOUT_SECONDS)
+        current_deadline.set(deadline)
+        try:
+            return await fn(*args)
+        except DeadlineExceeded:
+            raise
+        except Exception as exc:
+            # statement_timeout / lock_timeout from the shared budget
+            if deadline.expired:
+                raise DeadlineExceeded(f"shared deadline of {deadline.timeout:g}s exceeded") from exc
+            raise
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Followers may all be gone; don't leave the error unretrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+
+groups: Dict[str, SingleFlight] = {}
+
+
+def single_flight(fn):
+    """Coalesce concurrent calls of a read-only service function by its arguments"""
+    group = groups.setdefault(fn.__qualname__, SingleFlight(fn.__qualname__))
+
+    @functools.wraps(fn)
+    async def wrapper(*args):
+        if not SINGLE_FLIGHT_ENABLED:
+            return await fn(*args)
+        return await group.do(args, fn, *args)
+
+    wrapper.group = group
+    return wrapper
+
+
+def stats() -> Dict:
+    return {name: group.stats() for name, group in groups.items()}
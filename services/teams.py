@@ -1,16 +1,62 @@
 from models.models import *
-from models.database import async_session_maker
-from sqlalchemy import select, update, and_
-from typing import List, Optional, Dict
+from models.database import async_session_maker, use_shard, shard_for_team, SHARD_COUNT
+from sqlalchemy import select, update, insert, delete, values, column, bindparam, and_, func, String, Boolean
+from sqlalchemy.orm import aliased
+from typing import List, Optional, Dict, Set, Tuple
 from schemas import TeamMember as TeamMemberSchema
+from services import events as events_service
+from services.single_flight import single_flight
+from services.reads import TeamRow, fetch_team, fetch_team_members, in_list, not_in_list
+from services.assignment import assignment_engine, bump_roster_versions, lock_candidates, REPLACE_REVIEWER
+from services.retry import retry_on_conflict
+from services.pr_cache import pr_cache
+from services.shards import directory, routed
+from config import ASSIGNMENT_ENGINE_ENABLED
 
 
-async def get_team_by_name(team_name: str) -> Optional[Team]:
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(Team).where(Team.team_name == team_name)
+# Запросы массовой деактивации и чтения ревьюверов собраны заранее (см. services.reads)
+PR_REVIEWER_SETS = select(Reviewers.pr_id, Reviewers.reviewer_id).where(in_list(Reviewers.pr_id, "pr_ids"))
+
+# Блокируются по порядку id; FOR NO KEY UPDATE не мешает проверкам внешних ключей
+# у параллельных переназначений
+LOCK_ACTIVE_MEMBERS = (
+    select(User.id, User.user_id)
+    .join(TeamMember, User.id == TeamMember.member_id)
+    .where(and_(TeamMember.team_id == bindparam("team_id"), User.isActive == True))
+    .order_by(User.id)
+    .with_for_update(of=User, key_share=True)
+)
+DEACTIVATE_USERS = update(User.__table__).where(in_list(User.__table__.c.id, "user_ids")).values(isActive=False)
+ACTIVE_CANDIDATES = (
+    select(User.id)
+    .join(TeamMember, User.id == TeamMember.member_id)
+    .where(
+        and_(
+            User.isActive == True,
+            TeamMember.team_id == bindparam("team_id"),
+            not_in_list(User.id, "user_ids")
         )
-        return result.scalar_one_or_none()
+    )
+)
+_reviewing = select(Reviewers.pr_id).where(in_list(Reviewers.reviewer_id, "user_ids"))
+LOCK_OPEN_PRS = (
+    select(PullRequest.id)
+    .where(and_(PullRequest.id.in_(_reviewing), PullRequest.isMerged == False))
+    .order_by(PullRequest.id)
+    .with_for_update()
+)
+OPEN_REVIEWS = (
+    select(Reviewers.pr_id, Reviewers.reviewer_id, PullRequest.author_id, PullRequest.pull_request_id)
+    .join(PullRequest, Reviewers.pr_id == PullRequest.id)
+    .where(and_(in_list(Reviewers.reviewer_id, "user_ids"), PullRequest.isMerged == False))
+)
+USER_STRING_IDS = select(User.id, User.user_id).where(in_list(User.id, "user_ids"))
+
+
+@routed("team", "team_name")
+async def get_team_by_name(team_name: str) -> Optional[TeamRow]:
+    async with async_session_maker() as session:
+        return await fetch_team(session, team_name)
 
 
 async def get_or_create_user(user_id: str, username: str, is_active: bool, session) -> User:
@@ -31,27 +77,49 @@ async def get_or_create_user(user_id: str, username: str, is_active: bool, sessi
 
 
 async def add_team(team_name: str, members: List[TeamMemberSchema]) -> Dict:
+    # Новая команда размещается по хешу имени, уже известная проверяется на своём шарде
+    shard = shard_for_team(team_name)
+    if await directory.register("team", [team_name], shard):
+        shard = await directory.shard_of("team", team_name)
+    with use_shard(shard):
+        return await _add_team(team_name, members)
+
+
+async def _add_team(team_name: str, members: List[TeamMemberSchema]) -> Dict:
     async with async_session_maker() as session:
         existing_team = await get_team_by_name(team_name)
         if existing_team:
             raise ValueError("TEAM_EXISTS")
         
+        # Пользователь живёт на одном шарде — в команды других шардов его не добавить
+        if await directory.register("user", [member.user_id for member in members]):
+            raise ValueError("CROSS_SHARD_MEMBER")
+        
         new_team = Team(team_name=team_name)
         session.add(new_team)
         await session.flush()
         
         team_members_list = []
+        member_activity = {}
         for member in members:
             user = await get_or_create_user(member.user_id, member.username, member.is_active, session)
+            member_activity[user.id] = member.is_active
             team_member = TeamMember(team_id=new_team.id, member_id=user.id)
             session.add(team_member)
+            # Новая команда — самая молодая, основной она становится только для пользователя без команды
+            if user.primary_team_id is None:
+                user.primary_team_id = new_team.id
             team_members_list.append({
                 "user_id": member.user_id,
                 "username": member.username,
                 "is_active": member.is_active
             })
         
+        # Existing members may have changed their activity flag in other teams
+        await session.flush()
+        versions = await bump_roster_versions(session, list(member_activity))
         await session.commit()
+        assignment_engine.apply_versions(versions, member_activity)
         
         return {
             "team_name": team_name,
@@ -59,32 +127,300 @@ async def add_team(team_name: str, members: List[TeamMemberSchema]) -> Dict:
         }
 
 
-async def get_team(team_name: str) -> Optional[Dict]:
+@routed("team", "team_name")
+async def update_team(team_name: str, add: List[TeamMemberSchema], update_members: List[TeamMemberSchema],
+                      remove: List[str], reassign_removed: bool = False) -> Dict:
+    """
+    Применить к команде дифф состава одной транзакцией: добавить участников
+    (создав/обновив пользователей), обновить имя/активность участников, убрать
+    участников. Запросы затрагивают только пользователей из диффа; с
+    reassign_removed открытые ревью убранных участников на PR авторов
+    команды передаются оставшимся активным участникам
+    """
+    changes = {member.user_id: member for member in update_members}
+    changes.update({member.user_id: member for member in add})
+    if set(changes) & set(remove):
+        raise ValueError("CONFLICTING_MEMBERS")
     async with async_session_maker() as session:
-        team = await get_team_by_name(team_name)
+        # Параллельные диффы одной команды применяются по очереди
+        result = await session.execute(
+            select(Team).where(Team.team_name == team_name).with_for_update()
+        )
+        team = result.scalar_one_or_none()
         if not team:
-            return None
+            raise ValueError("NOT_FOUND")
+        if await directory.register("user", [member.user_id for member in add]):
+            raise ValueError("CROSS_SHARD_MEMBER")
         
         result = await session.execute(
-            select(User, TeamMember)
-            .join(TeamMember, User.id == TeamMember.member_id)
-            .where(TeamMember.team_id == team.id)
+            select(User.id, User.user_id, User.isActive, TeamMember.member_id.isnot(None))
+            .outerjoin(TeamMember, and_(TeamMember.member_id == User.id, TeamMember.team_id == team.id))
+            .where(User.user_id.in_(list(changes) + list(remove)))
         )
+        known = {user_id: (member_id, is_active, is_member) for member_id, user_id, is_active, is_member in result.all()}
+        add_ids = {member.user_id for member in add}
         
-        members = []
-        for user, _ in result.all():
-            members.append({
-                "user_id": user.user_id,
-                "username": user.name,
-                "is_active": user.isActive
-            })
+        missing = [member for member in add if member.user_id not in known]
+        missing_ids = {member.user_id for member in missing}
+        if missing:
+            inserted = await session.execute(
+                insert(User).returning(User.id, User.user_id),
+                [{"user_id": member.user_id, "name": member.username, "isActive": member.is_active}
+                 for member in missing]
+            )
+            for member_id, user_id in inserted.all():
+                known[user_id] = (member_id, changes[user_id].is_active, False)
+        
+        # Обновление участника, которого нет в команде, пропускается
+        edits = [
+            member for user_id, member in changes.items()
+            if user_id in known and user_id not in missing_ids
+            and (user_id in add_ids or known[user_id][2])
+        ]
+        if edits:
+            rows = values(
+                column('user_id', String), column('name', String), column('is_active', Boolean), name='edits'
+            ).data([(member.user_id, member.username, member.is_active) for member in edits])
+            await session.execute(
+                update(User)
+                .where(User.user_id == rows.c.user_id)
+                .values(name=rows.c.name, isActive=rows.c.is_active)
+                .execution_options(synchronize_session=False)
+            )
+        
+        added = [user_id for user_id in changes if user_id in add_ids and not known[user_id][2]]
+        if added:
+            await session.execute(
+                insert(TeamMember),
+                [{"team_id": team.id, "member_id": known[user_id][0]} for user_id in added]
+            )
+        removed = [user_id for user_id in remove if user_id in known and known[user_id][2]]
+        removed_ids = [known[user_id][0] for user_id in removed]
+        if removed_ids:
+            await session.execute(
+                delete(TeamMember)
+                .where(and_(TeamMember.team_id == team.id, TeamMember.member_id.in_(removed_ids)))
+            )
+        if added or removed_ids:
+            await refresh_primary_teams(session, [known[user_id][0] for user_id in added] + removed_ids)
+        
+        activity = {known[member.user_id][0]: member.is_active for member in edits + missing}
+        versions = await bump_roster_versions(session, list(activity), [team.id])
+        
+        replacements, reassignments = [], []
+        if reassign_removed and removed_ids:
+            replacements, reassignments = await _reassign_removed(session, team.id, removed, removed_ids)
+        
+        await events_service.record_events(session, [
+            events_service.make_event("DEACTIVATED", user_id=member.user_id)
+            for member in edits
+            if known[member.user_id][1] and not member.is_active
+        ] + [
+            events_service.make_event(
+                "REASSIGNED", item["pr_id"], item["new_reviewer_id"], item["old_reviewer_id"]
+            )
+            for item in reassignments
+        ])
+        await session.commit()
+        
+        # Состав команды изменился — её ростер перечитывается целиком, остальные патчатся
+        membership_changed = bool(added or removed_ids)
+        assignment_engine.apply_versions(
+            {team_id: version for team_id, version in versions.items()
+             if team_id != team.id or not membership_changed},
+            activity
+        )
+        if membership_changed:
+            assignment_engine.apply_versions({team.id: versions[team.id]})
+        assignment_engine.adjust_load([old for _, old, _, _ in replacements], -1)
+        assignment_engine.adjust_load([new for _, _, new, _ in replacements], 1)
+        pr_cache.invalidate(pr_string_id for _, _, _, pr_string_id in replacements)
+        
+        return {
+            "team_name": team_name,
+            "added": added,
+            "updated": [member.user_id for member in edits if member.user_id not in added],
+            "removed": removed,
+            "reassignments": reassignments
+        }
+
+
+async def _reassign_removed(session, team_id: int, removed: List[str], removed_ids: List[int]):
+    """Открытые ревью убранных участников на PR текущих участников команды"""
+    result = await session.execute(
+        select(
+            Reviewers.pr_id,
+            Reviewers.reviewer_id,
+            PullRequest.author_id,
+            PullRequest.pull_request_id
+        )
+        .join(PullRequest, Reviewers.pr_id == PullRequest.id)
+        .where(
+            and_(
+                Reviewers.reviewer_id.in_(removed_ids),
+                PullRequest.isMerged == False,
+                PullRequest.author_id.in_(select(TeamMember.member_id).where(TeamMember.team_id == team_id))
+            )
+        )
+    )
+    rows = result.all()
+    if not rows:
+        return [], []
+    
+    # Каждый кандидат используется один раз, автор и второй ревьювер отсекают не больше двух
+    candidates = await session.execute(
+        select(User.id)
+        .join(TeamMember, User.id == TeamMember.member_id)
+        .where(and_(TeamMember.team_id == team_id, User.isActive == True))
+        .limit(len(rows) + 2)
+    )
+    candidate_ids = [row[0] for row in candidates.all()]
+    existing_reviewers = await get_pr_reviewer_sets(session, {row[0] for row in rows})
+    replacements = pick_replacements(rows, candidate_ids, set(), existing_reviewers)
+    if not replacements:
+        return [], []
+    
+    for pr_id, old_reviewer_id, new_reviewer_id, _ in replacements:
+        await session.execute(
+            update(Reviewers)
+            .where(and_(Reviewers.pr_id == pr_id, Reviewers.reviewer_id == old_reviewer_id))
+            .values(reviewer_id=new_reviewer_id)
+        )
+    
+    string_ids = dict(zip(removed_ids, removed))
+    new_ids = await session.execute(
+        select(User.id, User.user_id).where(User.id.in_({row[2] for row in replacements}))
+    )
+    string_ids.update(new_ids.all())
+    return replacements, [
+        {
+            "pr_id": pr_string_id,
+            "old_reviewer_id": string_ids[old_reviewer_id],
+            "new_reviewer_id": string_ids[new_reviewer_id]
+        }
+        for _, old_reviewer_id, new_reviewer_id, pr_string_id in replacements
+    ]
+
+
+def _expected_primary_team(user_id_column):
+    return (
+        select(func.min(TeamMember.team_id))
+        .where(TeamMember.member_id == user_id_column)
+        .scalar_subquery()
+    )
+
+
+async def refresh_primary_teams(session, member_ids=None):
+    """
+    Пересчитать users.primary_team_id по teammembers после изменения состава команд.
+    member_ids — внутренние id или подзапрос; None — все пользователи
+    """
+    query = update(User).values(primary_team_id=_expected_primary_team(User.id))
+    if member_ids is not None:
+        query = query.where(User.id.in_(member_ids))
+    await session.execute(query)
+
+
+async def check_primary_teams(repair: bool = False) -> Dict:
+    """
+    POST /admin/checkPrimaryTeams
+    Сверка users.primary_team_id с teammembers (на каждом шарде); с repair=True расхождения исправляются
+    """
+    report = {"checked": 0, "mismatches": [], "repaired": 0}
+    for shard in range(SHARD_COUNT):
+        with use_shard(shard):
+            result = await _check_primary_teams(repair)
+        report["checked"] += result["checked"]
+        report["mismatches"].extend(result["mismatches"])
+        report["repaired"] += result["repaired"]
+    return report
+
+
+async def _check_primary_teams(repair: bool) -> Dict:
+    async with async_session_maker() as session:
+        expected = (
+            select(TeamMember.member_id, func.min(TeamMember.team_id).label("team_id"))
+            .group_by(TeamMember.member_id)
+            .subquery()
+        )
+        actual_team = aliased(Team)
+        expected_team = aliased(Team)
+        result = await session.execute(
+            select(User.id, User.user_id, actual_team.team_name, expected_team.team_name)
+            .outerjoin(expected, expected.c.member_id == User.id)
+            .outerjoin(actual_team, actual_team.id == User.primary_team_id)
+            .outerjoin(expected_team, expected_team.id == expected.c.team_id)
+            .where(User.primary_team_id.is_distinct_from(expected.c.team_id))
+            .order_by(User.id)
+        )
+        rows = result.all()
+        checked = (await session.execute(select(func.count()).select_from(User))).scalar()
+
+        if repair and rows:
+            await refresh_primary_teams(session, [row[0] for row in rows])
+            await session.commit()
+
+        return {
+            "checked": checked,
+            "mismatches": [
+                {"user_id": user_id, "primary_team": actual, "expected_team": expected_name}
+                for _, user_id, actual, expected_name in rows
+            ],
+            "repaired": len(rows) if repair else 0
+        }
+
+
+@single_flight
+@routed("team", "team_name")
+async def get_team(team_name: str) -> Optional[Dict]:
+    async with async_session_maker() as session:
+        team = await fetch_team(session, team_name)
+        if not team:
+            return None
+        
+        members = await fetch_team_members(session, team.id)
         
         return {
             "team_name": team_name,
-            "members": members
+            "members": [member._asdict() for member in members]
         }
 
 
+async def get_pr_reviewer_sets(session, pr_ids: Set[int]) -> Dict[int, Set[int]]:
+    """Текущие ревьюверы каждого PR"""
+    if not pr_ids:
+        return {}
+    result = await session.execute(PR_REVIEWER_SETS, {"pr_ids": list(pr_ids)})
+    reviewer_sets: Dict[int, Set[int]] = {}
+    for pr_id, reviewer_id in result.all():
+        reviewer_sets.setdefault(pr_id, set()).add(reviewer_id)
+    return reviewer_sets
+
+
+def pick_replacements(rows, candidate_ids: List[int], used_candidates: Set[int],
+                      existing_reviewers: Dict[int, Set[int]]) -> List[Tuple[int, int, int, str]]:
+    """
+    Подбор замены для строк (pr_id, old_reviewer_id, author_id, pr_string_id):
+    не автор, ещё не ревьювер этого PR, каждый кандидат используется один раз.
+    used_candidates и existing_reviewers обновляются на месте
+    """
+    replacements = []
+    for pr_id, old_reviewer_id, author_id, pr_string_id in rows:
+        reviewers = existing_reviewers.setdefault(pr_id, set())
+        for candidate_id in candidate_ids:
+            if (candidate_id != author_id
+                    and candidate_id not in used_candidates
+                    and candidate_id not in reviewers):
+                used_candidates.add(candidate_id)
+                reviewers.discard(old_reviewer_id)
+                reviewers.add(candidate_id)
+                replacements.append((pr_id, old_reviewer_id, candidate_id, pr_string_id))
+                break
+    return replacements
+
+
+@routed("team", "team_name")
+@retry_on_conflict
 async def bulk_deactivate_team(team_name: str) -> Dict:
     """
     Массовая деактивация пользователей команды с безопасным переназначением ревьюверов
@@ -94,17 +430,8 @@ async def bulk_deactivate_team(team_name: str) -> Dict:
         if not team:
             raise ValueError("NOT_FOUND")
         
-        # Получаем ID деактивируемых пользователей
-        team_users_result = await session.execute(
-            select(User.id, User.user_id)
-            .join(TeamMember, User.id == TeamMember.member_id)
-            .where(
-                and_(
-                    TeamMember.team_id == team.id,
-                    User.isActive == True
-                )
-            )
-        )
+        # Получаем ID деактивируемых пользователей и блокируем их строки
+        team_users_result = await session.execute(LOCK_ACTIVE_MEMBERS, {"team_id": team.id})
         active_users = {row[0]: row[1] for row in team_users_result.all()}
         active_user_ids = list(active_users.keys())
         
@@ -116,91 +443,74 @@ async def bulk_deactivate_team(team_name: str) -> Dict:
             }
         
         # Запрос 1: Деактивируем всех пользователей команды
-        await session.execute(
-            update(User)
-            .where(User.id.in_(active_user_ids))
-            .values(isActive=False)
-        )
+        await session.execute(DEACTIVATE_USERS, {"user_ids": active_user_ids})
+        versions = await bump_roster_versions(session, active_user_ids)
         
         # Запрос 2: Переназначаем ревьюверов на открытых PR
         # Находим активных кандидатов из той же команды (исключая деактивируемых)
-        candidates_result = await session.execute(
-            select(User.id)
-            .join(TeamMember, User.id == TeamMember.member_id)
-            .where(
-                and_(
-                    User.isActive == True,
-                    TeamMember.team_id == team.id,
-                    User.id.notin_(active_user_ids)
-                )
+        if ASSIGNMENT_ENGINE_ENABLED:
+            # Наименее загруженные первыми; версия до нашего bump — ростер ещё без деактивации
+            candidate_ids = await assignment_engine.candidates(
+                session, team.id, versions[team.id] - 1, set(active_user_ids)
             )
-        )
-        candidate_ids = [row[0] for row in candidates_result.all()]
+        else:
+            candidates_result = await session.execute(
+                ACTIVE_CANDIDATES, {"team_id": team.id, "user_ids": active_user_ids}
+            )
+            candidate_ids = [row[0] for row in candidates_result.all()]
+        # Кандидатов, которых прямо сейчас деактивирует кто-то другой, пропускаем
+        candidate_ids = await lock_candidates(session, candidate_ids)
+        replacements = []
+        reassignments = []
         
         if candidate_ids:
-            # Получаем открытые PR с деактивируемыми ревьюверами
-            prs_to_reassign = await session.execute(
-                select(
-                    Reviewers.pr_id,
-                    Reviewers.reviewer_id,
-                    PullRequest.author_id,
-                    PullRequest.pull_request_id
-                )
-                .join(PullRequest, Reviewers.pr_id == PullRequest.id)
-                .where(
-                    and_(
-                        Reviewers.reviewer_id.in_(active_user_ids),
-                        PullRequest.isMerged == False
-                    )
-                )
-            )
+            # Строки PR (по id) блокируются после своих пользователей: /pullRequest/reassign
+            # их не ждёт (FOR NO KEY UPDATE не мешает FK-проверкам, кандидаты берутся
+            # через SKIP LOCKED), а PR оба пути блокируют в одном порядке до чтения ревьюверов
+            await session.execute(LOCK_OPEN_PRS, {"user_ids": active_user_ids})
             
-            # Группируем по PR и находим замену
-            pr_updates = {}  # {pr_id: (old_reviewer_id, new_reviewer_id, pr_string_id)}
-            used_candidates = set()
-            
-            for pr_id, old_reviewer_id, author_id, pr_string_id in prs_to_reassign.all():
-                # Ищем кандидата (не автора, не использованного)
-                new_reviewer_id = None
-                for candidate_id in candidate_ids:
-                    if candidate_id != author_id and candidate_id not in used_candidates:
-                        new_reviewer_id = candidate_id
-                        used_candidates.add(candidate_id)
-                        break
-                
-                if new_reviewer_id:
-                    pr_updates[pr_id] = (old_reviewer_id, new_reviewer_id, pr_string_id)
+            # Получаем открытые PR с деактивируемыми ревьюверами
+            prs_to_reassign = await session.execute(OPEN_REVIEWS, {"user_ids": active_user_ids})
             
-            # Batch update всех переназначений
-            for pr_id, (old_reviewer_id, new_reviewer_id, _) in pr_updates.items():
-                await session.execute(
-                    update(Reviewers)
-                    .where(
-                        and_(
-                            Reviewers.pr_id == pr_id,
-                            Reviewers.reviewer_id == old_reviewer_id
-                        )
-                    )
-                    .values(reviewer_id=new_reviewer_id)
-                )
+            rows = prs_to_reassign.all()
+            existing_reviewers = await get_pr_reviewer_sets(session, {row[0] for row in rows})
+            replacements = pick_replacements(rows, candidate_ids, set(), existing_reviewers)
+        
+        if replacements:
+            # Все переназначения одним executemany
+            await session.execute(REPLACE_REVIEWER, [
+                {"pr": pr_id, "old_reviewer": old_reviewer_id, "new_reviewer": new_reviewer_id}
+                for pr_id, old_reviewer_id, new_reviewer_id, _ in replacements
+            ])
             
             # Формируем ответ
-            reassignments = []
-            for pr_id, (old_reviewer_id, new_reviewer_id, pr_string_id) in pr_updates.items():
-                old_reviewer_string_id = active_users.get(old_reviewer_id, "")
-                new_reviewer_string_id_result = await session.execute(
-                    select(User.user_id).where(User.id == new_reviewer_id)
-                )
-                new_reviewer_string_id = new_reviewer_string_id_result.scalar_one_or_none()
-                reassignments.append({
+            new_reviewers = await session.execute(
+                USER_STRING_IDS, {"user_ids": list({row[2] for row in replacements})}
+            )
+            string_ids = dict(new_reviewers.all())
+            reassignments = [
+                {
                     "pr_id": pr_string_id,
-                    "old_reviewer_id": old_reviewer_string_id,
-                    "new_reviewer_id": new_reviewer_string_id
-                })
-        else:
-            reassignments = []
+                    "old_reviewer_id": active_users.get(old_reviewer_id, ""),
+                    "new_reviewer_id": string_ids.get(new_reviewer_id)
+                }
+                for _, old_reviewer_id, new_reviewer_id, pr_string_id in replacements
+            ]
         
+        await events_service.record_events(session, [
+            events_service.make_event("DEACTIVATED", user_id=user_string_id)
+            for user_string_id in active_users.values()
+        ] + [
+            events_service.make_event(
+                "REASSIGNED", item["pr_id"], item["new_reviewer_id"], item["old_reviewer_id"]
+            )
+            for item in reassignments
+        ])
         await session.commit()
+        assignment_engine.apply_versions(versions, {user_id: False for user_id in active_user_ids})
+        assignment_engine.adjust_load([old for _, old, _, _ in replacements], -1)
+        assignment_engine.adjust_load([new for _, _, new, _ in replacements], 1)
+        pr_cache.invalidate(pr_string_id for _, _, _, pr_string_id in replacements)
         
         return {
             "team_name": team_name,
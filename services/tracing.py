@@ -0,0 +1,396 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from pydantic import BaseModel
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from config import (
+    TRACING_SAMPLE_RATE, TRACING_EXPORT_PATH, TRACING_OTLP_ENDPOINT,
+    TRACING_BATCH_SIZE, TRACING_QUEUE_SIZE, TRACING_EXPORT_INTERVAL_SECONDS
+)
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import sys
+import time
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+# Arguments worth seeing on a span; anything else (bodies, sessions) is left out
+ID_ATTRIBUTES = (
+    "user_id", "old_user_id", "author_id", "pull_request_id", "team_name", "job_id", "reviewer_id"
+)
+MAX_STATEMENT_LENGTH = 500
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: str,
+                 attributes: Optional[Dict] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def as_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """W3C traceparent "00-<trace id>-<parent id>-<flags>" -> (trace id, parent id, sampled)"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class JsonlExporter:
+    """One span per line, appended to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: List[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    async def export(self, spans: List[Span]):
+        await asyncio.to_thread(self._write, [json.dumps(span.as_dict()) + "\n" for span in spans])
+
+    async def close(self):
+        pass
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpExporter:
+    """POSTs batches as OTLP/HTTP JSON (ExportTraceServiceRequest) to a collector"""
+
+    def __init__(self, endpoint: str, service_name: str = "pr-reviewer-service"):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _payload(self, spans: List[Span]) -> Dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [
+                    {
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_id or "",
+                        "name": span.name,
+                        # SPAN_KIND_SERVER / SPAN_KIND_CLIENT / SPAN_KIND_INTERNAL
+                        "kind": {"server": 2, "client": 3}.get(span.kind, 1),
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [
+                            {"key": key, "value": _otlp_value(value)}
+                            for key, value in span.attributes.items()
+                        ],
+                        "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+                    }
+                    for span in spans
+                ]
+            }]
+        }]}
+
+    async def export(self, spans: List[Span]):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=5)
+        response = await self._client.post(self.endpoint, json=self._payload(spans))
+        response.raise_for_status()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class Tracer:
+    """
+    Head-sampled tracing with batched export. A trace starts at the HTTP
+    middleware (or continues an incoming traceparent, whose sampled flag
+    wins over TRACING_SAMPLE_RATE); everything below only creates spans
+    when a sampled span is current, so unsampled requests pay one ContextVar
+    lookup per instrumented call. Finished spans are buffered in a bounded
+    queue (overflow is dropped and counted) and flushed by a background task
+    """
+
+    def __init__(self, sample_rate: float, exporter, batch_size: int, queue_size: int,
+                 interval: float):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: Deque[Span] = deque(maxlen=queue_size)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.started = 0
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None,
+                    attributes: Optional[Dict] = None) -> Optional[Span]:
+        """Root span of a request, or None when the request is not sampled"""
+        incoming = parse_traceparent(traceparent)
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return None
+        self.started += 1
+        return Span(trace_id, parent_id, name, "server", attributes)
+
+    def start_span(self, name: str, kind: str = "internal", attributes: Optional[Dict] = None) -> Optional[Span]:
+        parent = current_span.get()
+        if parent is None:
+            return None
+        self.started += 1
+        return Span(parent.trace_id, parent.span_id, name, kind, attributes)
+
+    def end(self, span: Span, error: Optional[BaseException] = None):
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(span)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    @contextmanager
+    def activate(self, span: Optional[Span]) -> Iterator[Optional[Span]]:
+        """Make span current for the block and end it afterwards"""
+        if span is None:
+            yield None
+            return
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end(span, e)
+            raise
+        else:
+            self.end(span)
+        finally:
+            current_span.reset(token)
+
+    async def flush(self):
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                await self.exporter.export(batch)
+                self.exported += len(batch)
+            except Exception:
+                self.export_errors += 1
+                self.dropped += len(batch)
+                logger.exception("span export failed")
+                return
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        await self.exporter.close()
+
+    def stats(self) -> Dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "started": self.started,
+            "exported": self.exported,
+            "queued": len(self._queue),
+            "dropped": self.dropped,
+            "export_errors": self.export_errors
+        }
+
+
+tracer = Tracer(
+    TRACING_SAMPLE_RATE,
+    OtlpHttpExporter(TRACING_OTLP_ENDPOINT) if TRACING_OTLP_ENDPOINT else JsonlExporter(TRACING_EXPORT_PATH),
+    TRACING_BATCH_SIZE, TRACING_QUEUE_SIZE, TRACING_EXPORT_INTERVAL_SECONDS
+)
+
+
+def _id_attributes(arguments: Dict) -> Dict:
+    attributes = {}
+    for name, value in arguments.items():
+        if name in ID_ATTRIBUTES and isinstance(value, (str, int)):
+            attributes[name] = value
+        elif isinstance(value, BaseModel):
+            for field in ID_ATTRIBUTES:
+                field_value = getattr(value, field, None)
+                if isinstance(field_value, (str, int)):
+                    attributes[field] = field_value
+    return attributes
+
+
+def traced(fn: Callable, name: str, tracer: Tracer = tracer) -> Callable:
+    """Wrap a coroutine function in a span carrying its id arguments and result size"""
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if current_span.get() is None:
+            return await fn(*args, **kwargs)
+        try:
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+        except TypeError:
+            arguments = kwargs
+        with tracer.activate(tracer.start_span(name, attributes=_id_attributes(arguments))) as span:
+            result = await fn(*args, **kwargs)
+            if isinstance(result, (list, tuple)):
+                span.set("result.count", len(result))
+            return result
+
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def instrument_services(tracer: Tracer = tracer):
+    """Trace every coroutine function defined in an imported services.* module"""
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith("services.") or module_name == __name__ or module is None:
+            continue
+        for attr, value in list(vars(module).items()):
+            if (inspect.iscoroutinefunction(value) and value.__module__ == module_name
+                    and not getattr(value, "__traced__", False)):
+                setattr(module, attr, traced(value, f"{module_name.split('.', 1)[1]}.{attr}", tracer))
+
+
+def uninstrument_services():
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith("services.") or module is None:
+            continue
+        for attr, value in list(vars(module).items()):
+            if getattr(value, "__traced__", False):
+                setattr(module, attr, value.__wrapped__)
+
+
+def instrument_routes(app, tracer: Tracer = tracer):
+    """Trace route handlers: FastAPI calls dependant.call on every request"""
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is None or getattr(dependant.call, "__traced__", False):
+            continue
+        if inspect.iscoroutinefunction(dependant.call):
+            dependant.call = traced(dependant.call, f"route {route.path}", tracer)
+
+
+def uninstrument_routes(app):
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is not None and getattr(dependant.call, "__traced__", False):
+            dependant.call = dependant.call.__wrapped__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = tracer.start_span("db.query", "client")
+    if span is not None:
+        span.set("db.system", conn.dialect.name)
+        span.set("db.statement", statement[:MAX_STATEMENT_LENGTH])
+        if executemany:
+            span.set("db.batch_size", len(parameters))
+        context._tracing_span = span
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_tracing_span", None)
+    if span is not None:
+        context._tracing_span = None
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            span.set("db.rowcount", cursor.rowcount)
+        tracer.end(span)
+
+
+def _handle_error(exception_context):
+    context = exception_context.execution_context
+    span = getattr(context, "_tracing_span", None) if context is not None else None
+    if span is not None:
+        context._tracing_span = None
+        tracer.end(span, exception_context.original_exception)
+
+
+def instrument_engines():
+    """A span per SQL statement of every engine, as a child of the current span"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+def uninstrument_engines():
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.remove(Engine, "handle_error", _handle_error)
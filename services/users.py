@@ -1,59 +1,147 @@
 from models.models import *
-from models.database import async_session_maker
-from sqlalchemy import select, update
-from typing import List, Optional
+from models.database import async_session_maker, use_shard, current_shard, SHARD_COUNT
+from sqlalchemy import select, update, values, column, bindparam, and_, func, Integer, String, Boolean
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from services import events as events_service
+from services.single_flight import single_flight
+from services import archive as archive_service
+from services.reads import UserRow, fetch_user, fetch_reviews, in_list
+from services.assignment import assignment_engine, bump_roster_versions
+from services.shards import directory, routed
+from config import REVIEW_DELTA_MAX_CHANGES
 
 
-async def get_user_by_string_id(user_id: str) -> Optional[User]:
+# Hot statements, prebuilt (see services.reads)
+# Both ends of the change log: min(seq) is the oldest change kept (see
+# events.ReviewChangePurger), max(seq) the latest one committed
+REVIEW_CHANGE_BOUNDS = select(func.min(ReviewChange.seq), func.max(ReviewChange.seq))
+REVIEW_CHANGES = (
+    select(ReviewChange.seq, ReviewChange.pull_request_id)
+    .where(and_(ReviewChange.user_id == bindparam("user_id"), ReviewChange.seq > bindparam("since")))
+    .order_by(ReviewChange.seq)
+    .limit(bindparam("limit", type_=Integer))
+)
+USER_WITH_TEAM_NAME = (
+    select(User, Team.team_name)
+    .outerjoin(Team, Team.id == User.primary_team_id)
+    .where(User.user_id == bindparam("user_id"))
+)
+SET_IS_ACTIVE = (
+    update(User.__table__)
+    .where(User.__table__.c.id == bindparam("user_pk"))
+    .values(isActive=bindparam("is_active"))
+)
+USERS_WITH_TEAM_NAMES = (
+    select(User.user_id, User.name, User.isActive, Team.team_name)
+    .outerjoin(Team, Team.id == User.primary_team_id)
+    .where(in_list(User.user_id, "user_ids", String))
+)
+
+
+@routed("user", "user_id")
+async def get_user_by_string_id(user_id: str) -> Optional[UserRow]:
     """Get user by string ID"""
     async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.user_id == user_id)
-        )
-        return result.scalar_one_or_none()
+        return await fetch_user(session, user_id)
+
+
+def encode_review_token(seq: int, shard: Optional[int] = None) -> str:
+    """
+    next_token of getReview (and SSE id of reviewStream): the seq, qualified
+    with the shard (the current one by default) outside shard 0
+    """
+    shard = current_shard.get() if shard is None else shard
+    return str(seq) if shard == 0 else f"{shard}.{seq}"
 
 
-async def _get_user_string_id(session, user_id: int) -> str:
-    """Helper to get user string ID from internal ID"""
-    result = await session.execute(
-        select(User.user_id).where(User.id == user_id)
-    )
-    row = result.first()
-    return row[0] if row else ""
+def decode_review_token(token: str) -> Optional[Tuple[int, int]]:
+    """(shard, seq) of a next_token, None if it is malformed"""
+    shard, dot, seq = token.rpartition(".")
+    if not seq.isdigit() or (dot and not shard.isdigit()):
+        return None
+    return int(shard or 0), int(seq)
 
 
-async def get_review(user_id: str) -> List[dict]:
+@single_flight
+@routed("user", "user_id")
+async def get_review(user_id: str, include_archived: bool = False) -> Dict:
     """
     GET /users/getReview
-    Get PRs where the user is a reviewer
-    Returns list of PR short objects
+    Get PRs where the user is a reviewer; archived (old merged) PRs only on request
+    Returns list of PR short objects and a token for since= polling
     """
     async with async_session_maker() as session:
+        # Taken before the list: a change committed in between is sent again, not lost
+        _, latest = (await session.execute(REVIEW_CHANGE_BOUNDS)).one()
+        next_token = encode_review_token(latest or 0)
+        
         # Get user by string ID
-        user = await get_user_by_string_id(user_id)
+        user = await fetch_user(session, user_id)
         if not user:
-            return []
+            return {"pull_requests": [], "next_token": next_token}
         
-        # Get PRs where user is reviewer
+        # Get PRs where user is reviewer (column projection, author joined in)
+        prs = [review._asdict() for review in await fetch_reviews(session, user.id)]
+        
+        if include_archived:
+            prs.extend(await archive_service.get_archived_reviews(session, user.id))
+        
+        return {"pull_requests": prs, "next_token": next_token}
+
+
+@routed("user", "user_id")
+async def get_review_changes(user_id: str, since: str) -> Optional[Dict]:
+    """
+    GET /users/getReview?since=<token>
+    PRs whose entry in the user's list changed after the token, in their
+    current state, and the ids of those that left the list. A poll without
+    changes is one range scan of ix_reviewchanges_user_id_seq.
+    Returns None for a token of another shard (the user's team was moved)
+    or older than the retained change log: the client re-reads the full list
+    """
+    shard, since = decode_review_token(since)
+    if since and shard != current_shard.get():
+        return None
+    async with async_session_maker() as session:
+        # Read first: every change up to latest is committed by now (outbox
+        # lock), so a poll that finds none of the user's can skip to it
+        oldest, latest = (await session.execute(REVIEW_CHANGE_BOUNDS)).one()
+        if oldest is not None and since + 1 < oldest:
+            return None
         result = await session.execute(
-            select(PullRequest, Reviewers)
-            .join(Reviewers, PullRequest.id == Reviewers.pr_id)
-            .where(Reviewers.reviewer_id == user.id)
+            REVIEW_CHANGES, {"user_id": user_id, "since": since, "limit": REVIEW_DELTA_MAX_CHANGES}
         )
+        rows = result.all()
+        if not rows:
+            return {"pull_requests": [], "removed": [], "next_token": encode_review_token(max(since, latest or 0))}
         
-        prs = []
-        for pr, _ in result.all():
-            prs.append({
-                "pull_request_id": pr.pull_request_id,
-                "pull_request_name": pr.name,
-                "author_id": await _get_user_string_id(session, pr.author_id),
-                "status": "MERGED" if pr.isMerged else "OPEN"
-            })
+        changed = list(dict.fromkeys(pull_request_id for _, pull_request_id in rows))
+        user = await fetch_user(session, user_id)
+        current = await fetch_reviews(session, user.id, changed) if user else []
+        present = {review.pull_request_id for review in current}
         
-        return prs
+        return {
+            "pull_requests": [review._asdict() for review in current],
+            "removed": [pull_request_id for pull_request_id in changed if pull_request_id not in present],
+            "next_token": encode_review_token(rows[-1][0])
+        }
+
+
+@routed("user", "user_id")
+async def get_review_events(user_id: str, last_event_id: str, limit: int) -> Optional[List[Dict]]:
+    """
+    GET /users/reviewStream with Last-Event-ID
+    The user's events after that one, read from the user's shard.
+    Returns None for an id of another shard (the user's team was moved)
+    """
+    shard, after = decode_review_token(last_event_id)
+    if after and shard != current_shard.get():
+        return None
+    return await events_service.get_user_events(user_id, after, limit)
 
 
+@routed("user", "user_id")
 async def set_is_active(user_id: str, is_active: bool) -> Optional[dict]:
     """
     POST /users/setIsActive
@@ -61,30 +149,100 @@ async def set_is_active(user_id: str, is_active: bool) -> Optional[dict]:
     Returns user object with team_name
     """
     async with async_session_maker() as session:
-        user = await get_user_by_string_id(user_id)
-        if not user:
+        # User and team name in one lookup via users.primary_team_id
+        result = await session.execute(USER_WITH_TEAM_NAME, {"user_id": user_id})
+        row = result.first()
+        if not row:
             return None
+        user, team_name = row
+        was_active = user.isActive
         
-        await session.execute(
-            update(User)
-            .where(User.id == user.id)
-            .values(isActive=is_active)
-        )
+        await session.execute(SET_IS_ACTIVE, {"user_pk": user.id, "is_active": is_active})
+        versions = {}
+        if was_active != is_active:
+            versions = await bump_roster_versions(session, [user.id])
+        if was_active and not is_active:
+            await events_service.record_events(session, [
+                events_service.make_event("DEACTIVATED", user_id=user.user_id)
+            ])
         await session.commit()
-        
-        # Get team name
-        team_result = await session.execute(
-            select(Team.team_name)
-            .join(TeamMember, Team.id == TeamMember.team_id)
-            .where(TeamMember.member_id == user.id)
-            .limit(1)
-        )
-        team_row = team_result.first()
-        team_name = team_row[0] if team_row else ""
+        assignment_engine.apply_versions(versions, {user.id: is_active})
         
         return {
             "user_id": user.user_id,
             "username": user.name,
-            "team_name": team_name,
+            "team_name": team_name or "",
             "is_active": is_active
         }
+
+
+async def set_is_active_batch(items: List[Tuple[str, bool]]) -> Dict:
+    """
+    POST /users/setIsActiveBatch
+    Update isActive of many users with one UPDATE ... FROM (VALUES ...)
+    and one joined team lookup per shard; the last entry for a user wins
+    Returns user objects with team_name and the unknown user ids
+    """
+    requested = dict(items)
+    if SHARD_COUNT == 1:
+        return await _set_is_active_batch(requested)
+    
+    shards = await directory.shards_of("user", list(requested))
+    users = {}
+    for shard in sorted(set(shards.values())):
+        with use_shard(shard):
+            result = await _set_is_active_batch(
+                {user_id: is_active for user_id, is_active in requested.items() if shards[user_id] == shard}
+            )
+        users.update((user["user_id"], user) for user in result["users"])
+    return {
+        "users": [users[user_id] for user_id in requested if user_id in users],
+        "not_found": [user_id for user_id in requested if user_id not in users]
+    }
+
+
+async def _set_is_active_batch(requested: Dict[str, bool]) -> Dict:
+    async with async_session_maker() as session:
+        changes = values(
+            column('user_id', String), column('is_active', Boolean), name='changes'
+        ).data(list(requested.items()))
+        # Only rows whose flag actually flips, so the previous value is known
+        changed = await session.execute(
+            update(User)
+            .where(and_(User.user_id == changes.c.user_id, User.isActive != changes.c.is_active))
+            .values(isActive=changes.c.is_active)
+            .returning(User.id, User.user_id, User.isActive)
+            .execution_options(synchronize_session=False)
+        )
+        changed_rows = changed.all()
+        
+        result = await session.execute(USERS_WITH_TEAM_NAMES, {"user_ids": list(requested)})
+        found = {row[0]: row for row in result.all()}
+        
+        versions = {}
+        if changed_rows:
+            versions = await bump_roster_versions(session, [row[0] for row in changed_rows])
+        await events_service.record_events(session, [
+            events_service.make_event("DEACTIVATED", user_id=user_string_id)
+            for _, user_string_id, is_active in changed_rows
+            if not is_active
+        ])
+        await session.commit()
+        assignment_engine.apply_versions(versions, {user_id: is_active for user_id, _, is_active in changed_rows})
+        
+        users = []
+        for user_id in requested:
+            if user_id not in found:
+                continue
+            _, name, is_active, team_name = found[user_id]
+            users.append({
+                "user_id": user_id,
+                "username": name,
+                "team_name": team_name or "",
+                "is_active": is_active
+            })
+        
+        return {
+            "users": users,
+            "not_found": [user_id for user_id in requested if user_id not in found]
+        }
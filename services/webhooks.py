@@ -0,0 +1,358 @@
+from models.models import *
+from models.database import async_session_maker, use_shard, SHARD_COUNT
+from services import events as events_service
+from services.reads import fetch_team
+from services.shards import routed, shard_id, split_shard_id
+from sqlalchemy import select, update, delete, insert, func, and_, case, literal
+from sqlalchemy.orm import aliased
+from typing import List, Optional, Dict
+from datetime import datetime, timedelta
+from schemas import EventInfo
+from config import (
+    WEBHOOK_BATCH_SIZE, WEBHOOK_CLAIM_LIMIT, WEBHOOK_CONCURRENCY,
+    WEBHOOK_TIMEOUT_SECONDS, WEBHOOK_MAX_ATTEMPTS, WEBHOOK_BACKOFF_BASE_SECONDS,
+    WEBHOOK_BACKOFF_MAX_SECONDS, WEBHOOK_LEASE_SECONDS, WEBHOOK_POLL_INTERVAL_SECONDS
+)
+import asyncio
+import logging
+import random
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+CURSOR_ID = 1
+
+
+@routed("team", "team_name")
+async def add_webhook(team_name: str, url: str) -> Dict:
+    """
+    POST /webhooks/add
+    Register an endpoint for a team's assignment events, on the team's shard
+    """
+    async with async_session_maker() as session:
+        team = await fetch_team(session, team_name)
+        if not team:
+            raise ValueError("NOT_FOUND")
+
+        webhook = Webhook(team_id=team.id, url=url, createdAt=datetime.utcnow())
+        session.add(webhook)
+        await session.commit()
+
+        return {"webhook_id": shard_id(webhook.id), "team_name": team_name, "url": url}
+
+
+@routed("team", "team_name")
+async def list_webhooks(team_name: str) -> Optional[List[Dict]]:
+    """
+    GET /webhooks/list
+    Returns None if the team does not exist
+    """
+    async with async_session_maker() as session:
+        team = await fetch_team(session, team_name)
+        if not team:
+            return None
+
+        result = await session.execute(
+            select(Webhook.id, Webhook.url)
+            .where(Webhook.team_id == team.id)
+            .order_by(Webhook.id)
+        )
+        return [
+            {"webhook_id": shard_id(webhook_id), "team_name": team_name, "url": url}
+            for webhook_id, url in result.all()
+        ]
+
+
+async def remove_webhook(webhook_id: int) -> bool:
+    """
+    POST /webhooks/remove
+    Drops the endpoint together with its undelivered events
+    """
+    placement = split_shard_id(webhook_id)
+    if placement is None:
+        return False
+    shard, webhook_id = placement
+    async with async_session_maker(shard) as session:
+        await session.execute(
+            delete(WebhookDelivery).where(WebhookDelivery.webhook_id == webhook_id)
+        )
+        result = await session.execute(
+            delete(Webhook).where(Webhook.id == webhook_id)
+        )
+        await session.commit()
+        return result.rowcount > 0
+
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff with equal jitter: at least half the step, spread over the rest"""
+    ceiling = min(WEBHOOK_BACKOFF_MAX_SECONDS, WEBHOOK_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+async def enqueue_deliveries() -> int:
+    """
+    Turn outbox events past the cursor into delivery rows for every webhook of
+    the event's team. The cursor row lock keeps workers from double-enqueueing.
+    Works on the current shard: each one has its outbox, webhooks and cursor
+    """
+    async with async_session_maker() as session:
+        cursor = (await session.execute(
+            select(WebhookCursor).where(WebhookCursor.id == CURSOR_ID).with_for_update()
+        )).scalar_one_or_none()
+        if cursor is None:
+            # First run: start from now rather than replaying history
+            cursor = WebhookCursor(id=CURSOR_ID, last_seq=await _max_seq(session))
+            session.add(cursor)
+            await session.commit()
+            return 0
+
+        # Seq order is commit order (see events.record_events), so max(seq)
+        # bounds a fully committed prefix
+        upto = await _max_seq(session)
+        if upto <= cursor.last_seq:
+            return 0
+
+        author_team = aliased(TeamMember)
+        user_team = aliased(TeamMember)
+        team_id = func.coalesce(author_team.team_id, user_team.team_id)
+        result = await session.execute(
+            insert(WebhookDelivery).from_select(
+                ['webhook_id', 'event_seq', 'status', 'attempts', 'next_attempt_at'],
+                select(
+                    Webhook.id,
+                    AssignmentEvent.seq,
+                    literal('PENDING'),
+                    literal(0),
+                    AssignmentEvent.createdAt
+                )
+                .select_from(AssignmentEvent)
+                .outerjoin(PullRequest, PullRequest.pull_request_id == AssignmentEvent.pull_request_id)
+                .outerjoin(author_team, author_team.member_id == PullRequest.author_id)
+                .outerjoin(User, and_(
+                    AssignmentEvent.pull_request_id.is_(None),
+                    User.user_id == AssignmentEvent.user_id
+                ))
+                .outerjoin(user_team, user_team.member_id == User.id)
+                .join(Webhook, Webhook.team_id == team_id)
+                .where(
+                    and_(
+                        AssignmentEvent.seq > cursor.last_seq,
+                        AssignmentEvent.seq <= upto,
+                        AssignmentEvent.createdAt >= Webhook.createdAt
+                    )
+                )
+                .distinct()
+            )
+        )
+        cursor.last_seq = upto
+        await session.commit()
+        return result.rowcount
+
+
+async def _max_seq(session) -> int:
+    result = await session.execute(select(func.max(AssignmentEvent.seq)))
+    return result.scalar() or 0
+
+
+async def _claim_due_deliveries() -> List[Dict]:
+    """
+    Lease due deliveries so other workers skip them while we send.
+    A worker that dies mid-send leaves the lease to expire and be retried
+    """
+    now = datetime.utcnow()
+    async with async_session_maker() as session:
+        due_ids = (
+            select(WebhookDelivery.id)
+            .where(
+                and_(
+                    WebhookDelivery.status == 'PENDING',
+                    WebhookDelivery.next_attempt_at <= now
+                )
+            )
+            .order_by(WebhookDelivery.next_attempt_at)
+            .limit(WEBHOOK_CLAIM_LIMIT)
+            .with_for_update(skip_locked=True)
+        )
+        claimed = await session.execute(
+            update(WebhookDelivery)
+            .where(WebhookDelivery.id.in_(due_ids))
+            .values(next_attempt_at=now + timedelta(seconds=WEBHOOK_LEASE_SECONDS))
+            .returning(WebhookDelivery.id)
+        )
+        claimed_ids = [row[0] for row in claimed.all()]
+        if not claimed_ids:
+            await session.commit()
+            return []
+
+        result = await session.execute(
+            select(WebhookDelivery.id, WebhookDelivery.webhook_id, WebhookDelivery.attempts,
+                   Webhook.url, AssignmentEvent)
+            .join(Webhook, Webhook.id == WebhookDelivery.webhook_id)
+            .join(AssignmentEvent, AssignmentEvent.seq == WebhookDelivery.event_seq)
+            .where(WebhookDelivery.id.in_(claimed_ids))
+            .order_by(WebhookDelivery.webhook_id, WebhookDelivery.event_seq)
+        )
+        deliveries = [
+            {
+                "id": delivery_id,
+                "webhook_id": webhook_id,
+                "attempts": attempts,
+                "url": url,
+                "event": events_service.event_to_dict(event)
+            }
+            for delivery_id, webhook_id, attempts, url, event in result.all()
+        ]
+        await session.commit()
+        return deliveries
+
+
+async def _mark_delivered(delivery_ids: List[int]):
+    async with async_session_maker() as session:
+        await session.execute(
+            update(WebhookDelivery)
+            .where(WebhookDelivery.id.in_(delivery_ids))
+            .values(status='DELIVERED', last_error=None)
+        )
+        await session.commit()
+
+
+async def _mark_failed(failed_ids: List[int], held_ids: List[int], attempts: int, error: str):
+    """
+    Schedule a retry for the failed batch; later batches of the same endpoint
+    wait for the same moment so events stay in order
+    """
+    retry_at = datetime.utcnow() + timedelta(seconds=backoff_delay(attempts + 1))
+    async with async_session_maker() as session:
+        await session.execute(
+            update(WebhookDelivery)
+            .where(WebhookDelivery.id.in_(failed_ids))
+            .values(
+                attempts=WebhookDelivery.attempts + 1,
+                status=case(
+                    (WebhookDelivery.attempts + 1 >= WEBHOOK_MAX_ATTEMPTS, 'FAILED'),
+                    else_='PENDING'
+                ),
+                next_attempt_at=retry_at,
+                last_error=error[:255]
+            )
+        )
+        if held_ids:
+            await session.execute(
+                update(WebhookDelivery)
+                .where(WebhookDelivery.id.in_(held_ids))
+                .values(next_attempt_at=retry_at)
+            )
+        await session.commit()
+
+
+class WebhookDispatcher:
+    """
+    Background delivery of outbox events to team webhooks.
+    Runs in the app lifespan; request handlers only write the outbox, so
+    delivery adds nothing to their latency
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+        self._task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.failed = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=WEBHOOK_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=WEBHOOK_CONCURRENCY,
+                    max_keepalive_connections=WEBHOOK_CONCURRENCY
+                )
+            )
+        return self._client
+
+    async def _send_endpoint(self, url: str, deliveries: List[Dict]):
+        batches = [
+            deliveries[i:i + WEBHOOK_BATCH_SIZE]
+            for i in range(0, len(deliveries), WEBHOOK_BATCH_SIZE)
+        ]
+        for index, batch in enumerate(batches):
+            payload = {
+                "events": [EventInfo(**item["event"]).model_dump(mode="json") for item in batch]
+            }
+            error = None
+            try:
+                async with self._semaphore:
+                    response = await self._get_client().post(url, json=payload)
+                if not response.is_success:
+                    error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+
+            batch_ids = [item["id"] for item in batch]
+            if error is None:
+                await _mark_delivered(batch_ids)
+                self.delivered += len(batch_ids)
+                continue
+
+            held_ids = [item["id"] for later in batches[index + 1:] for item in later]
+            attempts = max(item["attempts"] for item in batch)
+            await _mark_failed(batch_ids, held_ids, attempts, error)
+            self.failed += len(batch_ids)
+            logger.warning("webhook %s: %s, retry #%d scheduled", url, error, attempts + 1)
+            return
+
+    async def run_once(self) -> int:
+        """One enqueue + send round on every shard; returns the number of events sent"""
+        sent = await asyncio.gather(*(self._run_shard(shard) for shard in range(SHARD_COUNT)))
+        return sum(sent)
+
+    async def _run_shard(self, shard: int) -> int:
+        with use_shard(shard):
+            await enqueue_deliveries()
+            deliveries = await _claim_due_deliveries()
+
+            by_endpoint: Dict[int, List[Dict]] = {}
+            for item in deliveries:
+                by_endpoint.setdefault(item["webhook_id"], []).append(item)
+            await asyncio.gather(*(
+                self._send_endpoint(items[0]["url"], items)
+                for items in by_endpoint.values()
+            ))
+            return len(deliveries)
+
+    async def _run(self):
+        while True:
+            waiter = events_service.notifier.waiter()
+            try:
+                sent = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("webhook dispatcher round failed")
+                sent = 0
+            if sent:
+                continue
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), WEBHOOK_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+dispatcher = WebhookDispatcher()
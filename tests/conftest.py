@@ -4,7 +4,10 @@ from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from models.models import Base
-from models.database import async_session_maker
+from models.database import async_session_maker, shard_engines
+from services.assignment import assignment_engine
+from services.shards import directory
+from services.pr_cache import pr_cache
 from main import app
 import os
 
@@ -46,16 +49,23 @@ async def client():
     original_session_maker = db_module.async_session_maker
     db_module.async_session_maker = TestSessionLocal
     
-    async with test_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Extra shards (SHARD_DATABASE_URLS) use the app's engines
+    for engine in [test_engine, *shard_engines[1:]]:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
     
     try:
         async with AsyncClient(app=app, base_url="http://test") as ac:
             yield ac
     finally:
 
-        async with test_engine.begin() as conn:
-            await conn.run_sync(Base.metadata.drop_all)
+        for engine in [test_engine, *shard_engines[1:]]:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
 
+        # Team ids are reused by the next test's fresh tables
+        assignment_engine.invalidate()
+        directory.invalidate()
+        pr_cache.clear()
         db_module.async_session_maker = original_session_maker
 
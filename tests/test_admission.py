@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from middleware.admission import (
+    AdmissionController, AdmissionControlMiddleware, CRITICAL, NORMAL, LOW
+)
+
+
+async def slow_app(scope, receive, send):
+    await asyncio.sleep(0.2)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+@pytest.mark.asyncio
+async def test_overload_is_shed_with_retry_after():
+    """Запрос, не получивший слот за отведённое время, сразу получает 503"""
+    controller = AdmissionController(limit=1, reserved=0, max_queue=10, max_wait=[0.05, 0.05, 0.05])
+    app = AdmissionControlMiddleware(slow_app, controller=controller)
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        first, second = await asyncio.gather(
+            client.get("/team/get"),
+            client.get("/team/get")
+        )
+
+    assert first.status_code == 200
+    assert second.status_code == 503
+    assert second.headers["Retry-After"] == "1"
+    assert second.json()["detail"]["error"]["code"] == "OVERLOADED"
+    assert controller.shed["timeout"][LOW] == 1
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_full_is_shed_immediately():
+    controller = AdmissionController(limit=1, reserved=0, max_queue=0, max_wait=[1, 1, 1])
+    assert await controller.acquire(NORMAL)
+    assert not await controller.acquire(CRITICAL)
+    assert controller.shed["queue_full"][CRITICAL] == 1
+
+
+@pytest.mark.asyncio
+async def test_critical_routes_are_favoured():
+    """Резерв слотов и очередь с приоритетами отдают место create/merge"""
+    controller = AdmissionController(limit=2, reserved=1, max_queue=10, max_wait=[1, 1, 1])
+
+    assert await controller.acquire(LOW)
+    # Последний слот зарезервирован под CRITICAL
+    low_waiter = asyncio.create_task(controller.acquire(LOW))
+    await asyncio.sleep(0)
+    assert not low_waiter.done()
+    assert await controller.acquire(CRITICAL)
+
+    critical_waiter = asyncio.create_task(controller.acquire(CRITICAL))
+    await asyncio.sleep(0)
+
+    # Освободившийся слот достаётся CRITICAL, хотя LOW ждёт дольше
+    controller.release()
+    assert await critical_waiter
+    assert not low_waiter.done()
+
+    controller.release()
+    controller.release()
+    assert await low_waiter
+    controller.release()
+    assert controller.in_flight == 0
@@ -1,5 +1,8 @@
 import pytest
+import asyncio
 from httpx import AsyncClient
+from config import ASSIGNMENT_ENGINE_ENABLED
+from models.database import engine
 
 
 @pytest.mark.asyncio
@@ -89,6 +92,43 @@ async def test_pr_merge(client: AsyncClient):
     assert response.json()["pr"]["status"] == "MERGED"
 
 
+@pytest.mark.asyncio
+async def test_concurrent_merge(client: AsyncClient):
+    """Одновременные merge одного PR записывают событие MERGED и снимают нагрузку один раз"""
+    from models.database import use_shard, shard_for_team
+    from services.assignment import assignment_engine
+
+    await client.post("/team/add", json={
+        "team_name": "merge-race",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u200", "u201", "u202")
+        ]
+    })
+    await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-7500", "pull_request_name": "Race", "author_id": "u200"
+    })
+
+    responses = await asyncio.gather(*(
+        client.post("/pullRequest/merge", json={"pull_request_id": "pr-7500"})
+        for _ in range(5)
+    ))
+    assert [response.status_code for response in responses] == [200] * 5
+    assert len({response.json()["pr"]["mergedAt"] for response in responses}) == 1
+
+    response = await client.get("/events", params={"after": 0, "timeout": 0})
+    merged = [
+        e for e in response.json()["events"]
+        if e["event_type"] == "MERGED" and e["pull_request_id"] == "pr-7500"
+    ]
+    assert len(merged) == 1
+
+    if ASSIGNMENT_ENGINE_ENABLED:
+        with use_shard(shard_for_team("merge-race")):
+            roster = next(roster for roster in assignment_engine._rosters.values() if "u200" in roster.user_ids)
+        assert list(roster.load) == [0, 0, 0]
+
+
 @pytest.mark.asyncio
 async def test_reviewer_reassignment(client: AsyncClient):
     """E2E тест: переназначение ревьювера"""
@@ -219,3 +259,1120 @@ async def test_error_cases(client: AsyncClient):
     response = await client.post("/pullRequest/create", json=pr_data)
     assert response.status_code == 409
 
+
+
+@pytest.mark.asyncio
+async def test_bulk_import(client: AsyncClient):
+    """E2E тест: импорт истории из NDJSON с отчётом об отклонённых записях"""
+
+    ndjson = "\n".join([
+        '{"type": "team", "team_name": "imported"}',
+        '{"type": "user", "user_id": "u20", "username": "Tom", "team_name": "imported"}',
+        '{"type": "user", "user_id": "u21", "username": "Uma", "team_name": "imported", "is_active": false}',
+        '{"type": "user", "user_id": "u22", "username": "Vic", "team_name": "ghosts"}',
+        '{"type": "pr", "pull_request_id": "pr-2001", "pull_request_name": "Old fix", "author_id": "u20",'
+        ' "isMerged": true, "createdAt": "2023-01-01T10:00:00Z", "mergedAt": "2023-01-02T10:00:00Z"}',
+        '{"type": "pr", "pull_request_id": "pr-2002", "pull_request_name": "Orphan", "author_id": "u99"}',
+        '{"type": "reviewer", "pull_request_id": "pr-2001", "reviewer_id": "u21"}',
+        'not json',
+    ])
+    response = await client.post(
+        "/admin/import",
+        content=ndjson,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["teams"] == 1
+    assert body["users"] == 2
+    assert body["pull_requests"] == 1
+    assert body["reviewers"] == 1
+    assert body["rejected"] == 3
+    assert {(r["line"], r["code"]) for r in body["rejects"]} == {
+        (4, "NOT_FOUND"), (6, "NOT_FOUND"), (8, "INVALID_RECORD")
+    }
+
+    # Исторические ревьюверы сохраняются как есть, даже неактивные
+    response = await client.get("/users/getReview?user_id=u21")
+    prs = response.json()["pull_requests"]
+    assert [(pr["pull_request_id"], pr["status"]) for pr in prs] == [("pr-2001", "MERGED")]
+
+    # Ревьюверы PR, не созданного этим импортом, отклоняются, а не добавляются к живому PR
+    ndjson = "\n".join([
+        '{"type": "user", "user_id": "u19", "username": "Sam", "team_name": "imported"}',
+        '{"type": "pr", "pull_request_id": "pr-2001", "pull_request_name": "Again", "author_id": "u20"}',
+        '{"type": "reviewer", "pull_request_id": "pr-2001", "reviewer_id": "u19"}',
+    ])
+    response = await client.post(
+        "/admin/import",
+        content=ndjson,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["pull_requests"] == 0
+    assert body["reviewers"] == 0
+    assert {(r["line"], r["code"]) for r in body["rejects"]} == {(2, "PR_EXISTS"), (3, "PR_EXISTS")}
+
+    response = await client.get("/users/getReview?user_id=u19")
+    assert response.json()["pull_requests"] == []
+
+
+@pytest.mark.asyncio
+async def test_events_long_poll(client: AsyncClient):
+    """E2E тест: лента событий назначений и пробуждение long-poll"""
+
+    team_data = {
+        "team_name": "platform",
+        "members": [
+            {"user_id": "u23", "username": "Walt", "is_active": True},
+            {"user_id": "u24", "username": "Xena", "is_active": True}
+        ]
+    }
+    await client.post("/team/add", json=team_data)
+    await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-3001",
+        "pull_request_name": "Events",
+        "author_id": "u23"
+    })
+
+    response = await client.get("/events?after=0&timeout=0")
+    assert response.status_code == 200
+    body = response.json()
+    assert [(e["event_type"], e["pull_request_id"], e["user_id"]) for e in body["events"]] == [
+        ("ASSIGNED", "pr-3001", "u24")
+    ]
+    after = body["next_after"]
+
+    response = await client.get(f"/events?after={after}&timeout=0")
+    assert response.json() == {"events": [], "next_after": after}
+
+    poll = asyncio.create_task(client.get(f"/events?after={after}&timeout=10"))
+    await asyncio.sleep(0.1)
+    assert not poll.done()
+    await client.post("/pullRequest/merge", json={"pull_request_id": "pr-3001"})
+
+    response = await asyncio.wait_for(poll, timeout=5)
+    events = response.json()["events"]
+    assert [(e["event_type"], e["pull_request_id"]) for e in events] == [("MERGED", "pr-3001")]
+    assert response.json()["next_after"] > after
+
+
+@pytest.mark.asyncio
+async def test_review_stream_hub(client: AsyncClient):
+    """E2E тест: хаб SSE доставляет назначение только подписанному ревьюверу"""
+    from services.review_hub import review_hub
+
+    team_data = {
+        "team_name": "mobile",
+        "members": [
+            {"user_id": "u25", "username": "Yuri", "is_active": True},
+            {"user_id": "u26", "username": "Zoe", "is_active": True}
+        ]
+    }
+    await client.post("/team/add", json=team_data)
+
+    response = await client.get("/users/reviewStream?user_id=nobody")
+    assert response.status_code == 404
+
+    reviewer = await review_hub.subscribe("u26")
+    author = await review_hub.subscribe("u25")
+    try:
+        await client.post("/pullRequest/create", json={
+            "pull_request_id": "pr-4001",
+            "pull_request_name": "Stream",
+            "author_id": "u25"
+        })
+        event = await asyncio.wait_for(reviewer.queue.get(), timeout=5)
+        assert (event["event_type"], event["pull_request_id"]) == ("ASSIGNED", "pr-4001")
+        assert author.queue.empty()
+    finally:
+        review_hub.unsubscribe(reviewer)
+        review_hub.unsubscribe(author)
+        await review_hub.stop()
+
+
+async def _create_team_with_open_reviews(client: AsyncClient, team_name: str, user_ids, pr_count: int):
+    await client.post("/team/add", json={
+        "team_name": team_name,
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in user_ids
+        ]
+    })
+    for i in range(pr_count):
+        await client.post("/pullRequest/create", json={
+            "pull_request_id": f"{team_name}-pr-{i}",
+            "pull_request_name": f"PR {i}",
+            "author_id": user_ids[i % len(user_ids)]
+        })
+
+
+@pytest.mark.asyncio
+async def test_bulk_deactivate_job(client: AsyncClient):
+    """E2E тест: массовая деактивация фоновой задачей"""
+    from services.jobs import job_runner
+
+    await _create_team_with_open_reviews(client, "infra", ["u27", "u28", "u29"], 4)
+
+    response = await client.post("/team/bulkDeactivateAsync", json={"team_name": "infra"})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.json()["status"] == "PENDING"
+
+    await job_runner.wait_idle()
+
+    response = await client.get(f"/jobs/{job_id}")
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "DONE"
+    assert job["processed"] == job["total"] == 8
+    assert sorted(job["result"]["deactivated_users"]) == ["u27", "u28", "u29"]
+    assert job["result"]["team_name"] == "infra"
+
+    response = await client.post("/team/bulkDeactivateAsync", json={"team_name": "nonexistent"})
+    assert response.status_code == 404
+    response = await client.get("/jobs/999999")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_bulk_deactivate_job_resumes(client: AsyncClient, monkeypatch):
+    """Задача, чей воркер умер посреди работы, продолжается с последнего коммита"""
+    from sqlalchemy import update
+    from models.database import async_session_maker
+    from models.models import Job
+    from services import jobs as job_service
+
+    await _create_team_with_open_reviews(client, "payments", ["u30", "u31", "u32"], 3)
+    monkeypatch.setattr(job_service, "JOB_CHUNK_SIZE", 2)
+
+    async with async_session_maker() as session:
+        job = Job(job_type=job_service.JOB_BULK_DEACTIVATE, team_name="payments", status="PENDING",
+                  total=0, processed=0, cursor_pr_id=0, cursor_reviewer_id=0, attempts=0)
+        session.add(job)
+        await session.commit()
+
+    # "Упавший" воркер успевает деактивировать команду и обработать один чанк
+    assert await job_service._claim(job.id, "dead-worker")
+    await job_service._deactivate_users(job.id, "dead-worker")
+    assert await job_service._reassign_chunk(job.id, "dead-worker")
+
+    progress = (await client.get(f"/jobs/{job.id}")).json()
+    assert (progress["status"], progress["processed"], progress["total"]) == ("RUNNING", 2, 6)
+
+    async with async_session_maker() as session:
+        await session.execute(update(Job).where(Job.id == job.id).values(lease_until=None))
+        await session.commit()
+
+    assert await job_service.job_runner.resume_stale() == 1
+    await job_service.job_runner.wait_idle()
+
+    job = (await client.get(f"/jobs/{job.id}")).json()
+    assert (job["status"], job["processed"], job["total"]) == ("DONE", 6, 6)
+
+    # Чанки идут через повтор при дедлоке, как reassign и bulkDeactivate
+    response = await client.get("/stats")
+    assert response.json()["conflict_retries"]["_reassign_chunk"]["calls"] >= 3
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalescing(client: AsyncClient, monkeypatch):
+    """200 одновременных одинаковых чтений выполняют запросы к БД один раз"""
+    from sqlalchemy import event
+    from models.database import engine
+    from services import single_flight
+    import middleware.admission
+
+    # Всплеск из 200 запросов не должен упираться в admission control
+    monkeypatch.setattr(middleware.admission, "ADMISSION_ENABLED", False)
+    await client.post("/team/add", json={
+        "team_name": "standup",
+        "members": [{"user_id": "u33", "username": "Ann", "is_active": True}]
+    })
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    async def burst():
+        statements.clear()
+        responses = await asyncio.gather(*(
+            client.get("/team/get?team_name=standup") for _ in range(200)
+        ))
+        assert all(response.status_code == 200 for response in responses)
+        return len(statements)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_ENABLED", False)
+        uncoalesced = await burst()
+        monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_ENABLED", True)
+        coalesced = await burst()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count_statement)
+
+    assert uncoalesced == 200 * 2
+    assert coalesced == 2
+    assert coalesced * 100 <= uncoalesced
+
+    response = await client.get("/stats")
+    assert response.json()["single_flight"]["get_team"]["coalesced"] >= 199
+
+
+@pytest.mark.asyncio
+async def test_single_flight_context():
+    """Общее чтение не наследует дедлайн и полосу лидера; каждый ждёт его в пределах своего дедлайна"""
+    from models.database import admin_lane, current_lane
+    from services.deadline import Deadline, DeadlineExceeded, current_deadline
+    from services.single_flight import SingleFlight
+    from config import REQUEST_TIMEOUT_SECONDS
+
+    group = SingleFlight("test")
+    seen = []
+
+    async def read():
+        seen.append((current_deadline.get().timeout, current_lane.get().name))
+        await asyncio.sleep(0.2)
+        return "team"
+
+    async def leader():
+        current_deadline.set(Deadline(0.05))
+        current_lane.set(admin_lane)
+        return await group.do("standup", read)
+
+    leading = asyncio.create_task(leader())
+    await asyncio.sleep(0)
+    following = asyncio.create_task(group.do("standup", read))
+
+    with pytest.raises(DeadlineExceeded):
+        await leading
+    assert await following == "team"
+    assert seen == [(REQUEST_TIMEOUT_SECONDS, "hot")]
+    assert group.stats() == {"calls": 2, "coalesced": 1, "in_flight": 0}
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shared_timeout():
+    """Истёкший общий бюджет даёт DeadlineExceeded каждому ждущему, даже с более длинным дедлайном"""
+    from services.deadline import Deadline, DeadlineExceeded, current_deadline
+    from services.single_flight import SingleFlight
+
+    group = SingleFlight("test")
+
+    async def read():
+        await asyncio.sleep(0.05)
+        # Как _handle_error при QUERY_CANCELED от statement_timeout
+        current_deadline.get().expired = True
+        raise RuntimeError("canceling statement due to statement timeout")
+
+    async def caller():
+        deadline = Deadline(30)
+        current_deadline.set(deadline)
+        with pytest.raises(DeadlineExceeded):
+            await group.do("standup", read)
+        return deadline.expired
+
+    assert await asyncio.gather(caller(), caller()) == [True, True]
+    assert group.stats() == {"calls": 2, "coalesced": 1, "in_flight": 0}
+
+
+@pytest.mark.asyncio
+async def test_bulkhead_isolates_hot_path(client: AsyncClient, monkeypatch):
+    """Пока админская полоса забита bulk-операциями, создание PR укладывается в SLO"""
+    import time
+    from sqlalchemy import select
+    import models.database as db_module
+    from models.database import admin_lane
+
+    slo_seconds = 0.3
+    await client.post("/team/add", json={
+        "team_name": "checkout",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u34", "u35", "u36")
+        ]
+    })
+    monkeypatch.setattr(admin_lane, "max_wait", 0.05)
+
+    release = asyncio.Event()
+    saturated = asyncio.Event()
+
+    async def bulk_operation():
+        # Держит слот полосы и обе свои коннекции к админскому пулу
+        async with admin_lane.enter():
+            async with db_module.async_session_maker() as outer, db_module.async_session_maker() as inner:
+                await outer.execute(select(1))
+                await inner.execute(select(1))
+                if admin_lane.in_flight == admin_lane.concurrency:
+                    saturated.set()
+                await release.wait()
+
+    hogs = [asyncio.create_task(bulk_operation()) for _ in range(admin_lane.concurrency)]
+    try:
+        await asyncio.wait_for(saturated.wait(), 5)
+
+        response = await client.post("/team/bulkDeactivate", json={"team_name": "checkout"})
+        assert response.status_code == 503
+        assert response.json()["detail"]["error"]["code"] == "LANE_BUSY"
+        assert "Retry-After" in response.headers
+
+        latencies = []
+        for i in range(10):
+            started = time.monotonic()
+            response = await client.post("/pullRequest/create", json={
+                "pull_request_id": f"pr-600{i}",
+                "pull_request_name": f"Checkout {i}",
+                "author_id": "u34"
+            })
+            latencies.append(time.monotonic() - started)
+            assert response.status_code == 201
+    finally:
+        release.set()
+        await asyncio.gather(*hogs)
+
+    assert max(latencies) < slo_seconds
+
+    lanes = (await client.get("/stats")).json()["lanes"]
+    assert lanes["admin"]["rejected"] >= 1
+    assert lanes["admin"]["in_flight"] == 0
+    assert lanes["hot"]["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_request_deadline(client: AsyncClient):
+    """Запрос, исчерпавший X-Request-Timeout, получает 504 с конвертом ошибки, а не 500"""
+    await client.post("/team/add", json={
+        "team_name": "billing",
+        "members": [{"user_id": "u37", "username": "Rita", "is_active": True}]
+    })
+
+    response = await client.get("/team/get?team_name=billing", headers={"X-Request-Timeout": "2"})
+    assert response.status_code == 200
+
+    response = await client.get("/team/get?team_name=billing", headers={"X-Request-Timeout": "0.000001"})
+    assert response.status_code == 504
+    assert response.json()["detail"]["error"]["code"] == "DEADLINE_EXCEEDED"
+
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-7001",
+        "pull_request_name": "Too slow",
+        "author_id": "u37"
+    }, headers={"X-Request-Timeout": "0.000001"})
+    assert response.status_code == 504
+
+    # Бюджет не утекает в следующие запросы
+    response = await client.get("/team/get?team_name=billing")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_archive_merged_prs(client: AsyncClient):
+    """Старые смёрдженные PR уезжают в архив и остаются доступны по запросу"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import update, select, func
+    from models.database import async_session_maker
+    from models.models import PullRequest
+    from services.archive import archiver
+
+    await _create_team_with_open_reviews(client, "legacy", ["u38", "u39", "u40"], 2)
+    await client.post("/pullRequest/merge", json={"pull_request_id": "legacy-pr-0"})
+
+    async with async_session_maker() as session:
+        await session.execute(
+            update(PullRequest)
+            .where(PullRequest.pull_request_id == "legacy-pr-0")
+            .values(mergedAt=datetime.utcnow() - timedelta(days=365))
+        )
+        await session.commit()
+
+    assert await archiver.run_once() == 1
+
+    async with async_session_maker() as session:
+        hot_prs = await session.execute(
+            select(func.count()).select_from(PullRequest).where(PullRequest.pull_request_id.like("legacy-%"))
+        )
+        assert hot_prs.scalar() == 1
+
+    reviewer = "u40"
+    response = await client.get(f"/users/getReview?user_id={reviewer}")
+    assert [pr["pull_request_id"] for pr in response.json()["pull_requests"]] == ["legacy-pr-1"]
+
+    response = await client.get(f"/users/getReview?user_id={reviewer}&include_archived=true")
+    prs = {pr["pull_request_id"]: pr["status"] for pr in response.json()["pull_requests"]}
+    assert prs == {"legacy-pr-0": "MERGED", "legacy-pr-1": "OPEN"}
+
+    response = await client.get("/pullRequest/list", params={"author_id": "u38"})
+    assert response.json()["pull_requests"] == []
+    response = await client.get("/pullRequest/list", params={"author_id": "u38", "include_archived": "true"})
+    assert [pr["pull_request_id"] for pr in response.json()["pull_requests"]] == ["legacy-pr-0"]
+
+    # Архивный PR по-прежнему смёрджен и занимает свой id
+    response = await client.post("/pullRequest/merge", json={"pull_request_id": "legacy-pr-0"})
+    assert response.status_code == 200
+    assert response.json()["pr"]["status"] == "MERGED"
+    assert sorted(response.json()["pr"]["assigned_reviewers"]) == ["u39", "u40"]
+
+    response = await client.post("/pullRequest/reassign", json={
+        "pull_request_id": "legacy-pr-0", "old_user_id": "u39"
+    })
+    assert response.status_code == 409
+    assert response.json()["detail"]["error"]["code"] == "PR_MERGED"
+
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "legacy-pr-0", "pull_request_name": "Again", "author_id": "u38"
+    })
+    assert response.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_list_pull_requests(client: AsyncClient):
+    """E2E тест: список PR с фильтрами и keyset-пагинацией"""
+    await _create_team_with_open_reviews(client, "release", ["u41", "u42", "u43"], 5)
+    await _create_team_with_open_reviews(client, "mobile", ["u44", "u45"], 2)
+    for pr_id in ("release-pr-0", "release-pr-3"):
+        await client.post("/pullRequest/merge", json={"pull_request_id": pr_id})
+
+    async def list_ids(**params):
+        ids, cursor = [], None
+        while True:
+            query = dict(params, limit=2, **({"cursor": cursor} if cursor else {}))
+            response = await client.get("/pullRequest/list", params=query)
+            assert response.status_code == 200
+            body = response.json()
+            assert len(body["pull_requests"]) <= 2
+            ids += [pr["pull_request_id"] for pr in body["pull_requests"]]
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return ids
+
+    assert await list_ids(team_name="release", status="OPEN") == ["release-pr-1", "release-pr-2", "release-pr-4"]
+    assert await list_ids(author_id="u41") == ["release-pr-0", "release-pr-3"]
+    assert await list_ids(team_name="mobile") == ["mobile-pr-0", "mobile-pr-1"]
+    assert await list_ids(reviewer_id="u45", status="OPEN") == ["mobile-pr-0"]
+    assert await list_ids(team_name="release", merged_from="2000-01-01T00:00:00") == ["release-pr-0", "release-pr-3"]
+    assert await list_ids(team_name="release", created_to="2000-01-01T00:00:00") == []
+    # Timezone-aware bounds are compared as UTC
+    assert await list_ids(team_name="release", merged_from="2000-01-01T00:00:00Z") == ["release-pr-0", "release-pr-3"]
+    assert await list_ids(team_name="release", created_to="2000-01-01T03:00:00+03:00") == []
+    assert await list_ids(team_name="nonexistent") == []
+
+    response = await client.get("/pullRequest/list", params={"cursor": "garbage"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["error"]["code"] == "INVALID_CURSOR"
+    response = await client.get("/pullRequest/list", params={"status": "DRAFT"})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_primary_team_consistency(client: AsyncClient):
+    """Основная команда пользователя — самая старая из его команд; сверка находит и чинит расхождения"""
+    from sqlalchemy import update
+    from models.database import async_session_maker
+    from models.models import User
+
+    for team_name, members in (("core", ["u46", "u47"]), ("guild", ["u47", "u48"])):
+        await client.post("/team/add", json={
+            "team_name": team_name,
+            "members": [{"user_id": user_id, "username": user_id, "is_active": True} for user_id in members]
+        })
+
+    response = await client.post("/users/setIsActive", json={"user_id": "u47", "is_active": True})
+    assert response.json()["user"]["team_name"] == "core"
+
+    response = await client.post("/admin/checkPrimaryTeams")
+    assert response.status_code == 200
+    assert response.json()["mismatches"] == []
+
+    async with async_session_maker() as session:
+        await session.execute(update(User).where(User.user_id == "u47").values(primary_team_id=None))
+        await session.commit()
+
+    response = await client.post("/admin/checkPrimaryTeams?repair=true")
+    assert response.json()["mismatches"] == [
+        {"user_id": "u47", "primary_team": None, "expected_team": "core"}
+    ]
+    assert response.json()["repaired"] == 1
+
+    response = await client.post("/admin/checkPrimaryTeams")
+    assert response.json()["mismatches"] == []
+
+
+@pytest.mark.asyncio
+async def test_upgrade_schema_adds_late_columns(client: AsyncClient):
+    """БД без users.primary_team_id и teams.roster_version: init_db добавляет колонки и заполняет их"""
+    from sqlalchemy import text
+    from models.database import upgrade_schema
+    from tests.conftest import test_engine
+
+    await client.post("/team/add", json={
+        "team_name": "legacy-schema",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("legacy-u1", "legacy-u2", "legacy-u3")
+        ]
+    })
+    async with test_engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE teams DROP COLUMN roster_version"))
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("ALTER TABLE users DROP COLUMN primary_team_id"))
+            await conn.execute(text("ALTER TABLE reviewchanges DROP COLUMN created_at"))
+        else:
+            # SQLite cannot drop a foreign key column: the column added by hand, still empty
+            await conn.execute(text("UPDATE users SET primary_team_id = NULL"))
+    async with test_engine.begin() as conn:
+        await upgrade_schema(conn)
+        # Idempotent: the next start finds the column in place
+        await upgrade_schema(conn)
+
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "legacy-schema-pr", "pull_request_name": "Upgraded", "author_id": "legacy-u1"
+    })
+    assert response.status_code == 201
+    assert sorted(response.json()["pr"]["assigned_reviewers"]) == ["legacy-u2", "legacy-u3"]
+    response = await client.post("/admin/checkPrimaryTeams")
+    assert response.json()["mismatches"] == []
+    response = await client.post("/team/update", json={
+        "team_name": "legacy-schema", "add": [{"user_id": "legacy-u4", "username": "legacy-u4", "is_active": True}]
+    })
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not ASSIGNMENT_ENGINE_ENABLED, reason="assignment engine is disabled")
+async def test_assignment_engine_roster(client: AsyncClient):
+    """Ревьюверы выбираются по наименьшей нагрузке; чужие изменения команды подхватываются по roster_version"""
+    from sqlalchemy import update
+    from models.database import async_session_maker
+    from models.models import User
+    from services.assignment import bump_roster_versions
+
+    await client.post("/team/add", json={
+        "team_name": "roster",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u49", "u50", "u51", "u52")
+        ]
+    })
+
+    first = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6010", "pull_request_name": "First", "author_id": "u49"
+    })
+    first_reviewers = first.json()["pr"]["assigned_reviewers"]
+    assert len(first_reviewers) == 2
+    assert "u49" not in first_reviewers
+
+    # Third member has no open reviews yet, so they must be picked next
+    idle = ({"u50", "u51", "u52"} - set(first_reviewers)).pop()
+    second = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6011", "pull_request_name": "Second", "author_id": "u49"
+    })
+    assert idle in second.json()["pr"]["assigned_reviewers"]
+
+    # Another worker deactivates the idle member behind this process's back
+    async with async_session_maker() as session:
+        result = await session.execute(
+            update(User).where(User.user_id == idle).values(isActive=False).returning(User.id)
+        )
+        await bump_roster_versions(session, [result.scalar_one()])
+        await session.commit()
+
+    third = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6012", "pull_request_name": "Third", "author_id": "u49"
+    })
+    assert sorted(third.json()["pr"]["assigned_reviewers"]) == sorted(first_reviewers)
+
+    response = await client.get("/stats")
+    assert response.json()["assignment"]["version_mismatches"] >= 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not ASSIGNMENT_ENGINE_ENABLED, reason="assignment engine is disabled")
+async def test_failed_create_gives_back_load(client: AsyncClient, monkeypatch):
+    """Неудавшееся создание PR не оставляет нагрузку на выбранных ревьюверах в ростере"""
+    import services.pull_request
+    from services.assignment import assignment_engine
+
+    await client.post("/team/add", json={
+        "team_name": "roster-rollback",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u53", "u54", "u55")
+        ]
+    })
+
+    async def failing_record_events(session, events):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(services.pull_request.events_service, "record_events", failing_record_events)
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6013", "pull_request_name": "Fails", "author_id": "u53"
+    })
+    assert response.status_code == 500
+    monkeypatch.undo()
+
+    roster = next(roster for roster in assignment_engine._rosters.values() if "u53" in roster.user_ids)
+    assert list(roster.load) == [0, 0, 0]
+
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6013", "pull_request_name": "Succeeds", "author_id": "u53"
+    })
+    assert sorted(response.json()["pr"]["assigned_reviewers"]) == ["u54", "u55"]
+    assert sorted(roster.load) == [0, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_set_is_active_batch(client: AsyncClient):
+    """Пакетное переключение активности: один ответ на пользователя, неизвестные — в not_found"""
+    await client.post("/team/add", json={
+        "team_name": "oncall",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u53", "u54", "u55")
+        ]
+    })
+
+    response = await client.post("/users/setIsActiveBatch", json={"users": [
+        {"user_id": "u53", "is_active": False},
+        {"user_id": "u54", "is_active": True},
+        {"user_id": "ghost", "is_active": False},
+        {"user_id": "u55", "is_active": True},
+        {"user_id": "u55", "is_active": False}
+    ]})
+    assert response.status_code == 200
+    assert response.json()["users"] == [
+        {"user_id": "u53", "username": "u53", "team_name": "oncall", "is_active": False},
+        {"user_id": "u54", "username": "u54", "team_name": "oncall", "is_active": True},
+        {"user_id": "u55", "username": "u55", "team_name": "oncall", "is_active": False}
+    ]
+    assert response.json()["not_found"] == ["ghost"]
+
+    # Only real flips are reported as deactivations
+    response = await client.get("/events", params={"after": 0, "timeout": 0})
+    deactivated = {event["user_id"] for event in response.json()["events"] if event["event_type"] == "DEACTIVATED"}
+    assert deactivated == {"u53", "u55"}
+
+    response = await client.post("/users/setIsActiveBatch", json={"users": []})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_team_update_diff(client: AsyncClient):
+    """Дифф состава команды: добавление, обновление, удаление и передача ревью убранного участника"""
+    await client.post("/team/add", json={
+        "team_name": "platform",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u56", "u57", "u58")
+        ]
+    })
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6013", "pull_request_name": "Infra", "author_id": "u56"
+    })
+    assert sorted(response.json()["pr"]["assigned_reviewers"]) == ["u57", "u58"]
+
+    response = await client.post("/team/update", json={
+        "team_name": "platform",
+        "add": [{"user_id": "u59", "username": "Newcomer", "is_active": True}],
+        "update": [
+            {"user_id": "u58", "username": "Renamed", "is_active": True},
+            {"user_id": "u60", "username": "Stranger", "is_active": True}
+        ],
+        "remove": ["u57"],
+        "reassign_removed": True
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["added"] == ["u59"]
+    assert body["updated"] == ["u58"]
+    assert body["removed"] == ["u57"]
+    assert body["reassignments"] == [{"pr_id": "pr-6013", "old_reviewer_id": "u57", "new_reviewer_id": "u59"}]
+
+    response = await client.get("/team/get", params={"team_name": "platform"})
+    members = {member["user_id"]: member["username"] for member in response.json()["members"]}
+    assert members == {"u56": "u56", "u58": "Renamed", "u59": "Newcomer"}
+
+    # Removed member is no longer picked for the team's new PRs
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6014", "pull_request_name": "Infra 2", "author_id": "u56"
+    })
+    assert sorted(response.json()["pr"]["assigned_reviewers"]) == ["u58", "u59"]
+
+    response = await client.post("/team/update", json={
+        "team_name": "platform",
+        "add": [{"user_id": "u57", "username": "u57", "is_active": True}],
+        "remove": ["u57"]
+    })
+    assert response.status_code == 400
+
+    response = await client.post("/team/update", json={"team_name": "missing", "remove": ["u57"]})
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key(client: AsyncClient):
+    """Повтор POST с тем же Idempotency-Key возвращает исходный ответ и не выполняет операцию повторно"""
+    await client.post("/team/add", json={
+        "team_name": "ci",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u61", "u62", "u63", "u64", "u65")
+        ]
+    })
+    pr_data = {"pull_request_id": "pr-6015", "pull_request_name": "Retry me", "author_id": "u61"}
+
+    first = await client.post("/pullRequest/create", json=pr_data, headers={"Idempotency-Key": "create-1"})
+    retry = await client.post("/pullRequest/create", json=pr_data, headers={"Idempotency-Key": "create-1"})
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+
+    # Without a key the retry runs again and conflicts
+    response = await client.post("/pullRequest/create", json=pr_data)
+    assert response.status_code == 409
+
+    response = await client.post("/pullRequest/create", json={**pr_data, "pull_request_name": "Other"},
+                                 headers={"Idempotency-Key": "create-1"})
+    assert response.status_code == 422
+
+    # Concurrent duplicates of a reassign swap the reviewer only once
+    old_reviewer = first.json()["pr"]["assigned_reviewers"][0]
+    reassign_data = {"pull_request_id": "pr-6015", "old_user_id": old_reviewer}
+    responses = await asyncio.gather(*[
+        client.post("/pullRequest/reassign", json=reassign_data, headers={"Idempotency-Key": "reassign-1"})
+        for _ in range(3)
+    ])
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["replaced_by"] for response in responses}) == 1
+
+    response = await client.get("/events", params={"after": 0, "timeout": 0})
+    reassigned = [event for event in response.json()["events"] if event["event_type"] == "REASSIGNED"]
+    assert len(reassigned) == 1
+
+    response = await client.get("/stats")
+    assert response.json()["idempotency"]["replayed"] >= 3
+
+
+@pytest.mark.asyncio
+async def test_review_delta_sync(client: AsyncClient):
+    """since= возвращает только изменившиеся PR ревьювера и удалённые из его списка"""
+    await client.post("/team/add", json={
+        "team_name": "delta",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u70", "u71", "u72", "u73")
+        ]
+    })
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6017", "pull_request_name": "Delta", "author_id": "u70"
+    })
+    old_reviewer = response.json()["pr"]["assigned_reviewers"][0]
+
+    response = await client.get("/users/getReview", params={"user_id": old_reviewer})
+    assert [pr["pull_request_id"] for pr in response.json()["pull_requests"]] == ["pr-6017"]
+    old_token = response.json()["next_token"]
+
+    # Nothing changed since the full fetch
+    response = await client.get("/users/getReview", params={"user_id": old_reviewer, "since": old_token})
+    assert response.json()["pull_requests"] == response.json()["removed"] == []
+    assert response.json()["next_token"] == old_token
+
+    response = await client.post("/pullRequest/reassign", json={
+        "pull_request_id": "pr-6017", "old_user_id": old_reviewer
+    })
+    new_reviewer = response.json()["replaced_by"]
+
+    response = await client.get("/users/getReview", params={"user_id": old_reviewer, "since": old_token})
+    assert response.json()["pull_requests"] == []
+    assert response.json()["removed"] == ["pr-6017"]
+
+    response = await client.get("/users/getReview", params={"user_id": new_reviewer, "since": "0"})
+    assert [pr["status"] for pr in response.json()["pull_requests"]] == ["OPEN"]
+    new_token = response.json()["next_token"]
+
+    await client.post("/pullRequest/merge", json={"pull_request_id": "pr-6017"})
+    response = await client.get("/users/getReview", params={"user_id": new_reviewer, "since": new_token})
+    assert [pr["status"] for pr in response.json()["pull_requests"]] == ["MERGED"]
+    assert response.json()["removed"] == []
+
+    for params in ({"since": "abc"}, {"since": "0", "include_archived": True}):
+        response = await client.get("/users/getReview", params={"user_id": new_reviewer, **params})
+        assert response.status_code == 400
+        assert response.json()["detail"]["error"]["code"] == "INVALID_TOKEN"
+
+
+@pytest.mark.asyncio
+async def test_review_changes_retention(client: AsyncClient):
+    """Старые записи журнала изменений удаляются; токен старше оставшегося журнала — INVALID_TOKEN"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import update, select, func
+    from models.database import async_session_maker
+    from models.models import ReviewChange
+    from services.events import review_change_purger
+
+    await client.post("/team/add", json={
+        "team_name": "retention",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u86", "u87", "u88")
+        ]
+    })
+    await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-6018", "pull_request_name": "Retention", "author_id": "u86"
+    })
+    response = await client.get("/users/getReview", params={"user_id": "u87"})
+    token = response.json()["next_token"]
+
+    async with async_session_maker() as session:
+        await session.execute(update(ReviewChange).values(created_at=datetime.utcnow() - timedelta(days=30)))
+        await session.commit()
+    assert await review_change_purger.purge_expired() >= 1
+    async with async_session_maker() as session:
+        # The newest change stays: it marks where the log starts
+        assert (await session.execute(select(func.count()).select_from(ReviewChange))).scalar() == 1
+
+    response = await client.get("/users/getReview", params={"user_id": "u87", "since": "0"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["error"]["code"] == "INVALID_TOKEN"
+
+    # A token from after the purged changes stays valid, idle polls keep it valid
+    response = await client.get("/users/getReview", params={"user_id": "u87", "since": token})
+    assert response.status_code == 200
+    assert response.json()["pull_requests"] == response.json()["removed"] == []
+    assert response.json()["next_token"] == token
+
+    await client.post("/pullRequest/merge", json={"pull_request_id": "pr-6018"})
+    response = await client.get("/users/getReview", params={"user_id": "u87", "since": token})
+    assert [pr["status"] for pr in response.json()["pull_requests"]] == ["MERGED"]
+
+    response = await client.get("/stats")
+    assert response.json()["review_changes"]["purged"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_pr_create_group_commit(client: AsyncClient, monkeypatch):
+    """Одновременные создания PR коммитятся пачками; каждый запрос получает свой результат"""
+    from services import pull_request as pr_service
+    import middleware.admission
+
+    monkeypatch.setattr(middleware.admission, "ADMISSION_ENABLED", False)
+    monkeypatch.setattr(pr_service, "PR_CREATE_BATCH_ENABLED", True)
+    monkeypatch.setattr(pr_service.create_batch, "window", 0.05)
+    await client.post("/team/add", json={
+        "team_name": "burst",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u74", "u75", "u76", "u77", "u78", "u79")
+        ]
+    })
+    batches_before = pr_service.create_batch.batches
+
+    requests = [
+        {"pull_request_id": f"pr-{7000 + i}", "pull_request_name": "Burst", "author_id": "u74"}
+        for i in range(30)
+    ]
+    requests.append({"pull_request_id": "pr-7000", "pull_request_name": "Duplicate", "author_id": "u75"})
+    requests.append({"pull_request_id": "pr-7100", "pull_request_name": "Ghost", "author_id": "ghost"})
+    responses = await asyncio.gather(*(client.post("/pullRequest/create", json=body) for body in requests))
+
+    assert sorted(response.status_code for response in responses[:31]) == [201] * 30 + [409]
+    assert responses[31].status_code == 404
+    assert pr_service.create_batch.batches - batches_before < len(requests)
+
+    load = {}
+    for response in responses[:31]:
+        if response.status_code != 201:
+            continue
+        reviewers = response.json()["pr"]["assigned_reviewers"]
+        assert len(reviewers) == 2 and "u74" not in reviewers
+        for reviewer in reviewers:
+            load[reviewer] = load.get(reviewer, 0) + 1
+    assert sum(load.values()) == 60
+    if ASSIGNMENT_ENGINE_ENABLED:
+        assert max(load.values()) - min(load.values()) <= 1
+
+    response = await client.get("/users/getReview", params={"user_id": "u75"})
+    assert len(response.json()["pull_requests"]) == load["u75"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="row locks (FOR UPDATE / SKIP LOCKED) need PostgreSQL")
+async def test_concurrent_reassign_and_bulk_deactivate(client: AsyncClient, monkeypatch):
+    """100 одновременных переназначений и массовая деактивация: без 500, состояние согласовано с лентой событий"""
+    from sqlalchemy import select
+    from models.database import async_session_maker
+    from models.models import PullRequest, Reviewers, User
+    import middleware.admission
+
+    monkeypatch.setattr(middleware.admission, "ADMISSION_ENABLED", False)
+    members = [f"u{n}" for n in range(80, 92)]
+    night = members[8:]
+    await client.post("/team/add", json={
+        "team_name": "stress",
+        "members": [{"user_id": user_id, "username": user_id, "is_active": True} for user_id in members]
+    })
+    await client.post("/team/add", json={
+        "team_name": "stress-night",
+        "members": [{"user_id": user_id, "username": user_id, "is_active": True} for user_id in night]
+    })
+
+    prs = {}
+    for i in range(20):
+        response = await client.post("/pullRequest/create", json={
+            "pull_request_id": f"pr-{7200 + i}", "pull_request_name": "Stress", "author_id": members[i % 4]
+        })
+        prs[f"pr-{7200 + i}"] = response.json()["pr"]["assigned_reviewers"]
+
+    pr_ids = list(prs)
+    reassigns = [
+        client.post("/pullRequest/reassign", json={
+            "pull_request_id": pr_ids[i % 20], "old_user_id": prs[pr_ids[i % 20]][i // 20 % 2]
+        })
+        for i in range(100)
+    ]
+    reassigns.insert(50, client.post("/team/bulkDeactivate", json={"team_name": "stress-night"}))
+    responses = await asyncio.gather(*reassigns)
+
+    assert all(response.status_code in (200, 409) for response in responses), \
+        [response.text for response in responses if response.status_code not in (200, 409)]
+    assert responses[50].status_code == 200
+
+    # Replaying the event feed gives exactly the reviewers in the DB
+    events = (await client.get("/events?after=0&timeout=0&limit=500")).json()["events"]
+    replayed = {pr_id: set() for pr_id in pr_ids}
+    deactivated_at = {}
+    for item in events:
+        if item["event_type"] == "ASSIGNED":
+            replayed[item["pull_request_id"]].add(item["user_id"])
+        elif item["event_type"] == "REASSIGNED":
+            replayed[item["pull_request_id"]].discard(item["old_user_id"])
+            replayed[item["pull_request_id"]].add(item["user_id"])
+            # Nobody is handed a review after their deactivation committed
+            assert item["user_id"] not in deactivated_at
+        elif item["event_type"] == "DEACTIVATED":
+            deactivated_at[item["user_id"]] = item["seq"]
+    assert set(deactivated_at) == set(night)
+
+    async with async_session_maker() as session:
+        rows = (await session.execute(
+            select(PullRequest.pull_request_id, User.user_id, PullRequest.author_id, User.id)
+            .join(Reviewers, Reviewers.pr_id == PullRequest.id)
+            .join(User, User.id == Reviewers.reviewer_id)
+        )).all()
+    stored = {pr_id: set() for pr_id in pr_ids}
+    for pr_id, reviewer, author_id, reviewer_id in rows:
+        assert reviewer_id != author_id
+        stored[pr_id].add(reviewer)
+    assert stored == replayed
+    assert all(len(reviewers) == 2 for reviewers in stored.values())
+
+    response = await client.get("/stats")
+    assert "reassign_reviewer" in response.json()["conflict_retries"]
+
+
+@pytest.mark.asyncio
+async def test_conflict_retry(monkeypatch):
+    """Дедлок и serialization failure повторяются с паузой, прочие ошибки — нет"""
+    from sqlalchemy.exc import DBAPIError
+    from services import retry
+
+    monkeypatch.setattr(retry, "CONFLICT_RETRY_BASE_SECONDS", 0.001)
+
+    class DriverError(Exception):
+        def __init__(self, sqlstate):
+            super().__init__(sqlstate)
+            self.sqlstate = sqlstate
+
+    calls = []
+
+    async def flaky(sqlstate, failures):
+        calls.append(sqlstate)
+        if len(calls) <= failures:
+            raise DBAPIError("UPDATE reviewers", {}, DriverError(sqlstate))
+        return "done"
+
+    group = retry.ConflictRetry("flaky", attempts=3)
+    assert await group.run(flaky, retry.DEADLOCK_DETECTED, 2) == "done"
+    assert group.stats() == {"calls": 1, "retries": 2, "exhausted": 0}
+
+    calls.clear()
+    with pytest.raises(DBAPIError):
+        await group.run(flaky, retry.SERIALIZATION_FAILURE, 5)
+    assert len(calls) == 3 and group.exhausted == 1
+
+    calls.clear()
+    with pytest.raises(DBAPIError):
+        await group.run(flaky, "23505", 1)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_pr_get_cache(client: AsyncClient, monkeypatch):
+    """GET /pullRequest/get: кеш заполняется записью и чтением, массовые переназначения его сбрасывают"""
+    from services import pr_cache as pr_cache_module
+    from services.pr_cache import PullRequestCache, pr_cache
+
+    monkeypatch.setattr(pr_cache_module, "PR_CACHE_ENABLED", True)
+
+    await client.post("/team/add", json={
+        "team_name": "cached",
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in ("u92", "u93", "u94", "u95", "u96")
+        ]
+    })
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-7300", "pull_request_name": "Cached", "author_id": "u92"
+    })
+    created = response.json()["pr"]
+
+    hits = pr_cache.hits
+    response = await client.get("/pullRequest/get", params={"pull_request_id": "pr-7300"})
+    assert response.status_code == 200
+    assert response.json()["pr"] == created
+    assert pr_cache.hits == hits + 1
+
+    # A miss assembles the same payload from the database
+    pr_cache.clear()
+    misses = pr_cache.misses
+    response = await client.get("/pullRequest/get", params={"pull_request_id": "pr-7300"})
+    assert response.json()["pr"] == created
+    assert pr_cache.misses == misses + 1
+
+    removed = created["assigned_reviewers"][0]
+    response = await client.post("/team/update", json={
+        "team_name": "cached", "remove": [removed], "reassign_removed": True
+    })
+    new_reviewer = response.json()["reassignments"][0]["new_reviewer_id"]
+    response = await client.get("/pullRequest/get", params={"pull_request_id": "pr-7300"})
+    reviewers = response.json()["pr"]["assigned_reviewers"]
+    assert removed not in reviewers and new_reviewer in reviewers
+
+    response = await client.post("/pullRequest/reassign", json={
+        "pull_request_id": "pr-7300", "old_user_id": new_reviewer
+    })
+    reassigned = response.json()["pr"]
+    response = await client.get("/pullRequest/get", params={"pull_request_id": "pr-7300"})
+    assert response.json()["pr"] == reassigned
+    assert new_reviewer not in response.json()["pr"]["assigned_reviewers"]
+
+    await client.post("/pullRequest/merge", json={"pull_request_id": "pr-7300"})
+    response = await client.get("/pullRequest/get", params={"pull_request_id": "pr-7300"})
+    assert response.json()["pr"]["status"] == "MERGED"
+
+    response = await client.get("/pullRequest/get", params={"pull_request_id": "pr-missing"})
+    assert response.status_code == 404
+    response = await client.get("/stats")
+    assert response.json()["pr_cache"]["hits"] == pr_cache.hits
+
+    # Bounded LRU; a read that raced a write does not fill
+    cache = PullRequestCache(size=2, ttl=60)
+    for pull_request_id in ("a", "b", "c"):
+        cache.put({**created, "pull_request_id": pull_request_id})
+    assert cache.get("a") is None and cache.get("c") is not None
+    assert cache.evictions == 1
+    epoch = cache.epoch()
+    cache.invalidate(["b"])
+    cache.fill({**created, "pull_request_id": "b"}, epoch)
+    assert cache.get("b") is None and cache.stale_fills == 1
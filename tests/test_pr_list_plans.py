@@ -0,0 +1,122 @@
+"""
+Plan check for GET /pullRequest/list: on a multi-million-row table every
+filter combination must be served by an index range scan, never a full scan.
+
+Seeding takes a while, so the test is opt-in and Postgres-only:
+
+    RUN_PLAN_CHECK=1 PLAN_CHECK_ROWS=2000000 pytest tests/test_pr_list_plans.py
+"""
+from datetime import datetime, timedelta
+import json
+import os
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from models.database import engine, async_session_maker
+from services.pull_request import build_list_query
+
+
+PLAN_CHECK_ROWS = int(os.getenv("PLAN_CHECK_ROWS", "2000000"))
+USERS = 20000
+TEAM_SIZE = 10
+
+pytestmark = pytest.mark.skipif(
+    os.getenv("RUN_PLAN_CHECK") != "1" or engine.dialect.name != "postgresql",
+    reason="set RUN_PLAN_CHECK=1 and run against PostgreSQL"
+)
+
+SEED_SQL = [
+    f"""
+    INSERT INTO users (user_id, name, "isActive")
+    SELECT 'plan-u' || g, 'plan-u' || g, true FROM generate_series(1, {USERS}) g
+    """,
+    f"""
+    INSERT INTO teams (team_name)
+    SELECT 'plan-t' || g FROM generate_series(1, {USERS // TEAM_SIZE}) g
+    """,
+    f"""
+    INSERT INTO teammembers (team_id, member_id)
+    SELECT t.id, u.id FROM users u
+    JOIN teams t ON t.team_name = 'plan-t' || ((substr(u.user_id, 7)::int - 1) / {TEAM_SIZE} + 1)
+    WHERE u.user_id LIKE 'plan-u%'
+    """,
+    f"""
+    INSERT INTO pullrequests (pull_request_id, name, author_id, "isMerged", "createdAt", "mergedAt")
+    SELECT 'plan-pr-' || g, 'PR ' || g, u.min_id + g % {USERS}, g % 10 <> 0,
+           timestamp '2024-01-01' + g * interval '10 seconds',
+           CASE WHEN g % 10 <> 0 THEN timestamp '2024-01-02' + g * interval '10 seconds' END
+    FROM generate_series(1, {PLAN_CHECK_ROWS}) g, (SELECT min(id) AS min_id FROM users) u
+    """,
+    f"""
+    INSERT INTO reviewers (pr_id, reviewer_id)
+    SELECT p.id, u.min_id + (p.author_id - u.min_id + k) % {USERS}
+    FROM pullrequests p, generate_series(1, 2) k, (SELECT min(id) AS min_id FROM users) u
+    """,
+    "ANALYZE",
+]
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+async def _explain(session, query):
+    compiled = query.compile(dialect=engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    result = await raw_connection.driver_connection.fetchval(
+        f"EXPLAIN (FORMAT JSON) {compiled.string}", *params
+    )
+    return json.loads(result)[0]["Plan"]
+
+
+@pytest.mark.asyncio
+async def test_list_filters_use_index_range_scans(client: AsyncClient):
+    async with async_session_maker() as session:
+        for statement in SEED_SQL:
+            await session.execute(text(statement))
+        await session.commit()
+
+        ids = (await session.execute(text(
+            "SELECT (SELECT id FROM users WHERE user_id = 'plan-u77'), "
+            "(SELECT id FROM teams WHERE team_name = 'plan-t7')"
+        ))).first()
+        user_id, team_id = ids
+        since = datetime(2024, 2, 1)
+        until = since + timedelta(days=1)
+
+        # Filters -> the index (any of them, where the planner may pick either) driving the scan
+        author, created, merged, open_ids, reviewer = (
+            "ix_pullrequests_author_id_id", "ix_pullrequests_created_at_id", "ix_pullrequests_merged_at_id",
+            "ix_pullrequests_open_id", "ix_reviewers_reviewer_id_pr_id"
+        )
+        combinations = {
+            "open": (dict(status="OPEN"), {open_ids}),
+            "author": (dict(author_id=user_id), {author}),
+            "author+open": (dict(author_id=user_id, status="OPEN"), {author}),
+            "team+open": (dict(team_id=team_id, status="OPEN"), {author}),
+            "reviewer": (dict(reviewer_id=user_id), {reviewer}),
+            "reviewer+open": (dict(reviewer_id=user_id, status="OPEN"), {reviewer}),
+            "merged range": (dict(status="MERGED", merged_from=since, merged_to=until), {merged}),
+            "created range": (dict(created_from=since, created_to=until), {created}),
+            "team+merged range": (dict(team_id=team_id, merged_from=since, merged_to=until), {author, merged}),
+            "author, next page": (dict(author_id=user_id, after=(None, 1000)), {author}),
+            "merged range, next page": (dict(merged_from=since, merged_to=until, after=(since, 1000)), {merged}),
+        }
+        for name, (filters, expected) in combinations.items():
+            plan = await _explain(session, build_list_query(**filters))
+            nodes = list(_plan_nodes(plan))
+            assert all(
+                node["Node Type"] != "Seq Scan" for node in nodes
+                if node.get("Relation Name") in ("pullrequests", "reviewers")
+            ), (name, nodes)
+            index_scans = {
+                node["Index Name"] for node in nodes
+                if node["Node Type"] in ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+            }
+            assert index_scans & expected, (name, index_scans)
@@ -0,0 +1,76 @@
+import json
+import pytest
+from httpx import AsyncClient
+
+from main import app
+from middleware.recording import TrafficRecordingMiddleware
+from services.recording import TrafficRecorder
+from benchmarks import replay
+
+
+def test_replay_diff():
+    recorded = {"pr": {"status": "OPEN", "assigned_reviewers": ["u1", "u2"], "createdAt": "a"}}
+    replayed = {"pr": {"status": "OPEN", "assigned_reviewers": ["u1", "u3"], "createdAt": "b"}}
+    assert replay.diff(recorded, recorded) == []
+    assert replay.diff(recorded, replayed) == ["pr.assigned_reviewers.1"]
+    assert replay.diff([1], [1, 2]) == ["."]
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay(client, tmp_path, capsys, monkeypatch):
+    """Записанный трафик проигрывается заново: чтения совпадают, повторные записи дают другой статус"""
+    import middleware.idempotency
+
+    monkeypatch.setattr(middleware.idempotency, "IDEMPOTENCY_ENABLED", True)
+    path = tmp_path / "traffic.jsonl"
+    recorder = TrafficRecorder(str(path), 1.0, max_body_bytes=1024, batch_size=100, queue_size=1000, interval=60)
+
+    async with AsyncClient(app=TrafficRecordingMiddleware(app, recorder), base_url="http://test") as recording:
+        await recording.post("/team/add", json={
+            "team_name": "recorded",
+            "members": [
+                {"user_id": user_id, "username": user_id, "is_active": True}
+                for user_id in ("u97", "u98", "u99")
+            ]
+        })
+        await recording.post("/pullRequest/create", json={
+            "pull_request_id": "pr-7400", "pull_request_name": "Recorded", "author_id": "u97"
+        }, headers={"Idempotency-Key": "pr-7400"})
+        await recording.get("/pullRequest/get", params={"pull_request_id": "pr-7400"})
+        await recording.get("/team/get", params={"team_name": "missing"})
+        await recording.get("/stats")
+        # Body over the limit: recorded without it
+        await recording.post("/pullRequest/create", json={
+            "pull_request_id": "pr-7401", "pull_request_name": "x" * 2000, "author_id": "ghost"
+        })
+    await recorder.flush()
+
+    records = replay.load_recording(str(path))
+    assert [(record["method"], record["path"], record["status"]) for record in records] == [
+        ("POST", "/team/add", 201),
+        ("POST", "/pullRequest/create", 201),
+        ("GET", "/pullRequest/get", 200),
+        ("GET", "/team/get", 404),
+        ("POST", "/pullRequest/create", 404),
+    ]
+    create = records[1]
+    assert json.loads(create["body"])["pull_request_id"] == "pr-7400"
+    assert create["headers"]["idempotency-key"] == "pr-7400"
+    assert create["response"]["pr"]["author_id"] == "u97"
+    assert records[2]["query"] == "pull_request_id=pr-7400"
+    assert records[4]["truncated"] and records[4]["body"] is None
+    assert recorder.stats()["written"] == 5 and recorder.oversized == 1
+
+    # Same database: the team exists now, the create is an idempotent replay
+    async with AsyncClient(app=app, base_url="http://test") as target:
+        results = await replay.replay(records, target, speed=0)
+    totals = replay.report(records, results)
+    assert totals["replayed"] == 4 and totals["skipped"] == 1
+    assert totals["status_diffs"] == 1 and totals["body_diffs"] == 0
+    assert "/team/add: status 201 -> 400" in capsys.readouterr().out
+
+    # Nothing sampled at rate 0
+    silent = TrafficRecorder(str(path), 0.0, 1024, 100, 1000, 60)
+    async with AsyncClient(app=TrafficRecordingMiddleware(app, silent), base_url="http://test") as recording:
+        await recording.get("/team/get", params={"team_name": "recorded"})
+    assert silent.recorded == 0
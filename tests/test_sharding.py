@@ -0,0 +1,237 @@
+import pytest
+from collections import Counter
+from httpx import AsyncClient
+from models.database import SHARD_COUNT, shard_for_team, async_session_maker, use_shard
+from services import shards as shard_service
+from services.reads import fetch_team, fetch_pull_request
+from services.users import encode_review_token, decode_review_token
+
+
+def test_team_placement():
+    """Размещение по хешу имени стабильно, равномерно и почти не меняется при добавлении шарда"""
+    names = [f"team-{i}" for i in range(3000)]
+    three = [shard_for_team(name, 3) for name in names]
+    assert three == [shard_for_team(name, 3) for name in names]
+    assert min(Counter(three).values()) > 900
+
+    # A new shard only takes teams, about a quarter of them
+    four = [shard_for_team(name, 4) for name in names]
+    assert all(after in (before, 3) for before, after in zip(three, four))
+    assert 600 < four.count(3) < 900
+
+    assert shard_for_team("team-0", 1) == 0
+
+
+def test_review_token_shard():
+    assert encode_review_token(12) == "12"
+    with use_shard(2):
+        assert encode_review_token(12) == "2.12"
+    assert decode_review_token("12") == (0, 12)
+    assert decode_review_token("2.12") == (2, 12)
+    for token in ("", "x", "2.", ".12", "a.12", "-1"):
+        assert decode_review_token(token) is None
+
+
+async def _on_shard(shard: int, team_name: str, pull_request_id: str):
+    async with async_session_maker(shard) as session:
+        return await fetch_team(session, team_name), await fetch_pull_request(session, pull_request_id)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(SHARD_COUNT == 1, reason="needs SHARD_DATABASE_URLS")
+async def test_sharded_teams(client: AsyncClient):
+    """Команды живут на своих шардах, id уникальны глобально, команду можно перенести"""
+    names = [f"sharded-{i}" for i in range(50)]
+    first = names[0]
+    second = next(name for name in names if shard_for_team(name) != shard_for_team(first))
+    first_shard, second_shard = shard_for_team(first), shard_for_team(second)
+
+    for team_name, prefix in ((first, "a"), (second, "b")):
+        response = await client.post("/team/add", json={
+            "team_name": team_name,
+            "members": [
+                {"user_id": f"{prefix}{i}", "username": f"{prefix}{i}", "is_active": True}
+                for i in range(3)
+            ]
+        })
+        assert response.status_code == 201
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-sharded", "pull_request_name": "Sharded", "author_id": "a0"
+    })
+    assert response.status_code == 201
+    reviewer = response.json()["pr"]["assigned_reviewers"][0]
+
+    team, pr = await _on_shard(first_shard, first, "pr-sharded")
+    assert team is not None and pr is not None
+    team, pr = await _on_shard(second_shard, first, "pr-sharded")
+    assert team is None and pr is None
+
+    # A user lives on one shard, a PR id is taken on every shard
+    response = await client.post("/team/update", json={"team_name": second, "add": [
+        {"user_id": "a1", "username": "a1", "is_active": True}
+    ]})
+    assert response.status_code == 409
+    assert response.json()["detail"]["error"]["code"] == "CROSS_SHARD_MEMBER"
+    response = await client.post("/pullRequest/create", json={
+        "pull_request_id": "pr-sharded", "pull_request_name": "Again", "author_id": "b0"
+    })
+    assert response.status_code == 409
+
+    response = await client.get("/users/getReview", params={"user_id": reviewer})
+    old_token = response.json()["next_token"]
+
+    result = await shard_service.move_team(first, second_shard, grace=0)
+    assert result["status"] == "MOVED"
+    assert result["users"] == 3 and result["pull_requests"] == 1
+    team, pr = await _on_shard(first_shard, first, "pr-sharded")
+    assert team is None and pr is None
+
+    response = await client.get("/users/getReview", params={"user_id": reviewer})
+    assert [pr["pull_request_id"] for pr in response.json()["pull_requests"]] == ["pr-sharded"]
+    response = await client.get("/users/getReview", params={"user_id": reviewer, "since": old_token})
+    assert response.status_code == 400
+    response = await client.post("/pullRequest/merge", json={"pull_request_id": "pr-sharded"})
+    assert response.json()["pr"]["status"] == "MERGED"
+    response = await client.get("/team/get", params={"team_name": first})
+    assert len(response.json()["members"]) == 3
+
+    # The moved team is off its hash placement: the rebalancer plans to move it back
+    response = await client.post("/admin/rebalanceShards", params={"dry_run": True})
+    assert response.json()["moves"] == [
+        {"team_name": first, "from_shard": second_shard, "to_shard": first_shard, "status": "PLANNED"}
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(SHARD_COUNT == 1, reason="needs SHARD_DATABASE_URLS")
+async def test_sharded_list(client: AsyncClient):
+    """Список PR без фильтра по команде обходит все шарды; курсор различает одинаковые id разных шардов"""
+    names = [f"listed-{i}" for i in range(50)]
+    first = names[0]
+    second = next(name for name in names if shard_for_team(name) != shard_for_team(first))
+    created = set()
+    for team_name, prefix in ((first, "la"), (second, "lb")):
+        await client.post("/team/add", json={
+            "team_name": team_name,
+            "members": [
+                {"user_id": f"{prefix}{i}", "username": f"{prefix}{i}", "is_active": True}
+                for i in range(2)
+            ]
+        })
+        for i in range(3):
+            response = await client.post("/pullRequest/create", json={
+                "pull_request_id": f"{prefix}-pr-{i}", "pull_request_name": "Listed", "author_id": f"{prefix}0"
+            })
+            assert response.status_code == 201
+            created.add(f"{prefix}-pr-{i}")
+
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/pullRequest/list", params=params)
+        assert response.status_code == 200
+        ids += [pr["pull_request_id"] for pr in response.json()["pull_requests"]]
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert len(ids) == len(set(ids))
+    assert created <= set(ids)
+
+    response = await client.get("/pullRequest/list", params={"team_name": second})
+    assert {pr["pull_request_id"] for pr in response.json()["pull_requests"]} == {f"lb-pr-{i}" for i in range(3)}
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(SHARD_COUNT == 1, reason="needs SHARD_DATABASE_URLS")
+async def test_rebalance_keeps_unregistered_teams(client: AsyncClient):
+    """Команда без записи в каталоге не считается остатком переноса: её регистрируют, а не удаляют"""
+    from models.models import Team
+
+    team_name = next(f"legacy-{i}" for i in range(50) if shard_for_team(f"legacy-{i}") != 0)
+    shard = shard_for_team(team_name)
+    async with async_session_maker(shard) as session:
+        session.add(Team(team_name=team_name))
+        await session.commit()
+
+    response = await client.post("/admin/rebalanceShards", params={"dry_run": True})
+    assert {"team_name": team_name, "shard": shard} not in response.json()["purged"]
+    response = await client.post("/admin/rebalanceShards")
+    assert {"team_name": team_name, "shard": shard} not in response.json()["purged"]
+
+    team, _ = await _on_shard(shard, team_name, "-")
+    assert team is not None
+    assert await shard_service.directory.shard_of("team", team_name) == shard
+
+
+def test_shard_ids():
+    assert shard_service.shard_id(12, 0) == 12
+    assert shard_service.split_shard_id(12) == (0, 12)
+    assert shard_service.split_shard_id(-1) is None
+    assert shard_service.split_shard_id(SHARD_COUNT << shard_service.SHARD_ID_BITS) is None
+    if SHARD_COUNT > 1:
+        assert shard_service.split_shard_id(shard_service.shard_id(12, 1)) == (1, 12)
+
+
+def test_events_cursor():
+    from services import events as events_service
+
+    assert events_service.decode_events_cursor("0") == [0] * SHARD_COUNT
+    for token in ("", "x", "-1", "1,", ",".join(["1"] * (SHARD_COUNT + 1))):
+        assert events_service.decode_events_cursor(token) is None
+    seqs = list(range(3, 3 + SHARD_COUNT))
+    assert events_service.decode_events_cursor(str(events_service.encode_events_cursor(seqs))) == seqs
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(SHARD_COUNT == 1, reason="needs SHARD_DATABASE_URLS")
+async def test_sharded_outbox_consumers(client: AsyncClient):
+    """Лента событий, reviewStream, вебхуки и фоновые задачи работают с командами на любом шарде"""
+    from services import users as user_service
+    from services.jobs import job_runner
+
+    names = [f"outbox-{i}" for i in range(50)]
+    first = names[0]
+    second = next(name for name in names if shard_for_team(name) != shard_for_team(first))
+    for team_name, prefix in ((first, "oa"), (second, "ob")):
+        await client.post("/team/add", json={
+            "team_name": team_name,
+            "members": [
+                {"user_id": f"{prefix}{i}", "username": f"{prefix}{i}", "is_active": True}
+                for i in range(3)
+            ]
+        })
+        await client.post("/pullRequest/create", json={
+            "pull_request_id": f"{prefix}-pr", "pull_request_name": "Outbox", "author_id": f"{prefix}0"
+        })
+
+    response = await client.get("/events", params={"after": 0, "timeout": 0, "limit": 500})
+    assert response.status_code == 200
+    body = response.json()
+    assigned = {e["pull_request_id"] for e in body["events"] if e["event_type"] == "ASSIGNED"}
+    assert {"oa-pr", "ob-pr"} <= assigned
+    response = await client.get("/events", params={"after": body["next_after"], "timeout": 0})
+    assert response.json() == {"events": [], "next_after": body["next_after"]}
+    response = await client.get("/events", params={"after": "1", "timeout": 0})
+    assert response.status_code == 400
+
+    # reviewStream resumes from the reviewer's shard
+    reviewer = next(e["user_id"] for e in body["events"] if e["pull_request_id"] == "ob-pr")
+    backlog = await user_service.get_review_events(reviewer, "0", 100)
+    assert [(e["event_type"], e["shard"]) for e in backlog] == [("ASSIGNED", shard_for_team(second))]
+
+    response = await client.post("/webhooks/add", json={"team_name": second, "url": "http://hooks.test/b"})
+    assert response.status_code == 201
+    webhook_id = response.json()["webhook_id"]
+    assert shard_service.split_shard_id(webhook_id)[0] == shard_for_team(second)
+    response = await client.get("/webhooks/list", params={"team_name": second})
+    assert [hook["webhook_id"] for hook in response.json()["webhooks"]] == [webhook_id]
+    response = await client.post("/webhooks/remove", json={"webhook_id": webhook_id})
+    assert response.status_code == 200
+
+    response = await client.post("/team/bulkDeactivateAsync", json={"team_name": second})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    await job_runner.wait_idle()
+    job = (await client.get(f"/jobs/{job_id}")).json()
+    assert job["status"] == "DONE"
+    assert sorted(job["result"]["deactivated_users"]) == ["ob0", "ob1", "ob2"]
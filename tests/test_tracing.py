@@ -0,0 +1,100 @@
+import pytest
+from httpx import AsyncClient
+
+from main import app
+from middleware.tracing import TracingMiddleware
+from services import tracing
+from services.tracing import Tracer, parse_traceparent
+from config import TRACING_ENABLED
+
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class MemoryExporter:
+    def __init__(self):
+        self.spans = []
+
+    async def export(self, spans):
+        self.spans.extend(spans)
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def traced_app(client, monkeypatch):
+    exporter = MemoryExporter()
+    test_tracer = Tracer(0.0, exporter, batch_size=100, queue_size=1000, interval=60)
+    monkeypatch.setattr(tracing, "tracer", test_tracer)
+    tracing.instrument_routes(app, test_tracer)
+    tracing.instrument_services(test_tracer)
+    tracing.instrument_engines()
+    try:
+        yield TracingMiddleware(app, test_tracer), test_tracer, exporter
+    finally:
+        tracing.uninstrument_engines()
+        tracing.uninstrument_services()
+        tracing.uninstrument_routes(app)
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00") == (TRACE_ID, PARENT_ID, False)
+    assert parse_traceparent("00-xyz-1-01") is None
+    assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(TRACING_ENABLED, reason="app is already instrumented with the global tracer")
+async def test_spans_from_route_to_sql(traced_app):
+    """Запрос со sampled traceparent даёт дерево спанов: HTTP → маршрут → сервис → SQL"""
+    traced, test_tracer, exporter = traced_app
+
+    async with AsyncClient(app=traced, base_url="http://test") as client:
+        await client.post("/team/add", json={
+            "team_name": "observability",
+            "members": [
+                {"user_id": user_id, "username": user_id, "is_active": True}
+                for user_id in ("u66", "u67", "u68", "u69")
+            ]
+        })
+        # Not sampled: sample rate is 0 and there is no traceparent
+        assert exporter.spans == []
+
+        await client.post("/pullRequest/create", json={
+            "pull_request_id": "pr-6016", "pull_request_name": "Traced", "author_id": "u66"
+        })
+        response = await client.post(
+            "/pullRequest/reassign",
+            json={"pull_request_id": "pr-6016", "old_user_id": "u67"},
+            headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"}
+        )
+        assert response.headers["x-trace-id"] == TRACE_ID
+
+        # Caller asked not to sample
+        await client.get("/team/get", params={"team_name": "observability"},
+                         headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"})
+
+    await test_tracer.flush()
+    spans = {span.span_id: span for span in exporter.spans}
+    assert {span.trace_id for span in spans.values()} == {TRACE_ID}
+
+    root = next(span for span in spans.values() if span.kind == "server")
+    assert root.parent_id == PARENT_ID
+    assert root.attributes["http.status_code"] == response.status_code
+
+    route = next(span for span in spans.values() if span.name == "route /pullRequest/reassign")
+    assert route.parent_id == root.span_id
+    assert route.attributes["pull_request_id"] == "pr-6016"
+
+    service = next(span for span in spans.values() if span.name == "pull_request.reassign_reviewer")
+    assert service.parent_id == route.span_id
+    assert service.attributes == {"pull_request_id": "pr-6016", "old_user_id": "u67"}
+
+    queries = [span for span in spans.values() if span.name == "db.query"]
+    assert queries
+    assert all(span.kind == "client" and span.attributes["db.statement"] for span in queries)
+    # Every statement hangs off a span of this request
+    assert all(span.parent_id in spans for span in queries)
@@ -0,0 +1,114 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from models.database import async_session_maker, use_shard, shard_for_team
+from models.models import WebhookDelivery
+from services import webhooks as webhook_service
+
+
+class StubReceiver:
+    """Локальный HTTP-сервер, принимающий webhook'и"""
+
+    def __init__(self):
+        self.requests = []
+        self.status_code = 200
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                receiver.requests.append(json.loads(self.rfile.read(length)))
+                self.send_response(receiver.status_code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+async def _setup_team(client: AsyncClient, team_name: str, user_ids):
+    await client.post("/team/add", json={
+        "team_name": team_name,
+        "members": [
+            {"user_id": user_id, "username": user_id, "is_active": True}
+            for user_id in user_ids
+        ]
+    })
+
+
+@pytest.mark.asyncio
+async def test_webhook_batched_delivery(client: AsyncClient):
+    """Webhook получает события назначений своей команды одной пачкой"""
+    dispatcher = webhook_service.WebhookDispatcher()
+    await _setup_team(client, "hooks", ["w1", "w2", "w3"])
+    await _setup_team(client, "other", ["w4", "w5"])
+
+    with StubReceiver() as receiver:
+        response = await client.post("/webhooks/add", json={"team_name": "hooks", "url": receiver.url})
+        assert response.status_code == 201
+        with use_shard(shard_for_team("hooks")):
+            await webhook_service.enqueue_deliveries()
+
+        await client.post("/pullRequest/create", json={
+            "pull_request_id": "pr-5001", "pull_request_name": "Hook", "author_id": "w1"
+        })
+        await client.post("/pullRequest/create", json={
+            "pull_request_id": "pr-5002", "pull_request_name": "Elsewhere", "author_id": "w4"
+        })
+
+        try:
+            assert await dispatcher.run_once() == 2
+        finally:
+            await dispatcher.stop()
+
+    assert len(receiver.requests) == 1
+    events = receiver.requests[0]["events"]
+    assert {(e["event_type"], e["pull_request_id"]) for e in events} == {("ASSIGNED", "pr-5001")}
+    assert len(events) == 2
+
+
+@pytest.mark.asyncio
+async def test_webhook_retry_is_persisted(client: AsyncClient):
+    """Неудачная доставка остаётся в БД с отложенной повторной попыткой"""
+    dispatcher = webhook_service.WebhookDispatcher()
+    await _setup_team(client, "flaky", ["w6", "w7"])
+
+    with StubReceiver() as receiver:
+        receiver.status_code = 503
+        await client.post("/webhooks/add", json={"team_name": "flaky", "url": receiver.url})
+        with use_shard(shard_for_team("flaky")):
+            await webhook_service.enqueue_deliveries()
+        await client.post("/pullRequest/create", json={
+            "pull_request_id": "pr-5003", "pull_request_name": "Retry", "author_id": "w6"
+        })
+
+        try:
+            assert await dispatcher.run_once() == 1
+            # Повтор ещё не наступил
+            assert await dispatcher.run_once() == 0
+        finally:
+            await dispatcher.stop()
+
+    assert len(receiver.requests) == 1
+    async with async_session_maker(shard_for_team("flaky")) as session:
+        delivery = (await session.execute(select(WebhookDelivery))).scalar_one()
+    assert delivery.status == "PENDING"
+    assert delivery.attempts == 1
+    assert delivery.last_error == "HTTP 503"